@@ -3,6 +3,7 @@ import os
 import mimetypes
 from datetime import timedelta
 from flask import Flask, request, send_file, abort
+from werkzeug.security import safe_join
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
 
@@ -40,10 +41,72 @@ def create_app():
     app.config['JWT_TOKEN_LOCATION'] = ['headers']
     app.config['JWT_COOKIE_CSRF_PROTECT'] = False
     app.config['JWT_COOKIE_SECURE'] = False
+    # Caché por proceso de User.token_version (segundos que un token revocado puede seguir valiendo en otro worker)
+    app.config['AUTHZ_VERSION_CACHE_SECONDS'] = int(os.environ.get('AUTHZ_VERSION_CACHE_SECONDS', '30'))
 
     # Stream (si los usas en otros módulos)
     app.config['STREAM_API_KEY'] = os.environ.get('STREAM_API_KEY')
     app.config['STREAM_API_SECRET'] = os.environ.get('STREAM_API_SECRET')
+    app.config['STREAM_TIMEOUT'] = float(os.environ.get('STREAM_TIMEOUT', '6'))
+    app.config['STREAM_POOL_SIZE'] = int(os.environ.get('STREAM_POOL_SIZE', '10'))
+    # Tokens de usuario: expiración opcional (0 = sin exp) y margen con el que se reemiten
+    app.config['STREAM_TOKEN_TTL_SECONDS'] = int(os.environ.get('STREAM_TOKEN_TTL_SECONDS', '0'))
+    app.config['STREAM_TOKEN_REFRESH_SECONDS'] = int(os.environ.get('STREAM_TOKEN_REFRESH_SECONDS', '3600'))
+    # Cola de sync de perfiles (lotes de upsert_users) y cliente en memoria para desarrollo
+    app.config['STREAM_SYNC_INTERVAL_SECONDS'] = float(os.environ.get('STREAM_SYNC_INTERVAL_SECONDS', '1'))
+    app.config['STREAM_SYNC_MAX_ATTEMPTS'] = int(os.environ.get('STREAM_SYNC_MAX_ATTEMPTS', '8'))
+    app.config['STREAM_FAKE'] = os.environ.get('STREAM_FAKE', '').lower() in ('1', 'true', 'yes')
+
+    # Avatares: LRU por proceso user id -> ruta pública
+    app.config['AVATAR_CACHE_SIZE'] = int(os.environ.get('AVATAR_CACHE_SIZE', '10000'))
+    app.config['AVATAR_CACHE_SECONDS'] = int(os.environ.get('AVATAR_CACHE_SECONDS', '300'))
+
+    # Perfiles públicos de abogados: LRU por proceso + almacén compartido (Redis opcional)
+    app.config['CACHE_REDIS_URL'] = os.environ.get('CACHE_REDIS_URL')
+    app.config['LAWYER_CACHE_SIZE'] = int(os.environ.get('LAWYER_CACHE_SIZE', '5000'))
+    app.config['LAWYER_CACHE_SECONDS'] = int(os.environ.get('LAWYER_CACHE_SECONDS', '10'))
+    app.config['LAWYER_CACHE_SHARED_SECONDS'] = int(os.environ.get('LAWYER_CACHE_SHARED_SECONDS', '600'))
+
+    # Argon2: costo y procesos del pool de hashing (0 = en el hilo del request)
+    app.config['ARGON2_TIME_COST'] = int(os.environ.get('ARGON2_TIME_COST', '3'))
+    app.config['ARGON2_MEMORY_COST'] = int(os.environ.get('ARGON2_MEMORY_COST', '65536'))
+    app.config['ARGON2_PARALLELISM'] = int(os.environ.get('ARGON2_PARALLELISM', '4'))
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', str(min(4, os.cpu_count() or 1))))
+
+    # Códigos de un solo uso (HMAC): vigencia, intentos, bloqueo, reenvío y limpieza
+    app.config['OTP_SECRET'] = os.environ.get('OTP_SECRET')  # por defecto JWT_SECRET_KEY
+    app.config['OTP_TTL_MINUTES'] = int(os.environ.get('OTP_TTL_MINUTES', '10'))
+    app.config['OTP_MAX_ATTEMPTS'] = int(os.environ.get('OTP_MAX_ATTEMPTS', '5'))
+    app.config['OTP_LOCKOUT_MINUTES'] = int(os.environ.get('OTP_LOCKOUT_MINUTES', '15'))
+    app.config['OTP_RESEND_COOLDOWN_SECONDS'] = int(os.environ.get('OTP_RESEND_COOLDOWN_SECONDS', '60'))
+    app.config['OTP_PURGE_SECONDS'] = int(os.environ.get('OTP_PURGE_SECONDS', '3600'))
+
+    # Transporte de correo: brevo | smtp | memory
+    app.config['EMAIL_BACKEND'] = os.environ.get('EMAIL_BACKEND', 'brevo')
+    app.config['BREVO_API_KEY'] = os.environ.get('BREVO_API_KEY')
+    app.config['BREVO_API_BASE'] = os.environ.get('BREVO_API_BASE', 'https://api.brevo.com/v3')
+    app.config['EMAIL_SMTP_HOST'] = os.environ.get('EMAIL_SMTP_HOST', 'localhost')
+    app.config['EMAIL_SMTP_PORT'] = int(os.environ.get('EMAIL_SMTP_PORT', '1025'))
+    app.config['EMAIL_TIMEOUT'] = float(os.environ.get('EMAIL_TIMEOUT', '12'))
+    app.config['EMAIL_POOL_SIZE'] = int(os.environ.get('EMAIL_POOL_SIZE', '10'))
+    # Fracción de envíos que dejan una línea DEBUG (si el logger está en DEBUG)
+    app.config['EMAIL_LOG_SAMPLE_RATE'] = float(os.environ.get('EMAIL_LOG_SAMPLE_RATE', '0.01'))
+    # Outbox de correos: frecuencia del worker, tamaño de lote e intentos antes de dead letter
+    app.config['EMAIL_OUTBOX_INTERVAL_SECONDS'] = float(os.environ.get('EMAIL_OUTBOX_INTERVAL_SECONDS', '2'))
+    app.config['EMAIL_OUTBOX_BATCH'] = int(os.environ.get('EMAIL_OUTBOX_BATCH', '500'))
+    app.config['EMAIL_OUTBOX_MAX_ATTEMPTS'] = int(os.environ.get('EMAIL_OUTBOX_MAX_ATTEMPTS', '8'))
+
+    # Reservas: duración de los holds de checkout y frecuencia del barrido
+    app.config['SLOT_HOLD_MINUTES'] = int(os.environ.get('SLOT_HOLD_MINUTES', '5'))
+    app.config['SLOT_HOLD_SWEEP_SECONDS'] = int(os.environ.get('SLOT_HOLD_SWEEP_SECONDS', '30'))
+    # TTL (por proceso) de la expansión de reglas semanales por ventana de fechas
+    app.config['AVAILABILITY_CACHE_SECONDS'] = int(os.environ.get('AVAILABILITY_CACHE_SECONDS', '60'))
+    # Ventana por defecto de GET availability y archivo diario de fechas pasadas
+    app.config['AVAILABILITY_WINDOW_DAYS'] = int(os.environ.get('AVAILABILITY_WINDOW_DAYS', '60'))
+    app.config['AVAILABILITY_ARCHIVE_KEEP_DAYS'] = int(os.environ.get('AVAILABILITY_ARCHIVE_KEEP_DAYS', '30'))
+    app.config['AVAILABILITY_ARCHIVE_SECONDS'] = int(os.environ.get('AVAILABILITY_ARCHIVE_SECONDS', '86400'))
+    # Recalculo periódico de los "próximos horarios" que ya pasaron (la búsqueda solo lee)
+    app.config['NEXT_SLOT_REFRESH_SECONDS'] = int(os.environ.get('NEXT_SLOT_REFRESH_SECONDS', '300'))
 
     # ---------- CORS ----------
     frontend_env = os.environ.get('FRONTEND_URL', '').strip()
@@ -55,8 +118,8 @@ def create_app():
         app,
         resources={r"/api/*": {"origins": cors_origins}},
         supports_credentials=True,
-        allow_headers=["Authorization", "Content-Type"],
-        expose_headers=["Authorization", "Content-Type"],
+        allow_headers=["Authorization", "Content-Type", "If-None-Match"],
+        expose_headers=["Authorization", "Content-Type", "X-Next-Cursor", "ETag"],
         methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
     )
 
@@ -72,23 +135,31 @@ def create_app():
     mimetypes.add_type('image/png',  '.png')
 
     # Servir archivos subidos
-    uploads_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'uploads'))
+    from . import uploads as uploads_store
+    uploads_dir = uploads_store.UPLOAD_DIR
 
     @app.route('/uploads/<path:filename>')
     def uploads(filename):
-        path = os.path.join(uploads_dir, filename)
-        if not os.path.isfile(path):
+        path = safe_join(uploads_dir, filename)
+        if path is None or not os.path.isfile(path):
             abort(404)
         mime, _ = mimetypes.guess_type(path)
-        resp = send_file(path, mimetype=mime or 'application/octet-stream', conditional=True)
+        # Nombres <sha256>.<ext>: contenido inmutable, ETag fuerte = hash
+        digest = uploads_store.content_hash(filename)
+        resp = send_file(path, mimetype=mime or 'application/octet-stream', conditional=True,
+                         etag=digest if digest else True)
         # Evita disposición como adjunto
         resp.headers.pop('Content-Disposition', None)
-        resp.headers['Cache-Control'] = 'public, max-age=3600'
+        resp.headers['Cache-Control'] = (uploads_store.IMMUTABLE_CACHE_CONTROL if digest
+                                         else uploads_store.LEGACY_CACHE_CONTROL)
         return resp
 
     # ---------- Inicializar extensiones ----------
     db.init_app(app)
-    JWTManager(app)
+    jwt = JWTManager(app)
+    # Claims de rol/aprobación versionados (tokens revocados por token_version)
+    from . import authz
+    authz.init_app(app, jwt)
     if migrate is not None:
         migrate.init_app(app, db)
 
@@ -130,4 +201,43 @@ def create_app():
     with app.app_context():
         db.create_all()
 
+    # Columnas/índices nuevos en tablas existentes (create_all no las altera)
+    from . import schema
+    schema.upgrade(app)
+
+    # Índice full-text de abogados (FTS5 / tsvector)
+    from . import search
+    search.init_app(app)
+
+    # Taxonomía de especialidades
+    from . import specialties
+    specialties.init_app(app)
+
+    # Disponibilidad: filas JSON legadas -> availability_slot
+    from . import availability
+    availability.init_app(app)
+
+    # Caché de perfiles públicos de abogados
+    from . import lawyer_cache
+    lawyer_cache.init_app(app)
+
+    # Cliente de Stream compartido (pool keep-alive)
+    from . import stream_client
+    stream_client.init_app(app)
+    from . import stream_sync
+    stream_sync.init_app(app)
+
+    # Hashing de contraseñas (pool de procesos)
+    from . import passwords
+    passwords.init_app(app)
+    # Códigos de verificación (HMAC + límite de intentos)
+    from . import otp
+    otp.init_app(app)
+
+    # Transporte de correo compartido + outbox (worker de envío)
+    from . import emailer
+    emailer.init_app(app)
+    from . import outbox
+    outbox.init_app(app)
+
     return app
\ No newline at end of file
@@ -0,0 +1,33 @@
+# backend/app/argon2_worker.py
+"""
+Funciones que corren dentro del pool de procesos de app/passwords.py.
+
+Solo dependen de argon2: el proceso hijo no necesita la app, la BD ni los
+hilos de fondo. El pool arranca por forkserver/spawn (no fork), así el hijo
+no hereda locks tomados por otros hilos del proceso web.
+"""
+from functools import lru_cache
+
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError, VerifyMismatchError
+
+
+@lru_cache(maxsize=8)
+def _hasher(params):
+    return PasswordHasher(**dict(params))
+
+
+def hash_password(params, password):
+    return _hasher(params).hash(password)
+
+
+def verify_password(params, hash_value, password):
+    """(ok, hash_nuevo | None)."""
+    ph = _hasher(params)
+    try:
+        ph.verify(hash_value, password)
+    except (VerifyMismatchError, VerificationError, InvalidHashError):
+        return False, None
+    if ph.check_needs_rehash(hash_value):
+        return True, ph.hash(password)
+    return True, None
@@ -0,0 +1,160 @@
+# backend/app/authz.py
+"""
+Autorización a partir de los claims del JWT (sin leer la tabla user en cada request).
+
+- access_token_for(user) emite el token con role / active / approved y la
+  versión `tv` (User.token_version).
+- bump_token_version(user) la sube (desactivar, aprobar, rechazar...): los
+  tokens anteriores se rechazan con 401 y el usuario vuelve a iniciar sesión.
+- La versión vigente se lee con una consulta de una columna y se cachea por
+  proceso AUTHZ_VERSION_CACHE_SECONDS; en otros workers un token viejo puede
+  seguir sirviendo hasta que vence esa caché.
+- @authorize("admin", ...) valida el JWT y el rol/estado desde los claims.
+
+Los tokens emitidos antes de este cambio (sin `tv`) siguen siendo válidos
+hasta que expiran; para ellos los datos se leen de la BD.
+"""
+import threading
+import time
+from collections import namedtuple
+from functools import wraps
+
+from flask import current_app, g, jsonify
+from flask_jwt_extended import create_access_token, get_jwt, get_jwt_identity, verify_jwt_in_request
+
+from .models import db, User
+
+Identity = namedtuple("Identity", "id role is_active is_approved")
+
+_lock = threading.Lock()
+_versions = {}  # user_id -> (expira_monotonic, token_version)
+_VERSIONS_MAX = 50000
+
+
+# ==========================
+#  Emisión
+# ==========================
+def claims_for(user) -> dict:
+    return {
+        "role": user.role,
+        "active": bool(user.is_active),
+        "approved": bool(user.is_approved),
+        "tv": int(user.token_version or 0),
+    }
+
+
+def access_token_for(user) -> str:
+    return create_access_token(identity=str(user.id), additional_claims=claims_for(user))
+
+
+def bump_token_version(user):
+    """Invalida los tokens emitidos hasta ahora (sin commit)."""
+    user.token_version = int(user.token_version or 0) + 1
+    forget(user.id)
+
+
+def bump_token_versions(user_ids):
+    """Como bump_token_version, en bloque con un UPDATE (sin commit)."""
+    ids = list(user_ids)
+    if not ids:
+        return
+    User.query.filter(User.id.in_(ids)).update(
+        {"token_version": User.token_version + 1}, synchronize_session=False)
+    for uid in ids:
+        forget(uid)
+
+
+# ==========================
+#  Versión vigente (caché por proceso)
+# ==========================
+def forget(user_id):
+    with _lock:
+        _versions.pop(int(user_id), None)
+
+
+def current_version(user_id: int):
+    """token_version vigente (None si el usuario no existe)."""
+    now = time.monotonic()
+    with _lock:
+        hit = _versions.get(user_id)
+        if hit is not None and hit[0] > now:
+            return hit[1]
+    version = db.session.query(User.token_version).filter(User.id == user_id).scalar()
+    ttl = float(current_app.config.get("AUTHZ_VERSION_CACHE_SECONDS", 30))
+    with _lock:
+        if len(_versions) >= _VERSIONS_MAX:
+            _versions.clear()
+        _versions[user_id] = (now + ttl, version)
+    return version
+
+
+def _is_revoked(jwt_header, jwt_payload) -> bool:
+    if "tv" not in jwt_payload:
+        return False  # token anterior a los claims versionados
+    try:
+        uid = int(jwt_payload.get("sub"))
+    except (TypeError, ValueError):
+        return True
+    version = current_version(uid)
+    return version is None or int(jwt_payload["tv"]) < int(version)
+
+
+def _revoked_response(jwt_header, jwt_payload):
+    return jsonify({"message": "Sesión expirada. Inicia sesión nuevamente.", "code": "TOKEN_REVOKED"}), 401
+
+
+# ==========================
+#  Identidad del request
+# ==========================
+def current_identity():
+    """Identity del token actual (claims; BD solo para tokens sin claims). None si no hay usuario."""
+    if "authz_identity" in g:
+        return g.authz_identity
+    try:
+        uid = int(get_jwt_identity())
+    except (TypeError, ValueError):
+        uid = None
+    ident = None
+    if uid is not None:
+        claims = get_jwt()
+        if "tv" in claims:
+            ident = Identity(uid, claims.get("role"), bool(claims.get("active")), bool(claims.get("approved")))
+        else:
+            row = (db.session.query(User.role, User.is_active, User.is_approved)
+                   .filter(User.id == uid).first())
+            if row is not None:
+                ident = Identity(uid, row.role, bool(row.is_active), bool(row.is_approved))
+    g.authz_identity = ident
+    return ident
+
+
+def has_role(*roles) -> bool:
+    ident = current_identity()
+    return bool(ident and ident.is_active and ident.role in roles)
+
+
+def authorize(*roles, approved=False, deny=None):
+    """
+    Decorador: JWT válido, usuario activo y (si se indican) uno de `roles`.
+    approved=True exige además is_approved. `deny` = (body, status) para
+    conservar la respuesta propia de cada endpoint.
+    """
+    body, status = deny or ({"message": "Acceso no autorizado"}, 403)
+
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            verify_jwt_in_request()
+            ident = current_identity()
+            if (ident is None or not ident.is_active
+                    or (roles and ident.role not in roles)
+                    or (approved and not ident.is_approved)):
+                return jsonify(body), status
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def init_app(app, jwt):
+    jwt.token_in_blocklist_loader(_is_revoked)
+    jwt.revoked_token_loader(_revoked_response)
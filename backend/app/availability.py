@@ -0,0 +1,623 @@
+# backend/app/availability.py
+"""
+Disponibilidad de abogados.
+
+Los horarios son minutos desde medianoche; el formato "9:00 AM" solo existe
+en los bordes (entrada del frontend y respuesta JSON).
+
+Disponibilidad libre de un día D:
+    (reglas semanales(D) - excepciones(D)) ∪ horarios explícitos(D)
+    - reservas confirmadas (el minuto y el siguiente de la grilla)
+    - holds vigentes
+La parte sin reservas se expande bajo demanda y se cachea por ventana de fechas.
+"""
+import os
+import re
+import threading
+import time as _time
+from datetime import datetime, time as dtime, timedelta
+from zoneinfo import ZoneInfo
+
+import click
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+from .background import start_periodic
+from .models import (
+    db, User, Availability, AvailabilitySlot, AvailabilityRule, AvailabilityException,
+    LawyerNextSlot, SlotReservation,
+)
+from .specialties import filter_by_specialty
+
+SLOT_STEP_MIN = 30
+MINUTES_PER_DAY = 24 * 60
+# Hasta dónde se expanden las reglas cuando no se pide una ventana
+RULE_HORIZON_DAYS = 60
+# Ventana máxima aceptada en una consulta (días)
+MAX_WINDOW_DAYS = 366
+
+
+# ==========================
+#  Normalización de horarios
+# ==========================
+_HHMM_AMPM_RE = re.compile(r'^\s*(\d{1,2})(?::(\d{2}))?\s*([ap]m)\s*$', re.IGNORECASE)
+_HHMM_24H_RE = re.compile(r'^\s*(\d{1,2}):(\d{2})(?::\d{2})?\s*$')
+
+
+def parse_time_components(s):
+    if not s:
+        return (0, 0)
+    raw = str(s).strip().lower()
+    m = _HHMM_AMPM_RE.match(raw)
+    if m:
+        hh = int(m.group(1))
+        mi = int(m.group(2) or 0)
+        ap = m.group(3)
+        if ap == 'am':
+            if hh == 12:
+                hh = 0
+        else:
+            if hh < 12:
+                hh += 12
+        return (hh, mi)
+    m = _HHMM_24H_RE.match(raw)
+    if m:
+        return (int(m.group(1)), int(m.group(2)))
+    return (0, 0)
+
+
+def slot_minutes(s) -> int:
+    h, m = parse_time_components(s)
+    return h * 60 + m
+
+
+def minute_label(minute: int) -> str:
+    """540 -> '9:00 AM'; 1440 (fin de regla a medianoche) -> '12:00 AM'."""
+    h24, mi = divmod(int(minute), 60)
+    h24 %= 24
+    ampm = "AM" if h24 < 12 else "PM"
+    h12 = h24 % 12 or 12
+    return f"{h12}:{mi:02d} {ampm}"
+
+
+def canonical_slot_str(s):
+    return minute_label(slot_minutes(s))
+
+
+def parse_time_str(s) -> dtime:
+    h, m = parse_time_components(s)
+    return dtime(h, m)
+
+
+def normalize_minutes(slots):
+    """Lista libre de horarios -> minutos únicos y ordenados."""
+    if not isinstance(slots, list):
+        return []
+    return sorted({slot_minutes(x) for x in slots if x})
+
+
+def normalize_slots_list(slots):
+    return [minute_label(m) for m in normalize_minutes(slots)]
+
+
+def next_slot_minute(minute: int):
+    """Siguiente casilla de la grilla de 30 min (None si no está en la grilla o es la última)."""
+    if minute % SLOT_STEP_MIN or minute + SLOT_STEP_MIN >= MINUTES_PER_DAY:
+        return None
+    return minute + SLOT_STEP_MIN
+
+
+def _tz():
+    name = current_app.config.get("APP_TIMEZONE") or os.environ.get("APP_TIMEZONE", "America/Panama")
+    try:
+        return ZoneInfo(name)
+    except Exception:
+        return ZoneInfo("UTC")
+
+
+def local_now():
+    """(fecha, minuto del día) actuales en la zona horaria de la app."""
+    now = datetime.now(_tz())
+    return now.date(), now.hour * 60 + now.minute
+
+
+def _future_filter(model, today, now_min):
+    return db.or_(model.date > today, db.and_(model.date == today, model.minute > now_min))
+
+
+# ==========================
+#  Reglas semanales
+# ==========================
+def _rule_minutes(rule, day):
+    """Minutos que la regla aporta en `day` (vacío si no aplica)."""
+    if rule.weekday != day.weekday():
+        return ()
+    if rule.valid_from and day < rule.valid_from:
+        return ()
+    if rule.valid_until and day > rule.valid_until:
+        return ()
+    first = -(-rule.start_minute // SLOT_STEP_MIN) * SLOT_STEP_MIN  # redondeo hacia arriba a la grilla
+    return range(first, rule.end_minute, SLOT_STEP_MIN)
+
+
+def _days(start, end):
+    d = start
+    while d <= end:
+        yield d
+        d += timedelta(days=1)
+
+
+def get_rules(lawyer_id: int):
+    return (AvailabilityRule.query.filter_by(lawyer_id=lawyer_id)
+            .order_by(AvailabilityRule.weekday, AvailabilityRule.start_minute).all())
+
+
+def set_rules(lawyer_id: int, rules):
+    """Reemplaza las reglas semanales. rules: [{weekday, start_minute, end_minute, valid_from?, valid_until?}]. No hace commit."""
+    AvailabilityRule.query.filter_by(lawyer_id=lawyer_id).delete(synchronize_session=False)
+    db.session.add_all([AvailabilityRule(lawyer_id=lawyer_id, **r) for r in rules])
+    invalidate(lawyer_id)
+
+
+# ==========================
+#  Expansión (cacheada) sin reservas
+# ==========================
+_cache_lock = threading.Lock()
+_cache = {}  # (lawyer_id, start, end) -> (expira_monotonic, {date: frozenset(minutes)})
+_CACHE_MAX_ENTRIES = 5000
+
+
+def _cache_ttl():
+    return float(current_app.config.get("AVAILABILITY_CACHE_SECONDS", 60))
+
+
+def invalidate(lawyer_id: int):
+    """Descarta las expansiones cacheadas del abogado (en este proceso)."""
+    with _cache_lock:
+        for key in [k for k in _cache if k[0] == lawyer_id]:
+            _cache.pop(key, None)
+
+
+def _window_days():
+    return int(current_app.config.get("AVAILABILITY_WINDOW_DAYS", RULE_HORIZON_DAYS))
+
+
+def _default_window(start, end):
+    """Completa la ventana: desde hoy (o `start`) y AVAILABILITY_WINDOW_DAYS hacia adelante."""
+    today, _ = local_now()
+    start = start or today
+    end = end or (start + timedelta(days=_window_days()))
+    return start, end
+
+
+def parse_window(from_str=None, to_str=None):
+    """
+    'YYYY-MM-DD' opcionales -> (start, end) acotados.
+    ValueError si el formato es inválido, to < from o la ventana supera MAX_WINDOW_DAYS.
+    """
+    start = datetime.strptime(from_str, '%Y-%m-%d').date() if from_str else None
+    end = datetime.strptime(to_str, '%Y-%m-%d').date() if to_str else None
+    if start is None and end is not None:
+        start = min(local_now()[0], end)
+    start, end = _default_window(start, end)
+    if end < start:
+        raise ValueError("'to' es anterior a 'from'")
+    if (end - start).days > MAX_WINDOW_DAYS:
+        raise ValueError(f"la ventana no puede superar {MAX_WINDOW_DAYS} días")
+    return start, end
+
+
+def _expand(lawyer_ids, start, end):
+    """{lawyer_id: {date: set(minutes)}} para la ventana [start, end], en 3 consultas para todos."""
+    out = {lid: {} for lid in lawyer_ids}
+    if not lawyer_ids:
+        return out
+
+    rules = AvailabilityRule.query.filter(AvailabilityRule.lawyer_id.in_(lawyer_ids)).all()
+    for rule in rules:
+        per_day = out[rule.lawyer_id]
+        for d in _days(start, end):
+            mins = _rule_minutes(rule, d)
+            if mins:
+                per_day.setdefault(d, set()).update(mins)
+
+    exceptions = (db.session.query(AvailabilityException.lawyer_id, AvailabilityException.date,
+                                   AvailabilityException.minute)
+                  .filter(AvailabilityException.lawyer_id.in_(lawyer_ids),
+                          AvailabilityException.date.between(start, end))
+                  .all())
+    for lid, d, minute in exceptions:
+        out[lid].get(d, set()).discard(minute)
+
+    explicit = (db.session.query(AvailabilitySlot.lawyer_id, AvailabilitySlot.date, AvailabilitySlot.minute)
+                .filter(AvailabilitySlot.lawyer_id.in_(lawyer_ids),
+                        AvailabilitySlot.date.between(start, end))
+                .all())
+    for lid, d, minute in explicit:
+        out[lid].setdefault(d, set()).add(minute)
+    return out
+
+
+def base_availability(lawyer_ids, start, end):
+    """Expansión sin reservas, servida desde caché cuando es posible."""
+    now = _time.monotonic()
+    result, missing = {}, []
+    with _cache_lock:
+        for lid in lawyer_ids:
+            hit = _cache.get((lid, start, end))
+            if hit and hit[0] > now:
+                result[lid] = hit[1]
+            else:
+                missing.append(lid)
+    if missing:
+        fresh = _expand(missing, start, end)
+        expires = now + _cache_ttl()
+        with _cache_lock:
+            if len(_cache) > _CACHE_MAX_ENTRIES:
+                for key in [k for k, v in _cache.items() if v[0] <= now] or list(_cache):
+                    _cache.pop(key, None)
+            for lid, per_day in fresh.items():
+                frozen = {d: frozenset(m) for d, m in per_day.items() if m}
+                _cache[(lid, start, end)] = (expires, frozen)
+                result[lid] = frozen
+    return result
+
+
+def _reserved(lawyer_ids, start, end):
+    """{lawyer_id: {date: set(minutes)}} ocupados por reservas confirmadas y holds vigentes."""
+    out = {lid: {} for lid in lawyer_ids}
+    if not lawyer_ids:
+        return out
+    now = datetime.utcnow()
+    q = (db.session.query(SlotReservation.lawyer_id, SlotReservation.date, SlotReservation.minute,
+                          SlotReservation.start_minute, SlotReservation.expires_at)
+         .filter(SlotReservation.lawyer_id.in_(lawyer_ids),
+                 SlotReservation.date.between(start, end),
+                 db.or_(SlotReservation.expires_at.is_(None), SlotReservation.expires_at > now)))
+    for lid, d, minute, start_minute, expires_at in q.all():
+        taken = out[lid].setdefault(d, set())
+        taken.add(minute)
+        if expires_at is None and start_minute is None:
+            # Reserva anterior a las filas por casilla: bloquea también el siguiente horario
+            nxt = next_slot_minute(minute)
+            if nxt is not None:
+                taken.add(nxt)
+    return out
+
+
+def free_slots(lawyer_ids, start=None, end=None):
+    """{lawyer_id: {date: [minutes]}} libres en la ventana (por defecto hoy .. +AVAILABILITY_WINDOW_DAYS)."""
+    start, end = _default_window(start, end)
+    lawyer_ids = list(lawyer_ids)
+    base = base_availability(lawyer_ids, start, end)
+    reserved = _reserved(lawyer_ids, start, end)
+    out = {}
+    for lid in lawyer_ids:
+        per_day = {}
+        for d, minutes in base.get(lid, {}).items():
+            free = minutes - reserved[lid].get(d, set())
+            if free:
+                per_day[d] = sorted(free)
+        out[lid] = per_day
+    return out
+
+
+def is_offered(lawyer_id: int, day, minute: int) -> bool:
+    """
+    ¿El abogado ofrece ese horario (reglas + fechas explícitas)? Lee la BD, no
+    la caché por proceso: la usan las escrituras (reservas y holds), que no
+    pueden fiarse de una expansión que otro worker ya cambió.
+    """
+    return minute in _expand([lawyer_id], day, day)[lawyer_id].get(day, ())
+
+
+# ==========================
+#  Lectura / escritura por fecha
+# ==========================
+def get_slots_map(lawyer_id: int, start=None, end=None):
+    """
+    { 'YYYY-MM-DD': ['9:00 AM', ...] } con los horarios libres de la ventana
+    (por defecto hoy .. +AVAILABILITY_WINDOW_DAYS), así el tamaño no crece con la antigüedad.
+    """
+    start, end = _default_window(start, end)
+    per_day = free_slots([lawyer_id], start, end)[lawyer_id]
+    return {
+        d.strftime('%Y-%m-%d'): [minute_label(m) for m in minutes]
+        for d, minutes in sorted(per_day.items())
+    }
+
+
+def set_day_slots(lawyer_id: int, day, slots):
+    """
+    Deja `slots` como la disponibilidad del día. Lo que ya cubren las reglas
+    semanales no se duplica; lo que las reglas ofrecen y no está en `slots`
+    se guarda como excepción. No hace commit.
+    """
+    minutes = normalize_minutes(slots)
+    wanted = set(minutes)
+    from_rules = set()
+    for rule in AvailabilityRule.query.filter_by(lawyer_id=lawyer_id, weekday=day.weekday()).all():
+        from_rules.update(_rule_minutes(rule, day))
+
+    AvailabilitySlot.query.filter_by(lawyer_id=lawyer_id, date=day).delete(synchronize_session=False)
+    AvailabilityException.query.filter_by(lawyer_id=lawyer_id, date=day).delete(synchronize_session=False)
+    db.session.add_all([AvailabilitySlot(lawyer_id=lawyer_id, date=day, minute=m)
+                        for m in sorted(wanted - from_rules)])
+    db.session.add_all([AvailabilityException(lawyer_id=lawyer_id, date=day, minute=m)
+                        for m in sorted(from_rules - wanted)])
+    invalidate(lawyer_id)
+    return minutes
+
+
+# ==========================
+#  Reservas y holds
+# ==========================
+def occupied_minutes(minute: int):
+    """Casillas que ocupa una reunión que empieza en `minute`: la suya y la siguiente de la grilla."""
+    nxt = next_slot_minute(minute)
+    return [minute] if nxt is None else [minute, nxt]
+
+
+def _claim_minute(lawyer_id, day, minute, start, client_id, expires_at, now):
+    """Reclama una casilla. None si la tiene otra reserva; IntegrityError si otro worker la ganó."""
+    existing = SlotReservation.query.filter_by(lawyer_id=lawyer_id, date=day, minute=minute).first()
+    if existing is not None and existing.is_expired(now):
+        SlotReservation.query.filter(
+            SlotReservation.id == existing.id,
+            SlotReservation.expires_at <= now,
+        ).delete(synchronize_session=False)
+        db.session.expunge(existing)
+        existing = None
+    if existing is not None:
+        own_start = existing.start_minute if existing.start_minute is not None else existing.minute
+        if existing.is_hold and existing.client_id == client_id and own_start == start:
+            existing.start_minute = start
+            existing.expires_at = expires_at
+            return existing
+        return None
+    row = SlotReservation(
+        lawyer_id=lawyer_id, date=day, minute=minute, start_minute=start,
+        client_id=client_id, expires_at=expires_at,
+    )
+    db.session.add(row)
+    db.session.flush()
+    return row
+
+
+def _legacy_overlap(lawyer_id: int, day, minute: int) -> bool:
+    """¿Una reserva anterior a las filas por casilla (solo fila de inicio) ocupa `minute` como siguiente?"""
+    prev = minute - SLOT_STEP_MIN
+    if prev < 0 or next_slot_minute(prev) != minute:
+        return False
+    return db.session.query(SlotReservation.id).filter(
+        SlotReservation.lawyer_id == lawyer_id,
+        SlotReservation.date == day,
+        SlotReservation.minute == prev,
+        SlotReservation.start_minute.is_(None),
+        SlotReservation.expires_at.is_(None),
+    ).first() is not None
+
+
+def claim_slot(lawyer_id: int, day, minute: int, client_id: int, hold_minutes=None):
+    """
+    Reclama en slot_reservation cada casilla que ocupa una reunión que empieza
+    en `minute` (ver occupied_minutes), así la restricción única impide también
+    los solapes entre workers (9:00 y 9:30). No hace commit.
+    Debe ir al inicio de la transacción: ante un choque de la restricción única
+    hace rollback completo y reintenta.
+    - hold_minutes: crea un hold que expira; None: reserva definitiva.
+    - Un hold vigente del mismo cliente se reutiliza (y se confirma o extiende).
+    - Un hold vencido de otro cliente se libera y se reintenta.
+    Devuelve las filas reclamadas (la del minuto de inicio primero) o None si
+    el horario ya está tomado; en ese caso el llamador hace rollback.
+    """
+    now = datetime.utcnow()
+    expires_at = now + timedelta(minutes=hold_minutes) if hold_minutes else None
+    for _ in range(3):
+        try:
+            rows = []
+            for m in occupied_minutes(minute):
+                row = _claim_minute(lawyer_id, day, m, minute, client_id, expires_at, now)
+                if row is None:
+                    return None
+                rows.append(row)
+        except IntegrityError:
+            db.session.rollback()
+            continue
+        if _legacy_overlap(lawyer_id, day, minute):
+            return None
+        return rows
+    return None
+
+
+def release_hold(hold_id: int, client_id: int) -> int:
+    """Borra el hold del cliente con todas sus casillas. No hace commit. Devuelve las filas borradas."""
+    hold = SlotReservation.query.filter(
+        SlotReservation.id == hold_id,
+        SlotReservation.client_id == client_id,
+        SlotReservation.expires_at.isnot(None),
+    ).first()
+    if hold is None:
+        return 0
+    start = hold.start_minute if hold.start_minute is not None else hold.minute
+    return SlotReservation.query.filter(
+        SlotReservation.lawyer_id == hold.lawyer_id,
+        SlotReservation.date == hold.date,
+        SlotReservation.client_id == client_id,
+        SlotReservation.expires_at.isnot(None),
+        db.or_(SlotReservation.id == hold.id, SlotReservation.start_minute == start),
+    ).delete(synchronize_session=False)
+
+
+def release_expired_holds() -> int:
+    """Borra en bloque los holds vencidos. Hace commit."""
+    n = SlotReservation.query.filter(
+        SlotReservation.expires_at.isnot(None),
+        SlotReservation.expires_at <= datetime.utcnow(),
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return n
+
+
+# ==========================
+#  Próximo horario libre
+# ==========================
+def _first_future(per_day, today, now_min):
+    for d in sorted(per_day):
+        for minute in per_day[d]:
+            if d > today or minute > now_min:
+                return d, minute
+    return None
+
+
+def refresh_next_slot(lawyer_id: int):
+    """Recalcula LawyerNextSlot (dentro de la ventana por defecto). No hace commit."""
+    today, now_min = local_now()
+    first = _first_future(free_slots([lawyer_id])[lawyer_id], today, now_min)
+    row = db.session.get(LawyerNextSlot, lawyer_id)
+    if first is None:
+        if row is not None:
+            db.session.delete(row)
+        return None
+    if row is None:
+        row = LawyerNextSlot(lawyer_id=lawyer_id)
+        db.session.add(row)
+    row.date, row.minute = first
+    return row
+
+
+def refresh_stale_next_slots():
+    """Recalcula los próximos horarios que ya quedaron en el pasado. Hace commit si cambió algo."""
+    today, now_min = local_now()
+    stale = [lid for (lid,) in db.session.query(LawyerNextSlot.lawyer_id)
+             .filter(db.not_(_future_filter(LawyerNextSlot, today, now_min))).all()]
+    for lid in stale:
+        refresh_next_slot(lid)
+    if stale:
+        db.session.commit()
+    return len(stale)
+
+
+# ==========================
+#  Búsqueda entre abogados
+# ==========================
+def _lawyer_filters(query, especialidad, min_price, max_price):
+    query = query.filter(
+        User.role == 'abogado',
+        User.is_approved.is_(True),
+        User.is_active.is_(True),
+    )
+    if especialidad:
+        query = filter_by_specialty(query, especialidad)
+    if min_price is not None:
+        query = query.filter(User.consultation_price >= min_price)
+    if max_price is not None:
+        query = query.filter(User.consultation_price <= max_price)
+    return query
+
+
+def search_free_lawyers(especialidad=None, day=None, from_min=None, to_min=None,
+                        min_price=None, max_price=None, limit=20):
+    """
+    Abogados aprobados con un horario libre, ordenados por el horario más próximo.
+    Devuelve [(User, date, minute)].
+
+    - Con `day`: candidatos por índice (horarios explícitos del día o reglas del
+      weekday que cruzan [from_min, to_min]) y expansión en lote de esos abogados.
+    - Sin `day`: próximo horario libre precalculado (LawyerNextSlot). Solo lectura:
+      los que ya pasaron se omiten hasta que la tarea periódica los recalcula.
+    """
+    today, now_min = local_now()
+    if day is None:
+        query = (db.session.query(User, LawyerNextSlot.date, LawyerNextSlot.minute)
+                 .join(LawyerNextSlot, LawyerNextSlot.lawyer_id == User.id)
+                 .filter(_future_filter(LawyerNextSlot, today, now_min)))
+        query = _lawyer_filters(query, especialidad, min_price, max_price)
+        rows = query.order_by(LawyerNextSlot.date, LawyerNextSlot.minute,
+                              db.func.coalesce(User.consultation_price, 0.0), User.id).limit(limit).all()
+        return [tuple(r) for r in rows]
+
+    lo = 0 if from_min is None else from_min
+    hi = MINUTES_PER_DAY - 1 if to_min is None else to_min
+    explicit_ids = db.session.query(AvailabilitySlot.lawyer_id).filter(
+        AvailabilitySlot.date == day, AvailabilitySlot.minute.between(lo, hi))
+    rule_ids = db.session.query(AvailabilityRule.lawyer_id).filter(
+        AvailabilityRule.weekday == day.weekday(),
+        AvailabilityRule.start_minute <= hi,
+        AvailabilityRule.end_minute > lo)
+    query = db.session.query(User).filter(db.or_(User.id.in_(explicit_ids), User.id.in_(rule_ids)))
+    candidates = {u.id: u for u in _lawyer_filters(query, especialidad, min_price, max_price).all()}
+
+    found = []
+    for lid, per_day in free_slots(candidates.keys(), day, day).items():
+        for minute in per_day.get(day, ()):
+            if lo <= minute <= hi and (day > today or minute > now_min):
+                found.append((candidates[lid], day, minute))
+                break
+    found.sort(key=lambda r: (r[2], r[0].consultation_price or 0.0, r[0].id))
+    return found[:limit]
+
+
+# ==========================
+#  Archivo de fechas pasadas
+# ==========================
+def archive_past(keep_days=None) -> int:
+    """
+    Compacta la disponibilidad anterior a hoy - keep_days: borra horarios explícitos,
+    excepciones, reservas de fechas pasadas y reglas ya vencidas. Las reuniones
+    (Meeting) no se tocan. Hace commit. Devuelve el número de filas borradas.
+    """
+    if keep_days is None:
+        keep_days = int(current_app.config.get("AVAILABILITY_ARCHIVE_KEEP_DAYS", 30))
+    today, _ = local_now()
+    cutoff = today - timedelta(days=max(0, keep_days))
+    n = 0
+    for model in (AvailabilitySlot, AvailabilityException, SlotReservation):
+        n += model.query.filter(model.date < cutoff).delete(synchronize_session=False)
+    n += AvailabilityRule.query.filter(
+        AvailabilityRule.valid_until.isnot(None),
+        AvailabilityRule.valid_until < cutoff,
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    if n:
+        with _cache_lock:
+            _cache.clear()
+    return n
+
+
+def migrate_legacy(app):
+    """Pasa las filas JSON de Availability a AvailabilitySlot (una sola vez)."""
+    with app.app_context():
+        legacy = Availability.query.all()
+        if not legacy:
+            return
+        for row in legacy:
+            set_day_slots(row.lawyer_id, row.date, row.time_slots or [])
+            db.session.delete(row)
+        db.session.commit()
+        app.logger.info("[availability] migradas %d filas legadas a availability_slot", len(legacy))
+
+
+def init_app(app):
+    migrate_legacy(app)
+    with app.app_context():
+        # Backfill de LawyerNextSlot si la tabla está vacía
+        if LawyerNextSlot.query.first() is None:
+            lawyer_ids = {lid for (lid,) in db.session.query(AvailabilitySlot.lawyer_id).distinct()}
+            lawyer_ids |= {lid for (lid,) in db.session.query(AvailabilityRule.lawyer_id).distinct()}
+            for lid in lawyer_ids:
+                refresh_next_slot(lid)
+            db.session.commit()
+        else:
+            refresh_stale_next_slots()
+
+    start_periodic(app, "release-expired-holds", app.config.get("SLOT_HOLD_SWEEP_SECONDS"), release_expired_holds)
+    start_periodic(app, "archive-past-availability", app.config.get("AVAILABILITY_ARCHIVE_SECONDS"), archive_past)
+    start_periodic(app, "refresh-next-slots", app.config.get("NEXT_SLOT_REFRESH_SECONDS"), refresh_stale_next_slots)
+
+    @app.cli.command("availability-archive")
+    @click.option("--keep-days", type=int, default=None, help="Días pasados que se conservan.")
+    def availability_archive_command(keep_days):
+        """Compacta la disponibilidad de fechas pasadas."""
+        n = archive_past(keep_days)
+        click.echo(f"Filas archivadas: {n}")
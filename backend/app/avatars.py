@@ -0,0 +1,88 @@
+# backend/app/avatars.py
+"""
+Resolución de avatares: user id -> ruta pública ('/uploads/x.webp' o URL absoluta).
+
+La fuente de verdad es User.profile_picture_url (no se mira el disco). Se
+cachea por proceso en un LRU con TTL (AVATAR_CACHE_SIZE, AVATAR_CACHE_SECONDS);
+los endpoints de subida llaman a invalidate() tras el commit.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+from .models import db, User
+
+_lock = threading.Lock()
+_cache = OrderedDict()  # user_id -> (expira_monotonic, ruta | None)
+_MISSING = object()
+
+
+def public_path(value):
+    """Valor de profile_picture_url -> '/uploads/<archivo>' (o la URL absoluta tal cual)."""
+    if not value:
+        return None
+    val = str(value)
+    if val.startswith("http://") or val.startswith("https://"):
+        return val
+    val = val.lstrip("/")
+    if val.startswith("uploads/"):
+        return "/" + val
+    return f"/uploads/{val}"
+
+
+def _get_cached(user_id):
+    now = time.monotonic()
+    with _lock:
+        hit = _cache.get(user_id)
+        if hit is None:
+            return _MISSING
+        if hit[0] <= now:
+            _cache.pop(user_id, None)
+            return _MISSING
+        _cache.move_to_end(user_id)
+        return hit[1]
+
+
+def _store(user_id, path):
+    size = int(current_app.config.get("AVATAR_CACHE_SIZE", 10000))
+    ttl = float(current_app.config.get("AVATAR_CACHE_SECONDS", 300))
+    with _lock:
+        _cache[user_id] = (time.monotonic() + ttl, path)
+        _cache.move_to_end(user_id)
+        while len(_cache) > size:
+            _cache.popitem(last=False)
+
+
+def resolve(user_id, user=None):
+    """
+    Ruta pública del avatar (o None). Si se pasa `user` ya cargado, su fila
+    manda (no hay consulta) y refresca la caché; si no, se usa la caché.
+    """
+    user_id = int(user_id)
+    if user is not None:
+        path = public_path(user.profile_picture_url)
+        if _get_cached(user_id) != path:
+            _store(user_id, path)
+        return path
+    path = _get_cached(user_id)
+    if path is not _MISSING:
+        return path
+    value = db.session.query(User.profile_picture_url).filter(User.id == user_id).scalar()
+    path = public_path(value)
+    _store(user_id, path)
+    return path
+
+
+def absolute_url(user_id, host_url, user=None):
+    """Como resolve(), pero con host para rutas locales (Stream necesita URL absoluta)."""
+    path = resolve(user_id, user=user)
+    if not path or path.startswith("http"):
+        return path
+    return f"{host_url.rstrip('/')}{path}"
+
+
+def invalidate(user_id):
+    with _lock:
+        _cache.pop(int(user_id), None)
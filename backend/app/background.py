@@ -0,0 +1,52 @@
+# backend/app/background.py
+"""
+Tareas periódicas en hilos daemon (uno por tarea y por proceso).
+
+Cada tarea corre dentro de un app context. Con varios workers de gunicorn
+cada proceso tiene su propio hilo, así que las tareas deben ser idempotentes
+(ej. DELETE ... WHERE expires_at < now).
+"""
+import threading
+
+from .models import db
+
+EXT_KEY = "background_tasks"
+
+
+class PeriodicTask(threading.Thread):
+    def __init__(self, app, name, interval, fn):
+        super().__init__(name=f"abogapp-{name}", daemon=True)
+        self.app = app
+        self.interval = float(interval)
+        self.fn = fn
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.run_once()
+
+    def run_once(self):
+        with self.app.app_context():
+            try:
+                self.fn()
+            except Exception as e:
+                db.session.rollback()
+                self.app.logger.exception("[background] %s falló: %s", self.name, e)
+            finally:
+                db.session.remove()
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def start_periodic(app, name, interval, fn):
+    """Registra y arranca una tarea periódica (no hace nada si interval <= 0 o BACKGROUND_TASKS=False)."""
+    if not interval or interval <= 0 or not app.config.get("BACKGROUND_TASKS", True):
+        return None
+    tasks = app.extensions.setdefault(EXT_KEY, {})
+    if name in tasks:
+        return tasks[name]
+    task = PeriodicTask(app, name, interval, fn)
+    tasks[name] = task
+    task.start()
+    return task
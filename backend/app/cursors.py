@@ -0,0 +1,37 @@
+# backend/app/cursors.py
+"""
+Cursores de paginación keyset: "<clave>_<id>".
+
+La clave es el valor de la columna de orden de la última fila (fecha,
+datetime o número) y el id desempata. Se usa rpartition, así que la clave
+puede contener '_' pero el id no.
+"""
+from datetime import date, datetime
+
+
+def encode(key, row_id) -> str:
+    if isinstance(key, (date, datetime)):
+        key = key.isoformat()
+    elif isinstance(key, float):
+        key = repr(key)
+    return f"{key}_{int(row_id)}"
+
+
+def decode(value, parse_key):
+    """(parse_key(clave), id). ValueError si el cursor no tiene ese formato."""
+    key, sep, row_id = str(value).rpartition("_")
+    if not sep:
+        raise ValueError(value)
+    return parse_key(key), int(row_id)
+
+
+def decode_datetime(value):
+    return decode(value, datetime.fromisoformat)
+
+
+def decode_date(value):
+    return decode(value, date.fromisoformat)
+
+
+def decode_float(value):
+    return decode(value, float)
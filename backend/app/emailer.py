@@ -1,14 +1,47 @@
 # backend/app/emailer.py
+"""
+Transporte único de correo.
+
+Todos los envíos (outbox, admin, pruebas) pasan por aquí. El backend se
+elige con EMAIL_BACKEND:
+    brevo   API HTTP de Brevo con una requests.Session keep-alive (por defecto)
+    smtp    SMTP local sin TLS (ej. MailHog / `python -m smtpd` en localhost:1025)
+    memory  guarda los mensajes en una lista (desarrollo / pruebas)
+
+Los mensajes usan el formato de Brevo (/v3/smtp/email): sender, to, subject,
+htmlContent, textContent, templateId, params, tags y messageVersions (envío
+en bloque: un mismo template con to/params por destinatario, hasta
+BULK_MAX_VERSIONS por llamada).
+
+Las plantillas propias (códigos de verificación, avisos) se compilan una vez
+con Jinja y se cachean; render() solo las evalúa.
+
+Telemetría: cada envío suma contadores e histogramas (latencia, bytes,
+status HTTP) en app/metrics.py, visibles en GET /api/admin/metrics. Los
+payloads no se loguean; en DEBUG se registra una muestra
+(EMAIL_LOG_SAMPLE_RATE) de una línea sin cuerpo. Los errores siempre van al log.
+"""
 import os
 import json
-import requests
+import logging
+import random
+import smtplib
+import threading
+import time
+from email.message import EmailMessage
+from functools import lru_cache
 from typing import Optional, Dict, Any
-from flask import current_app
+
+import click
+import requests
+from flask import current_app, has_app_context
+from jinja2 import Environment
+
+from . import metrics
 
 # --- Config ---
 BREVO_API_KEY = os.environ.get("BREVO_API_KEY")
-BREVO_API_URL_SEND = "https://api.brevo.com/v3/smtp/email"
-BREVO_API_URL_ACCOUNT = "https://api.brevo.com/v3/account"
+BREVO_API_BASE = os.environ.get("BREVO_API_BASE", "https://api.brevo.com/v3")
 
 SENDER = {
     "name": os.environ.get("APP_NAME", "AbogApp"),
@@ -18,6 +51,10 @@ SENDER = {
 TMPL_APPROVED = int(os.environ.get("BREVO_TMPL_LAWYER_APPROVED", "0") or 0)
 TMPL_REJECTED = int(os.environ.get("BREVO_TMPL_LAWYER_REJECTED", "0") or 0)
 
+EXT_KEY = "email_transport"
+# Límite de messageVersions de Brevo por request
+BULK_MAX_VERSIONS = 1000
+
 
 # --- Utils de logging/seguridad ---
 def _log(level: str, msg: str, *args):
@@ -29,6 +66,18 @@ def _log(level: str, msg: str, *args):
         pass
 
 
+def _should_log_debug() -> bool:
+    """DEBUG habilitado y dentro de la muestra EMAIL_LOG_SAMPLE_RATE (0..1)."""
+    try:
+        logger = current_app.logger
+        if not logger.isEnabledFor(logging.DEBUG):
+            return False
+        rate = float(current_app.config.get("EMAIL_LOG_SAMPLE_RATE", 0.01))
+    except Exception:
+        return False
+    return rate >= 1 or random.random() < rate
+
+
 def _mask(s: Optional[str], visible: int = 4) -> str:
     if not s:
         return ""
@@ -37,60 +86,253 @@ def _mask(s: Optional[str], visible: int = 4) -> str:
     return s[:visible] + "…" + "*" * (len(s) - visible)
 
 
-# --- HTTP helpers ---
-def _headers_json() -> Dict[str, str]:
-    if not BREVO_API_KEY:
-        raise RuntimeError("BREVO_API_KEY no configurada")
-    return {
-        "accept": "application/json",
-        "content-type": "application/json",
-        "api-key": BREVO_API_KEY,
-    }
+# --- Plantillas propias ---
+_jinja = Environment(autoescape=True)
+_jinja_text = Environment(autoescape=False)  # texto plano: sin escape HTML
 
+TEMPLATES = {
+    "verify_email": {
+        "subject": "Verifica tu correo",
+        "html": """
+        <h2>Verificación de correo - AbogApp</h2>
+        <p>Hola {{ nombres }} {{ apellidos }},</p>
+        <p>Usa este código para verificar tu correo:</p>
+        <p style="font-size:24px;font-weight:bold;letter-spacing:3px">{{ code }}</p>
+        <p>El código expira en {{ ttl_minutes }} minutos.</p>
+        """,
+    },
+    "verify_email_resend": {
+        "subject": "Nuevo código de verificación",
+        "html": """
+        <h2>Tu nuevo código</h2>
+        <p>Usa este código para verificar tu correo:</p>
+        <p style="font-size:24px;font-weight:bold;letter-spacing:3px">{{ code }}</p>
+        <p>El código expira en {{ ttl_minutes }} minutos.</p>
+        """,
+    },
+    "client_verified": {
+        "subject": "Tu cliente acaba de verificar su correo ✅",
+        "text": (
+            "Hola {{ abogado or 'abogado' }},\n\n"
+            "El cliente {{ nombres }} {{ apellidos }} ({{ email }}) "
+            "acaba de verificar su correo en AbogApp.\n\n"
+            "Ya puedes continuar con la coordinación de su caso o agendar la reunión.\n\n"
+            "— AbogApp"
+        ),
+        "html": """
+        <p>Hola {{ abogado or 'abogado' }},</p>
+        <p>El cliente <strong>{{ nombres }} {{ apellidos }}</strong> ({{ email }})
+        acaba de verificar su correo en <strong>AbogApp</strong>.</p>
+        <p>Ya puedes continuar con la coordinación de su caso o agendar la reunión.</p>
+        <p>— AbogApp</p>
+        """,
+    },
+}
 
-def _post(url: str, payload: Dict[str, Any], timeout: int = 12) -> Dict[str, Any]:
-    _log("info", "Brevo POST %s payload=%s", url, json.dumps(payload, ensure_ascii=False))
-    try:
-        r = requests.post(url, json=payload, headers=_headers_json(), timeout=timeout)
-    except Exception as e:
-        _log("exception", "Brevo request error: %s", e)
-        raise
 
-    if not r.ok:
-        _log("error", "Brevo HTTP %s :: %s", r.status_code, r.text)
-        r.raise_for_status()
+@lru_cache(maxsize=None)
+def _compiled(name: str, part: str):
+    source = TEMPLATES[name].get(part)
+    if source is None:
+        return None
+    return (_jinja_text if part == "text" else _jinja).from_string(source)
 
-    try:
-        data = r.json()
-    except Exception:
-        data = {"ok": True, "raw": r.text}
 
-    _log("info", "Brevo OK resp=%s", json.dumps(data, ensure_ascii=False))
-    return data
+def render(name: str, **ctx) -> Dict[str, Optional[str]]:
+    """{'subject', 'html', 'text'} de una plantilla propia (compilada una sola vez)."""
+    out = {}
+    for part in ("subject", "html", "text"):
+        tmpl = _compiled(name, part)
+        out[part] = tmpl.render(**ctx) if tmpl is not None else None
+    return out
 
 
-def _get(url: str, timeout: int = 12) -> Dict[str, Any]:
-    _log("info", "Brevo GET %s", url)
-    try:
-        r = requests.get(url, headers=_headers_json(), timeout=timeout)
-    except Exception as e:
-        _log("exception", "Brevo GET error: %s", e)
-        raise
+# --- Backends ---
+class BrevoBackend:
+    """API HTTP de Brevo sobre una sesión keep-alive compartida (segura entre threads)."""
 
-    if not r.ok:
-        _log("error", "Brevo GET %s :: %s", r.status_code, r.text)
-        r.raise_for_status()
+    name = "brevo"
 
-    try:
-        data = r.json()
-    except Exception:
-        data = {"ok": True, "raw": r.text}
+    def __init__(self, api_key: Optional[str], base_url: str = BREVO_API_BASE, timeout: float = 12,
+                 pool_size: int = 10):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _headers(self) -> Dict[str, str]:
+        if not self.api_key:
+            raise RuntimeError("BREVO_API_KEY no configurada")
+        return {
+            "accept": "application/json",
+            "content-type": "application/json",
+            "api-key": self.api_key,
+        }
+
+    def _request(self, method: str, path: str, body: Optional[bytes] = None) -> Dict[str, Any]:
+        url = f"{self.base_url}{path}"
+        labels = {"method": method}
+        if body is not None:
+            metrics.observe("email_http_request_bytes", len(body), metrics.SIZE_BYTES_BUCKETS, labels)
+        start = time.perf_counter()
+        try:
+            r = self.session.request(method, url, data=body, headers=self._headers(), timeout=self.timeout)
+        except Exception as e:
+            metrics.incr("email_http_requests_total", {**labels, "status": "error"})
+            _log("exception", "Brevo %s %s error: %s", method, path, e)
+            raise
+        finally:
+            metrics.observe("email_http_latency_ms", (time.perf_counter() - start) * 1000, labels=labels)
+        metrics.incr("email_http_requests_total", {**labels, "status": r.status_code})
+
+        if not r.ok:
+            # Solo los errores llevan cuerpo en el log (truncado)
+            _log("error", "Brevo HTTP %s %s :: %s", r.status_code, path, r.text[:500])
+            r.raise_for_status()
+
+        try:
+            data = r.json()
+        except Exception:
+            data = {"ok": True, "raw": r.text}
+        if _should_log_debug():
+            _log("debug", "Brevo %s %s -> %s (%d bytes)", method, path, r.status_code, len(r.content))
+        return data
+
+    def post(self, path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        # Se serializa una sola vez: el mismo buffer da el tamaño y va en el body
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        return self._request("POST", path, body)
+
+    def get(self, path: str) -> Dict[str, Any]:
+        return self._request("GET", path)
+
+    def send(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        return self.post("/smtp/email", message)
+
+
+def _to_mime(message: Dict[str, Any]) -> EmailMessage:
+    msg = EmailMessage()
+    sender = message.get("sender") or SENDER
+    msg["From"] = f'{sender.get("name", "")} <{sender["email"]}>'
+    msg["To"] = ", ".join(t["email"] for t in message.get("to", []))
+    if message.get("templateId"):
+        # Las plantillas de Brevo no existen localmente: se envía el id y los params
+        msg["Subject"] = message.get("subject") or f"[template {message['templateId']}]"
+        msg.set_content(json.dumps(message.get("params") or {}, ensure_ascii=False, indent=2))
+    else:
+        msg["Subject"] = message.get("subject") or "(Sin asunto)"
+        msg.set_content(message.get("textContent") or "")
+        if message.get("htmlContent"):
+            msg.add_alternative(message["htmlContent"], subtype="html")
+    return msg
+
+
+def _expand_versions(message: Dict[str, Any]):
+    """Un mensaje con messageVersions -> un mensaje por versión (para backends sin bloque)."""
+    versions = message.get("messageVersions")
+    if not versions:
+        return [message]
+    base = {k: v for k, v in message.items() if k != "messageVersions"}
+    out = []
+    for v in versions:
+        m = dict(base)
+        m["to"] = v["to"]
+        m["params"] = {**(base.get("params") or {}), **(v.get("params") or {})}
+        if v.get("subject"):
+            m["subject"] = v["subject"]
+        out.append(m)
+    return out
+
+
+class SmtpBackend:
+    """SMTP local sin autenticación (MailHog, smtpd de depuración)."""
+
+    name = "smtp"
+
+    def __init__(self, host: str = "localhost", port: int = 1025, timeout: float = 12):
+        self.host, self.port, self.timeout = host, port, timeout
+
+    def send(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        messages = _expand_versions(message)
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            for m in messages:
+                smtp.send_message(_to_mime(m))
+        return {"ok": True, "backend": self.name, "count": len(messages)}
 
-    _log("info", "Brevo GET OK resp=%s", json.dumps(data, ensure_ascii=False))
-    return data
+
+class MemoryBackend:
+    """Guarda los mensajes en memoria (`sent`)."""
+
+    name = "memory"
+
+    def __init__(self):
+        self.sent = []
+        self._lock = threading.Lock()
+
+    def send(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            self.sent.append(message)
+            return {"ok": True, "backend": self.name, "messageId": f"<memory-{len(self.sent)}>"}
+
+
+def build_backend(config) -> Any:
+    kind = (config.get("EMAIL_BACKEND") or "brevo").lower()
+    if kind == "memory":
+        return MemoryBackend()
+    if kind == "smtp":
+        return SmtpBackend(config.get("EMAIL_SMTP_HOST", "localhost"), int(config.get("EMAIL_SMTP_PORT", 1025)))
+    return BrevoBackend(
+        config.get("BREVO_API_KEY") or BREVO_API_KEY,
+        config.get("BREVO_API_BASE") or BREVO_API_BASE,
+        timeout=float(config.get("EMAIL_TIMEOUT", 12)),
+        pool_size=int(config.get("EMAIL_POOL_SIZE", 10)),
+    )
+
+
+_fallback = None
+_fallback_lock = threading.Lock()
+
+
+def get_backend():
+    """Backend de la app actual (o uno Brevo por defecto fuera de app context)."""
+    global _fallback
+    if has_app_context():
+        backend = current_app.extensions.get(EXT_KEY)
+        if backend is not None:
+            return backend
+    with _fallback_lock:
+        if _fallback is None:
+            _fallback = BrevoBackend(BREVO_API_KEY)
+        return _fallback
+
+
+def init_app(app):
+    app.extensions[EXT_KEY] = build_backend(app.config)
+    app.cli.add_command(email_bench_command)
 
 
 # --- Envíos ---
+def send(message: Dict[str, Any]) -> Dict[str, Any]:
+    """Envía un mensaje en formato Brevo por el backend configurado."""
+    message.setdefault("sender", SENDER)
+    backend = get_backend()
+    recipients = len(message.get("messageVersions") or ()) or len(message.get("to") or ())
+    start = time.perf_counter()
+    try:
+        resp = backend.send(message)
+    except Exception:
+        metrics.incr("email_messages_total", {"backend": backend.name, "outcome": "error"}, recipients)
+        raise
+    finally:
+        metrics.observe("email_send_latency_ms", (time.perf_counter() - start) * 1000,
+                        labels={"backend": backend.name})
+    metrics.incr("email_messages_total", {"backend": backend.name, "outcome": "ok"}, recipients)
+    return resp
+
+
 def send_template(template_id: int, to_email: str, to_name: str, params: dict, tags=None):
     body = {
         "sender": SENDER,
@@ -100,7 +342,30 @@ def send_template(template_id: int, to_email: str, to_name: str, params: dict, t
     }
     if tags:
         body["tags"] = tags
-    return _post(BREVO_API_URL_SEND, body)
+    return send(body)
+
+
+def send_bulk_template(template_id: int, recipients, tags=None):
+    """
+    Mismo template a muchos destinatarios con messageVersions.
+    recipients: [{"email", "name", "params"}]. Se parte en bloques de BULK_MAX_VERSIONS;
+    devuelve una respuesta por bloque.
+    """
+    responses = []
+    for i in range(0, len(recipients), BULK_MAX_VERSIONS):
+        chunk = recipients[i:i + BULK_MAX_VERSIONS]
+        body = {
+            "sender": SENDER,
+            "templateId": int(template_id),
+            "messageVersions": [
+                {"to": [{"email": r["email"], "name": r.get("name") or ""}], "params": r.get("params") or {}}
+                for r in chunk
+            ],
+        }
+        if tags:
+            body["tags"] = tags
+        responses.append(send(body))
+    return responses
 
 
 def send_raw(to_email: str, subject: str, text: Optional[str] = None, html: Optional[str] = None, tags=None):
@@ -118,15 +383,12 @@ def send_raw(to_email: str, subject: str, text: Optional[str] = None, html: Opti
         body["htmlContent"] = html
     if tags:
         body["tags"] = tags
-    return _post(BREVO_API_URL_SEND, body)
+    return send(body)
 
 
-def notify_lawyer_status(user, approved: bool, reason: Optional[str] = None) -> Dict[str, Any]:
+def lawyer_status_message(user, approved: bool, reason: Optional[str] = None):
+    """(template_id, params) del correo de aprobación/rechazo. template_id 0 = no configurado."""
     template_id = TMPL_APPROVED if approved else TMPL_REJECTED
-    if not template_id:
-        _log("error", "TemplateId inválido (0). Revisa BREVO_TMPL_* en env.")
-        return {"ok": False, "error": "template_id_missing"}
-
     first_name = (getattr(user, "nombres", "") or "").split(" ")[0] if getattr(user, "nombres", None) else ""
     params = {
         "firstName": first_name or "abogado/a",
@@ -135,6 +397,14 @@ def notify_lawyer_status(user, approved: bool, reason: Optional[str] = None) ->
         "reason": reason or "",
         "dashboardUrl": os.environ.get("APP_DASHBOARD_URL", "https://abogapp.co/inicio"),
     }
+    return template_id, params
+
+
+def notify_lawyer_status(user, approved: bool, reason: Optional[str] = None) -> Dict[str, Any]:
+    template_id, params = lawyer_status_message(user, approved, reason)
+    if not template_id:
+        _log("error", "TemplateId inválido (0). Revisa BREVO_TMPL_* en env.")
+        return {"ok": False, "error": "template_id_missing"}
 
     try:
         resp = send_template(template_id, getattr(user, "email"), getattr(user, "nombres", "") or "", params, tags=["lawyer_status"])
@@ -149,15 +419,72 @@ def brevo_account() -> Dict[str, Any]:
     Llama al endpoint /v3/account para validar que la API Key funciona
     y ver datos básicos de la cuenta.
     """
-    return _get(BREVO_API_URL_ACCOUNT)
+    backend = get_backend()
+    if not isinstance(backend, BrevoBackend):
+        return {"ok": True, "backend": backend.name}
+    return backend.get("/account")
 
 
 def brevo_debug_summary() -> Dict[str, Any]:
+    backend = get_backend()
+    api_key = getattr(backend, "api_key", None)
     return {
+        "backend": backend.name,
         "sender": SENDER,
-        "BREVO_API_KEY_set": bool(BREVO_API_KEY),
-        "BREVO_API_KEY_masked": _mask(BREVO_API_KEY, 6),
+        "BREVO_API_KEY_set": bool(api_key),
+        "BREVO_API_KEY_masked": _mask(api_key, 6),
         "TMPL_APPROVED": TMPL_APPROVED,
         "TMPL_REJECTED": TMPL_REJECTED,
         "APP_DASHBOARD_URL": os.environ.get("APP_DASHBOARD_URL"),
-    }
\ No newline at end of file
+    }
+
+
+# --- Benchmark contra un endpoint falso local ---
+def _start_fake_brevo():
+    """Servidor HTTP local que responde como /v3/smtp/email. Devuelve (server, base_url)."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive
+        disable_nagle_algorithm = True
+        wbufsize = -1  # una sola escritura por respuesta
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            body = b'{"messageId":"<fake@localhost>"}'
+            self.send_response(201)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+@click.command("email-bench")
+@click.option("-n", "count", type=int, default=300, help="Correos por corrida.")
+def email_bench_command(count):
+    """Mide correos/seg del transporte Brevo (sesión keep-alive vs. conexión nueva) contra un endpoint local."""
+    server, base_url = _start_fake_brevo()
+    message = {"sender": SENDER, "to": [{"email": "bench@example.com"}], "subject": "bench",
+               "htmlContent": render("verify_email", nombres="Ana", apellidos="Pérez", code="123456")["html"]}
+    try:
+        backend = BrevoBackend("bench-key", base_url)
+        url = f"{base_url}/smtp/email"
+        runs = {
+            "requests.post por correo": lambda: requests.post(url, json=message, headers=backend._headers(), timeout=12),
+            "BrevoBackend (keep-alive)": lambda: backend.send(message),
+        }
+        for label, fn in runs.items():
+            start = time.perf_counter()
+            for _ in range(count):
+                fn()
+            elapsed = time.perf_counter() - start
+            click.echo(f"{label:28s} {count / elapsed:8.1f} correos/s  ({elapsed * 1000 / count:.2f} ms/correo)")
+    finally:
+        server.shutdown()
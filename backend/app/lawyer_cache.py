@@ -0,0 +1,317 @@
+# backend/app/lawyer_cache.py
+"""
+Caché de lectura de perfiles públicos de abogados (tarjetas, galería, video).
+
+Dos niveles:
+- LRU por proceso con TTL corto (LAWYER_CACHE_SIZE, LAWYER_CACHE_SECONDS).
+- Almacén compartido entre workers (LAWYER_CACHE_SHARED_SECONDS): Redis si
+  CACHE_REDIS_URL está definido y el paquete `redis` instalado; si no, un
+  diccionario en memoria que cumple el mismo contrato (desarrollo / pruebas).
+
+Lectura: LRU -> compartido -> BD (un solo IN para todos los que faltan).
+Escritura: los endpoints que cambian un perfil llaman a invalidate() después
+del commit; se borra en ambos niveles de este proceso y en el compartido. Los
+LRU de otros workers pueden servir el valor anterior hasta LAWYER_CACHE_SECONDS.
+
+Cada key compartida tiene una generación ("gen:<key>") que invalidate()
+incrementa. El lector guarda su valor junto con la generación que leyó antes
+de ir a la BD; si hubo una invalidación en medio, la generación ya no coincide
+y ese valor (posiblemente viejo) se ignora en vez de servirse hasta su TTL.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+from . import metrics
+from .models import User, LawyerGalleryImage, LawyerIntroVideo
+
+EXT_KEY = "lawyer_cache"
+
+PROFILE = "lawyer"
+GALLERY = "gallery"
+VIDEO = "video"
+ALL_PARTS = (PROFILE, GALLERY, VIDEO)
+
+# Campos del perfil público (la tarjeta de listados es el mismo dict sin 'titles')
+PROFILE_FIELDS = ("id", "nombres", "apellidos", "especialidad", "about_me", "titles",
+                  "profile_picture_url", "consultation_price")
+
+
+# ==========================
+#  Almacenes compartidos
+# ==========================
+class MemoryStore:
+    """Sustituto en proceso del almacén compartido (mismo contrato que RedisStore)."""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        out = {}
+        with self._lock:
+            for k in keys:
+                hit = self._data.get(k)
+                if hit is None:
+                    continue
+                if hit[0] <= now:
+                    self._data.pop(k, None)
+                    continue
+                out[k] = hit[1]
+        return out
+
+    def set_many(self, mapping, ttl):
+        expires = time.monotonic() + ttl
+        with self._lock:
+            for k, v in mapping.items():
+                self._data[k] = (expires, v)
+
+    def delete_many(self, keys):
+        with self._lock:
+            for k in keys:
+                self._data.pop(k, None)
+
+    def incr_many(self, keys):
+        """Contadores sin expiración."""
+        with self._lock:
+            for k in keys:
+                hit = self._data.get(k)
+                self._data[k] = (float("inf"), str(int(hit[1]) + 1 if hit else 1))
+
+
+class RedisStore:
+    def __init__(self, url, prefix="abogapp:"):
+        import redis  # opcional
+        self._r = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self._prefix = prefix
+
+    def get_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        values = self._r.mget([self._prefix + k for k in keys])
+        return {k: v.decode("utf-8") for k, v in zip(keys, values) if v is not None}
+
+    def set_many(self, mapping, ttl):
+        pipe = self._r.pipeline(transaction=False)
+        for k, v in mapping.items():
+            pipe.setex(self._prefix + k, int(ttl), v)
+        pipe.execute()
+
+    def delete_many(self, keys):
+        keys = [self._prefix + k for k in keys]
+        if keys:
+            self._r.delete(*keys)
+
+    def incr_many(self, keys):
+        pipe = self._r.pipeline(transaction=False)
+        for k in keys:
+            pipe.incr(self._prefix + k)
+        pipe.execute()
+
+
+def build_store(url=None):
+    if not url:
+        return MemoryStore()
+    try:
+        return RedisStore(url)
+    except ImportError:
+        current_app.logger.warning("[lawyer_cache] CACHE_REDIS_URL definido pero falta el paquete redis; "
+                                   "se usa caché en memoria")
+        return MemoryStore()
+
+
+# ==========================
+#  Caché de dos niveles
+# ==========================
+def _gen_key(key):
+    return "gen:" + key
+
+
+class TwoTierCache:
+    def __init__(self, store, size=5000, local_ttl=10, shared_ttl=600):
+        self.store = store
+        self.size = int(size)
+        self.local_ttl = float(local_ttl)
+        self.shared_ttl = int(shared_ttl)
+        self._local = OrderedDict()  # key -> (expira_monotonic, valor)
+        self._lock = threading.Lock()
+
+    def _local_get(self, keys, found):
+        now = time.monotonic()
+        with self._lock:
+            for k in keys:
+                hit = self._local.get(k)
+                if hit is None:
+                    continue
+                if hit[0] <= now:
+                    self._local.pop(k, None)
+                    continue
+                self._local.move_to_end(k)
+                found[k] = hit[1]
+
+    def _local_put(self, mapping):
+        expires = time.monotonic() + self.local_ttl
+        with self._lock:
+            for k, v in mapping.items():
+                self._local[k] = (expires, v)
+                self._local.move_to_end(k)
+            while len(self._local) > self.size:
+                self._local.popitem(last=False)
+
+    def get_many(self, keys, load):
+        """
+        {key: valor} para todas las keys. `load(keys_faltantes)` devuelve
+        {key: valor} desde la BD (las ausentes se guardan como None).
+        """
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        self._local_get(keys, found)
+        missing = [k for k in keys if k not in found]
+        if found:
+            metrics.incr("lawyer_cache_total", {"tier": "local"}, len(found))
+        if not missing:
+            return found
+
+        shared = {}
+        gens = None  # generación vista por key; None si el almacén falló
+        try:
+            raw = self.store.get_many(missing + [_gen_key(k) for k in missing])
+            gens = {k: int(raw.get(_gen_key(k)) or 0) for k in missing}
+            for k in missing:
+                if k in raw:
+                    entry = json.loads(raw[k])
+                    if entry["g"] == gens[k]:
+                        shared[k] = entry["v"]
+        except Exception as e:  # el almacén compartido nunca tumba la lectura
+            current_app.logger.warning("[lawyer_cache] lectura compartida falló: %s", e)
+        if shared:
+            metrics.incr("lawyer_cache_total", {"tier": "shared"}, len(shared))
+            self._local_put(shared)
+            found.update(shared)
+        missing = [k for k in missing if k not in shared]
+        if not missing:
+            return found
+
+        loaded = load(missing)
+        loaded = {k: loaded.get(k) for k in missing}
+        metrics.incr("lawyer_cache_total", {"tier": "db"}, len(loaded))
+        if gens is not None:
+            try:
+                self.store.set_many({k: json.dumps({"g": gens[k], "v": v}) for k, v in loaded.items()},
+                                    self.shared_ttl)
+            except Exception as e:
+                current_app.logger.warning("[lawyer_cache] escritura compartida falló: %s", e)
+        self._local_put(loaded)
+        found.update(loaded)
+        return found
+
+    def delete_many(self, keys):
+        keys = list(keys)
+        with self._lock:
+            for k in keys:
+                self._local.pop(k, None)
+        try:
+            # Primero la generación: un lector que ya pasó por la BD no podrá
+            # dejar su valor vigente aunque lo escriba después del borrado.
+            self.store.incr_many([_gen_key(k) for k in keys])
+            self.store.delete_many(keys)
+        except Exception as e:
+            current_app.logger.warning("[lawyer_cache] invalidación compartida falló: %s", e)
+
+    def clear_local(self):
+        with self._lock:
+            self._local.clear()
+
+
+def _cache() -> TwoTierCache:
+    return current_app.extensions[EXT_KEY]
+
+
+def _key(part, lawyer_id):
+    return f"{part}:{int(lawyer_id)}"
+
+
+# ==========================
+#  Cargas desde BD
+# ==========================
+def _load_profiles(keys):
+    ids = [int(k.split(":", 1)[1]) for k in keys]
+    rows = User.query.filter(User.id.in_(ids), User.role == "abogado").all()
+    return {
+        _key(PROFILE, u.id): {
+            "profile": {f: getattr(u, f) for f in PROFILE_FIELDS},
+            "public": bool(u.is_approved and u.is_active),
+        }
+        for u in rows
+    }
+
+
+def _load_gallery(keys):
+    ids = [int(k.split(":", 1)[1]) for k in keys]
+    out = {k: [] for k in keys}
+    imgs = (LawyerGalleryImage.query.filter(LawyerGalleryImage.lawyer_id.in_(ids))
+            .order_by(LawyerGalleryImage.created_at.desc()).all())
+    for i in imgs:
+        out[_key(GALLERY, i.lawyer_id)].append({"id": i.id, "filename": i.filename, "url": f"/uploads/{i.filename}"})
+    return out
+
+
+def _load_video(keys):
+    ids = [int(k.split(":", 1)[1]) for k in keys]
+    out = {k: {} for k in keys}
+    for v in LawyerIntroVideo.query.filter(LawyerIntroVideo.lawyer_id.in_(ids)).all():
+        out[_key(VIDEO, v.lawyer_id)] = {"filename": v.filename, "url": f"/uploads/{v.filename}"}
+    return out
+
+
+# ==========================
+#  API
+# ==========================
+def profiles(ids):
+    """
+    {id: {"profile": {...}, "public": bool}} para los ids que son abogados
+    (los que no existen o no son abogados no aparecen).
+    """
+    ids = [int(i) for i in ids]
+    got = _cache().get_many([_key(PROFILE, i) for i in ids], _load_profiles)
+    return {i: got[_key(PROFILE, i)] for i in ids if got.get(_key(PROFILE, i))}
+
+
+def public_profile(lawyer_id):
+    """Perfil público (dict) o None si no existe / no está aprobado y activo."""
+    entry = profiles([lawyer_id]).get(int(lawyer_id))
+    return entry["profile"] if entry and entry["public"] else None
+
+
+def card(profile: dict) -> dict:
+    """Tarjeta de listados (el perfil sin 'titles')."""
+    return {k: v for k, v in profile.items() if k != "titles"}
+
+
+def gallery(lawyer_id):
+    return _cache().get_many([_key(GALLERY, lawyer_id)], _load_gallery)[_key(GALLERY, lawyer_id)]
+
+
+def video(lawyer_id):
+    return _cache().get_many([_key(VIDEO, lawyer_id)], _load_video)[_key(VIDEO, lawyer_id)]
+
+
+def invalidate(*lawyer_ids, parts=(PROFILE,)):
+    """Llamar después del commit que cambia el perfil, la galería o el video."""
+    _cache().delete_many([_key(p, i) for i in lawyer_ids for p in parts])
+
+
+def init_app(app):
+    with app.app_context():
+        store = build_store(app.config.get("CACHE_REDIS_URL"))
+    app.extensions[EXT_KEY] = TwoTierCache(
+        store,
+        size=app.config.get("LAWYER_CACHE_SIZE", 5000),
+        local_ttl=app.config.get("LAWYER_CACHE_SECONDS", 10),
+        shared_ttl=app.config.get("LAWYER_CACHE_SHARED_SECONDS", 600),
+    )
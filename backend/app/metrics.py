@@ -0,0 +1,75 @@
+# backend/app/metrics.py
+"""
+Métricas en memoria (por proceso): contadores e histogramas con buckets fijos.
+
+Pensadas para rutas calientes: incr()/observe() solo toman un lock y suman,
+sin formatear strings ni escribir logs. snapshot() arma el JSON que expone
+GET /api/admin/metrics.
+"""
+import bisect
+import threading
+
+# Buckets por defecto
+LATENCY_MS_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+SIZE_BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+_lock = threading.Lock()
+_counters = {}    # (name, labels) -> int
+_histograms = {}  # (name, labels) -> [buckets, counts, sum, count]
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items())) if labels else ()
+
+
+def incr(name: str, labels=None, n: int = 1):
+    key = (name, _labels(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + n
+
+
+def observe(name: str, value, buckets=LATENCY_MS_BUCKETS, labels=None):
+    """Suma `value` al histograma (el último bucket es +Inf)."""
+    key = (name, _labels(labels))
+    idx = bisect.bisect_left(buckets, value)
+    with _lock:
+        h = _histograms.get(key)
+        if h is None:
+            h = _histograms[key] = [buckets, [0] * (len(buckets) + 1), 0.0, 0]
+        h[1][idx] += 1
+        h[2] += value
+        h[3] += 1
+
+
+def _key_str(name, labels):
+    if not labels:
+        return name
+    return name + "{" + ",".join(f"{k}={v}" for k, v in labels) + "}"
+
+
+def snapshot(prefix: str = None):
+    """{counters: {nombre{labels}: n}, histograms: {nombre{labels}: {buckets: [[le, n]], count, sum}}}."""
+    with _lock:
+        counters = dict(_counters)
+        histograms = {k: (h[0], list(h[1]), h[2], h[3]) for k, h in _histograms.items()}
+    out = {"counters": {}, "histograms": {}}
+    # Orden por texto: los valores de labels pueden mezclar int y str
+    for (name, labels), n in sorted(counters.items(), key=lambda kv: _key_str(*kv[0])):
+        if prefix is None or name.startswith(prefix):
+            out["counters"][_key_str(name, labels)] = n
+    for (name, labels), (buckets, counts, total, count) in sorted(histograms.items(),
+                                                                  key=lambda kv: _key_str(*kv[0])):
+        if prefix is None or name.startswith(prefix):
+            out["histograms"][_key_str(name, labels)] = {
+                # Lista [límite, n] para conservar el orden (jsonify ordena las claves)
+                "buckets": [[b, c] for b, c in zip(buckets, counts)] + [["inf", counts[-1]]],
+                "count": count,
+                "sum": round(total, 3),
+            }
+    return out
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
@@ -17,6 +17,8 @@ class User(db.Model):
 
     # Aprobación final (derivada por recompute_approval)
     is_approved = db.Column(db.Boolean, default=False, nullable=False)
+    # Versión de los claims del JWT: subirla invalida los tokens emitidos antes
+    token_version = db.Column(db.Integer, default=0, server_default='0', nullable=False)
 
     created_by = db.Column(db.Integer, nullable=True)
     about_me = db.Column(db.Text, nullable=True)
@@ -53,18 +55,96 @@ class User(db.Model):
         ok_kyc = True if self.role != "abogado" else (self.kyc_status == "approved")
         self.is_approved = bool(ok_email and ok_kyc)
 
+class Specialty(db.Model):
+    __tablename__ = 'specialty'
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(80), nullable=False)
+    slug = db.Column(db.String(80), unique=True, nullable=False, index=True)  # sin tildes, minúsculas
+
+class LawyerSpecialty(db.Model):
+    """Asociación abogado <-> especialidad (derivada de User.especialidad)."""
+    __tablename__ = 'lawyer_specialty'
+    lawyer_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    specialty_id = db.Column(db.Integer, db.ForeignKey('specialty.id'), primary_key=True)
+
+    __table_args__ = (
+        db.Index('ix_lawyer_specialty_specialty', 'specialty_id', 'lawyer_id'),
+    )
+
 class Availability(db.Model):
+    # Legado: lista JSON de horarios por fecha. Se migra a AvailabilitySlot al arrancar.
     id = db.Column(db.Integer, primary_key=True)
     date = db.Column(db.Date, nullable=False)
     time_slots = db.Column(db.JSON, nullable=False)
     lawyer_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
 
+class AvailabilitySlot(db.Model):
+    """Un horario libre: minuto del día (0..1439) en una fecha para un abogado."""
+    __tablename__ = 'availability_slot'
+    id = db.Column(db.Integer, primary_key=True)
+    lawyer_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    minute = db.Column(db.SmallInteger, nullable=False)
+
+    __table_args__ = (
+        # También sirve de índice (lawyer_id, date) para las consultas por ventana
+        UniqueConstraint('lawyer_id', 'date', 'minute', name='uq_availability_slot'),
+        # "¿quién está libre el martes a las 10:00?"
+        db.Index('ix_availability_slot_date_minute', 'date', 'minute'),
+    )
+
+class AvailabilityRule(db.Model):
+    """Disponibilidad semanal recurrente: weekday (0=lunes) de start_minute a end_minute."""
+    __tablename__ = 'availability_rule'
+    id = db.Column(db.Integer, primary_key=True)
+    lawyer_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    weekday = db.Column(db.SmallInteger, nullable=False)
+    start_minute = db.Column(db.SmallInteger, nullable=False)
+    end_minute = db.Column(db.SmallInteger, nullable=False)  # exclusivo
+    valid_from = db.Column(db.Date, nullable=True)
+    valid_until = db.Column(db.Date, nullable=True)
+
+    __table_args__ = (
+        CheckConstraint('weekday BETWEEN 0 AND 6', name='ck_availability_rule_weekday'),
+        CheckConstraint('start_minute < end_minute', name='ck_availability_rule_range'),
+        db.Index('ix_availability_rule_lawyer', 'lawyer_id', 'weekday'),
+        db.Index('ix_availability_rule_weekday', 'weekday', 'start_minute'),
+    )
+
+class AvailabilityException(db.Model):
+    """Horario de una regla semanal que el abogado quitó en una fecha concreta."""
+    __tablename__ = 'availability_exception'
+    id = db.Column(db.Integer, primary_key=True)
+    lawyer_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    minute = db.Column(db.SmallInteger, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint('lawyer_id', 'date', 'minute', name='uq_availability_exception'),
+        # Archivo de fechas pasadas
+        db.Index('ix_availability_exception_date', 'date'),
+    )
+
+class LawyerNextSlot(db.Model):
+    """Próximo horario libre precalculado por abogado (se refresca al cambiar la disponibilidad)."""
+    __tablename__ = 'lawyer_next_slot'
+    lawyer_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    date = db.Column(db.Date, nullable=False)
+    minute = db.Column(db.SmallInteger, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_lawyer_next_slot_date_minute', 'date', 'minute'),
+    )
+
 class Meeting(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     meeting_date = db.Column(db.Date, nullable=False)
     meeting_time = db.Column(db.String(10), nullable=False)
     status = db.Column(db.String(20), default='confirmada', nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Última modificación (sincronización incremental con ?since=)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=True)
     client_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     lawyer_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
 
@@ -72,6 +152,43 @@ class Meeting(db.Model):
     price_at_booking_cents = db.Column(db.Integer, nullable=False, default=0)
     currency = db.Column(db.String(3), nullable=False, default='USD')
 
+    __table_args__ = (
+        db.Index('ix_meeting_client_date', 'client_id', 'meeting_date', 'id'),
+        db.Index('ix_meeting_lawyer_date', 'lawyer_id', 'meeting_date', 'id'),
+    )
+
+class SlotReservation(db.Model):
+    """
+    Reclamo de un horario (lawyer_id, date, minute). La restricción única es la
+    que impide la doble reserva entre workers; se inserta antes que la Meeting.
+    Con expires_at es un "hold" temporal (checkout); sin expires_at es definitivo.
+    """
+    __tablename__ = 'slot_reservation'
+    id = db.Column(db.Integer, primary_key=True)
+    lawyer_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    minute = db.Column(db.SmallInteger, nullable=False)
+    # Minuto de inicio de la reunión/hold: una fila por cada casilla que ocupa
+    # (None en reservas anteriores, que solo tienen la fila de inicio)
+    start_minute = db.Column(db.SmallInteger, nullable=True)
+    client_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    meeting_id = db.Column(db.Integer, db.ForeignKey('meeting.id'), nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=True, index=True)  # UTC; None = confirmada
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint('lawyer_id', 'date', 'minute', name='uq_slot_reservation'),
+        # Archivo de fechas pasadas
+        db.Index('ix_slot_reservation_date', 'date'),
+    )
+
+    @property
+    def is_hold(self):
+        return self.expires_at is not None
+
+    def is_expired(self, now=None):
+        return self.expires_at is not None and self.expires_at <= (now or datetime.utcnow())
+
 class Review(db.Model):
     __tablename__ = 'review'
     id = db.Column(db.Integer, primary_key=True)
@@ -80,13 +197,58 @@ class Review(db.Model):
     meeting_id = db.Column(db.Integer, db.ForeignKey('meeting.id'), nullable=True)
     rating = db.Column(db.Integer, nullable=False)  # 1..5
     comment = db.Column(db.Text, nullable=True)
+    # "Nombre A." del cliente, guardado al crear (las antiguas se rellenan al arrancar)
+    client_name = db.Column(db.String(120), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
 
     __table_args__ = (
         CheckConstraint('rating BETWEEN 1 AND 5', name='ck_review_rating_1_5'),
         UniqueConstraint('client_id', 'meeting_id', name='uq_review_client_meeting'),
+        # Listado por abogado (más recientes primero) con paginación keyset
+        db.Index('ix_review_lawyer_created', 'lawyer_id', 'created_at', 'id'),
     )
 
+    @staticmethod
+    def display_name(client):
+        """'Nombre A.' a partir del cliente (o 'Cliente'); es lo que se guarda en client_name."""
+        try:
+            if client and client.nombres and client.apellidos:
+                return f"{client.nombres.split()[0]} {client.apellidos[0]}."
+        except Exception:
+            pass
+        return "Cliente"
+
+class LawyerRating(db.Model):
+    """Agregado de reseñas por abogado, mantenido en create_review (lectura por PK)."""
+    __tablename__ = 'lawyer_rating'
+    RECENT_N = 5
+
+    lawyer_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    count = db.Column(db.Integer, default=0, nullable=False)
+    total = db.Column(db.Integer, default=0, nullable=False)  # suma de ratings
+    r1 = db.Column(db.Integer, default=0, nullable=False)
+    r2 = db.Column(db.Integer, default=0, nullable=False)
+    r3 = db.Column(db.Integer, default=0, nullable=False)
+    r4 = db.Column(db.Integer, default=0, nullable=False)
+    r5 = db.Column(db.Integer, default=0, nullable=False)
+    # Últimas RECENT_N reseñas ya serializadas (más reciente primero)
+    recent = db.Column(db.JSON, default=list, nullable=False)
+    # Promedio desnormalizado para ordenar búsquedas sin GROUP BY
+    avg = db.Column(db.Float, default=0.0, nullable=False, index=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    @property
+    def histogram(self):
+        return {str(i): int(getattr(self, f"r{i}") or 0) for i in range(1, 6)}
+
+    @property
+    def recent_avg(self):
+        items = self.recent or []
+        return (sum(int(i['rating']) for i in items) / len(items)) if items else 0.0
+
+    def push_recent(self, item):
+        self.recent = ([item] + list(self.recent or []))[:self.RECENT_N]
+
 class Favorite(db.Model):
     __tablename__ = 'favorite'
     id = db.Column(db.Integer, primary_key=True)
@@ -96,6 +258,8 @@ class Favorite(db.Model):
 
     __table_args__ = (
         UniqueConstraint('user_id', 'lawyer_id', name='uq_favorite_user_lawyer'),
+        # Listado en orden de guardado con paginación keyset
+        db.Index('ix_favorite_user_created', 'user_id', 'created_at', 'id'),
     )
 
 class MeetingPresence(db.Model):
@@ -121,4 +285,54 @@ class LawyerIntroVideo(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     lawyer_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True, unique=True, nullable=False)
     filename = db.Column(db.String(255), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
\ No newline at end of file
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+class EmailOutbox(db.Model):
+    """
+    Correo pendiente de envío. Se inserta en la misma transacción que el cambio
+    que lo origina y lo envía un worker (app/outbox.py) con reintentos.
+    status: pending | sending | sent | dead
+    """
+    __tablename__ = 'email_outbox'
+    id = db.Column(db.Integer, primary_key=True)
+    to_email = db.Column(db.String(255), nullable=False)
+    to_name = db.Column(db.String(255), nullable=True)
+    subject = db.Column(db.String(255), nullable=True)
+    html = db.Column(db.Text, nullable=True)
+    text = db.Column(db.Text, nullable=True)
+    template_id = db.Column(db.Integer, nullable=True)
+    params = db.Column(db.JSON, nullable=True)
+    tags = db.Column(db.JSON, nullable=True)
+    status = db.Column(db.String(10), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    # pending: no antes de; sending: fin del lease del worker que lo tomó
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # Token aleatorio de la toma en curso (identifica las filas de cada worker)
+    claim_token = db.Column(db.String(32), nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_email_outbox_due', 'status', 'next_attempt_at'),
+    )
+
+class OneTimeCode(db.Model):
+    """
+    Código de un solo uso (p. ej. verificación de correo). Se guarda el
+    HMAC-SHA256 del código, no el código; uno activo por (user_id, purpose).
+    La fuerza bruta se frena con attempts / locked_until, no con el costo del hash.
+    """
+    __tablename__ = 'one_time_code'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    purpose = db.Column(db.String(32), nullable=False)
+    code_hmac = db.Column(db.String(64), nullable=True)  # None: código legado (argon2 en User)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    locked_until = db.Column(db.DateTime, nullable=True)
+    sent_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint('user_id', 'purpose', name='uq_one_time_code_user_purpose'),
+    )
@@ -0,0 +1,190 @@
+# backend/app/otp.py
+"""
+Códigos de un solo uso (verificación de correo), separados del hashing de contraseñas.
+
+Un código de 6 dígitos no gana nada con Argon2 (el espacio es de 10^6 y se
+recorre igual); lo que lo protege es limitar intentos. Por eso:
+
+- Se guarda HMAC-SHA256(OTP_SECRET, "user:purpose:código"): verificar cuesta
+  microsegundos y la fila filtrada no sirve sin el secreto.
+- OTP_MAX_ATTEMPTS intentos por código (contador con UPDATE atómico); al
+  agotarse el código se quema y el usuario queda bloqueado OTP_LOCKOUT_MINUTES.
+- Reenvío limitado por OTP_RESEND_COOLDOWN_SECONDS.
+- Una tarea periódica borra los códigos vencidos (índice en expires_at).
+
+Los usuarios con un código legado (argon2 en User.email_verif_code_hash) se
+verifican contra ese hash, pero pasando por el mismo contador de intentos.
+"""
+import hashlib
+import hmac
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+from . import metrics, passwords
+from .background import start_periodic
+from .models import db, OneTimeCode
+
+VERIFY_EMAIL = "verify_email"
+
+# Resultados de verify()
+OK = "ok"
+INVALID = "invalid"
+EXPIRED = "expired"
+LOCKED = "locked"
+
+
+def _cfg(name, default):
+    return current_app.config.get(name, default)
+
+
+def _secret() -> bytes:
+    secret = _cfg("OTP_SECRET", None) or current_app.config["JWT_SECRET_KEY"]
+    return secret.encode("utf-8")
+
+
+def ttl_minutes() -> int:
+    """Vigencia de un código nuevo (OTP_TTL_MINUTES); la usan también los correos."""
+    return int(_cfg("OTP_TTL_MINUTES", 10))
+
+
+def code_hmac(user_id: int, purpose: str, code: str) -> str:
+    msg = f"{int(user_id)}:{purpose}:{code}".encode("utf-8")
+    return hmac.new(_secret(), msg, hashlib.sha256).hexdigest()
+
+
+def _get(user_id: int, purpose: str):
+    return OneTimeCode.query.filter_by(user_id=user_id, purpose=purpose).first()
+
+
+# ==========================
+#  Emisión
+# ==========================
+def _new_row(user, purpose: str, now):
+    """
+    Crea la fila (vencida, sin código) y hace commit. Si otro request la creó
+    primero devuelve esa, que ya trae su sent_at/locked_until.
+    """
+    row = OneTimeCode(user_id=user.id, purpose=purpose, expires_at=now, sent_at=now)
+    db.session.add(row)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()  # otro request la creó primero
+        return _get(user.id, purpose)
+    return row
+
+
+def issue(user, purpose: str, code: str, enforce_cooldown: bool = True):
+    """
+    Guarda el código (sin commit) y devuelve (expires_at, None).
+    Si el usuario está bloqueado o reenviando demasiado rápido devuelve
+    (None, segundos_de_espera) y no cambia nada.
+    La primera vez crea la fila con commit propio (ver _new_row).
+    """
+    now = datetime.utcnow()
+    row = _get(user.id, purpose) or _new_row(user, purpose, now)
+    if row.locked_until and row.locked_until > now:
+        return None, int((row.locked_until - now).total_seconds()) + 1
+    cooldown = timedelta(seconds=int(_cfg("OTP_RESEND_COOLDOWN_SECONDS", 60)))
+    if enforce_cooldown and row.code_hmac and row.sent_at + cooldown > now:
+        return None, int((row.sent_at + cooldown - now).total_seconds()) + 1
+
+    row.code_hmac = code_hmac(user.id, purpose, code)
+    row.expires_at = now + timedelta(minutes=ttl_minutes())
+    row.attempts = 0
+    row.locked_until = None
+    row.sent_at = now
+    metrics.incr("otp_issued_total", {"purpose": purpose})
+    return row.expires_at, None
+
+
+# ==========================
+#  Verificación
+# ==========================
+def _legacy_row(user, purpose: str):
+    """Fila de conteo para un código argon2 legado (solo verify_email). Hace commit."""
+    if purpose != VERIFY_EMAIL or not user.email_verif_code_hash or not user.email_verif_expires:
+        return None
+    row = OneTimeCode(user_id=user.id, purpose=purpose, code_hmac=None,
+                      expires_at=user.email_verif_expires, sent_at=datetime.utcnow())
+    db.session.add(row)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()  # otro request la creó primero
+        return _get(user.id, purpose)
+    return row
+
+
+def _matches(user, row: OneTimeCode, purpose: str, code: str) -> bool:
+    if row.code_hmac is None:
+        ok, _ = passwords.verify_password(user.email_verif_code_hash, code)
+        return ok
+    return hmac.compare_digest(row.code_hmac, code_hmac(user.id, purpose, code))
+
+
+def verify(user, purpose: str, code: str) -> str:
+    """
+    OK | INVALID | EXPIRED | LOCKED.
+    Los intentos fallidos se confirman aquí (commit); con OK la fila se borra
+    y el commit queda a cargo del endpoint, junto con su propio cambio.
+    """
+    result = _verify(user, purpose, (code or "").strip())
+    metrics.incr("otp_verify_total", {"purpose": purpose, "result": result})
+    return result
+
+
+def _verify(user, purpose: str, code: str) -> str:
+    now = datetime.utcnow()
+    row = _get(user.id, purpose) or _legacy_row(user, purpose)
+    if row is None:
+        return EXPIRED
+    if row.locked_until and row.locked_until > now:
+        return LOCKED
+    if row.expires_at <= now:
+        return EXPIRED
+
+    # Reserva el intento antes de comparar: con requests en paralelo nunca
+    # se prueban más de OTP_MAX_ATTEMPTS códigos.
+    max_attempts = int(_cfg("OTP_MAX_ATTEMPTS", 5))
+    taken = OneTimeCode.query.filter(
+        OneTimeCode.id == row.id, OneTimeCode.attempts < max_attempts,
+    ).update({"attempts": OneTimeCode.attempts + 1}, synchronize_session=False)
+    db.session.commit()
+    if not taken:
+        return LOCKED
+
+    if _matches(user, row, purpose, code):
+        db.session.delete(row)
+        return OK
+
+    db.session.refresh(row)
+    if row.attempts >= max_attempts:
+        # Se quema el código: tras el bloqueo hay que pedir uno nuevo
+        row.locked_until = now + timedelta(minutes=int(_cfg("OTP_LOCKOUT_MINUTES", 15)))
+        row.expires_at = now
+        db.session.commit()
+        current_app.logger.warning("[otp] user %s bloqueado (%s) tras %d intentos",
+                                   user.id, purpose, row.attempts)
+        return LOCKED
+    return INVALID
+
+
+# ==========================
+#  Limpieza
+# ==========================
+def purge_expired() -> int:
+    """Borra códigos vencidos cuyo bloqueo (si lo hay) ya pasó. Hace commit."""
+    now = datetime.utcnow()
+    n = OneTimeCode.query.filter(
+        OneTimeCode.expires_at < now,
+        db.or_(OneTimeCode.locked_until.is_(None), OneTimeCode.locked_until < now),
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return n
+
+
+def init_app(app):
+    start_periodic(app, "purge-one-time-codes", app.config.get("OTP_PURGE_SECONDS"), purge_expired)
@@ -0,0 +1,211 @@
+# backend/app/outbox.py
+"""
+Outbox de correos.
+
+Los endpoints solo insertan una fila en email_outbox (en su misma transacción,
+sin commit propio) y responden; una tarea periódica toma las filas vencidas y
+las envía por Brevo.
+
+- Reintentos con backoff exponencial; tras EMAIL_OUTBOX_MAX_ATTEMPTS la fila
+  queda en 'dead' (dead letter) para revisión / reintento manual.
+- Cada worker "toma" un lote con un UPDATE condicional que marca las filas con
+  su claim_token y un lease; si el proceso muere a mitad, las filas vuelven a
+  estar disponibles al vencer el lease.
+- Los correos con el mismo template se envían juntos (messageVersions); si
+  Brevo rechaza el bloque con un 4xx se parte en mitades, así solo falla
+  la fila inválida.
+- Al enviarse se borran los cuerpos (pueden llevar códigos de verificación).
+
+Sin tareas en segundo plano (BACKGROUND_TASKS=False) se puede vaciar con
+`flask email-outbox-run`.
+"""
+import smtplib
+import uuid
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+
+from . import emailer
+from .background import start_periodic
+from .models import db, EmailOutbox
+
+LEASE_SECONDS = 300
+BACKOFF_BASE_SECONDS = 30
+BACKOFF_MAX_SECONDS = 6 * 3600
+
+
+# ==========================
+#  Encolar (sin commit)
+# ==========================
+def enqueue_raw(to_email: str, subject: str, html=None, text=None, tags=None) -> EmailOutbox:
+    row = EmailOutbox(to_email=to_email, subject=subject or "(Sin asunto)", html=html, text=text, tags=tags)
+    db.session.add(row)
+    return row
+
+
+def enqueue_template(template_id: int, to_email: str, to_name: str, params: dict, tags=None) -> EmailOutbox:
+    row = EmailOutbox(to_email=to_email, to_name=to_name, template_id=int(template_id),
+                      params=params or {}, tags=tags)
+    db.session.add(row)
+    return row
+
+
+def enqueue_lawyer_status(user, approved: bool, reason=None):
+    """Correo de aprobación/rechazo. None si el template no está configurado."""
+    template_id, params = emailer.lawyer_status_message(user, approved, reason)
+    if not template_id:
+        current_app.logger.error("[outbox] TemplateId inválido (0). Revisa BREVO_TMPL_* en env.")
+        return None
+    return enqueue_template(template_id, user.email, getattr(user, "nombres", "") or "", params,
+                            tags=["lawyer_status"])
+
+
+# ==========================
+#  Envío
+# ==========================
+def _backoff(attempts: int) -> timedelta:
+    return timedelta(seconds=min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (attempts - 1)))
+
+
+def _deliver(row: EmailOutbox):
+    return emailer.send_raw(row.to_email, row.subject, text=row.text, html=row.html, tags=row.tags)
+
+
+def _claim(ids, now: datetime):
+    """
+    Toma las filas para este worker con un solo UPDATE condicional (hace commit).
+    Cada toma lleva un claim_token propio: las filas con ese token son las nuestras.
+    """
+    token = uuid.uuid4().hex
+    lease = now + timedelta(seconds=LEASE_SECONDS)
+    EmailOutbox.query.filter(
+        EmailOutbox.id.in_(ids),
+        EmailOutbox.status.in_(("pending", "sending")),
+        EmailOutbox.next_attempt_at <= now,
+    ).update({"status": "sending", "next_attempt_at": lease, "claim_token": token},
+             synchronize_session=False)
+    db.session.commit()
+    return (EmailOutbox.query
+            .filter(EmailOutbox.id.in_(ids), EmailOutbox.status == "sending",
+                    EmailOutbox.claim_token == token)
+            .order_by(EmailOutbox.id).all())
+
+
+def _mark_sent(row: EmailOutbox):
+    row.status = "sent"
+    row.claim_token = None
+    row.sent_at = datetime.utcnow()
+    row.last_error = None
+    row.html = row.text = row.params = None
+
+
+def _mark_failed(row: EmailOutbox, error, max_attempts: int):
+    row.last_error = str(error)[:2000]
+    row.claim_token = None
+    if row.attempts >= max_attempts:
+        row.status = "dead"
+        current_app.logger.error("[outbox] correo %s a %s descartado tras %d intentos: %s",
+                                 row.id, row.to_email, row.attempts, error)
+    else:
+        row.status = "pending"
+        row.next_attempt_at = datetime.utcnow() + _backoff(row.attempts)
+
+
+def _groups(rows):
+    """Agrupa por template (y tags) para enviar en bloque; los correos sin template van solos."""
+    grouped = {}
+    for row in rows:
+        if row.template_id:
+            key = (row.template_id, tuple(row.tags or ()))
+            grouped.setdefault(key, []).append(row)
+        else:
+            yield None, [row]
+    for key, group in grouped.items():
+        yield key, group
+
+
+def _is_rejected(error) -> bool:
+    """¿Error permanente del pedido (4xx de Brevo, destinatario rechazado por SMTP)?"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return True
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    return status is not None and 400 <= status < 500 and status != 429
+
+
+def _send_template_group(template_id, tags, group, max_attempts) -> int:
+    """
+    Envía un bloque con messageVersions. Ante un rechazo (4xx) lo parte en
+    mitades hasta aislar las filas inválidas; el resto se envía. Devuelve cuántas salieron.
+    """
+    try:
+        emailer.send_bulk_template(template_id, [
+            {"email": r.to_email, "name": r.to_name, "params": r.params} for r in group
+        ], tags=list(tags) or None)
+    except Exception as e:
+        if len(group) > 1 and _is_rejected(e):
+            mid = len(group) // 2
+            return (_send_template_group(template_id, tags, group[:mid], max_attempts)
+                    + _send_template_group(template_id, tags, group[mid:], max_attempts))
+        for row in group:
+            _mark_failed(row, e, max_attempts)
+        return 0
+    for row in group:
+        _mark_sent(row)
+    return len(group)
+
+
+def process_batch(limit: int = None) -> int:
+    """
+    Envía hasta `limit` correos vencidos. Los que comparten template salen en
+    bloques de messageVersions (una llamada cada BULK_MAX_VERSIONS).
+    Devuelve cuántos se enviaron.
+    """
+    limit = limit or int(current_app.config.get("EMAIL_OUTBOX_BATCH", 500))
+    max_attempts = int(current_app.config.get("EMAIL_OUTBOX_MAX_ATTEMPTS", 8))
+    now = datetime.utcnow()
+    due = [rid for (rid,) in db.session.query(EmailOutbox.id)
+           .filter(EmailOutbox.status.in_(("pending", "sending")), EmailOutbox.next_attempt_at <= now)
+           .order_by(EmailOutbox.next_attempt_at, EmailOutbox.id)
+           .limit(limit).all()]
+    if not due:
+        return 0
+    rows = _claim(due, now)
+
+    sent = 0
+    for key, group in _groups(rows):
+        for row in group:
+            row.attempts += 1
+        if key is not None:
+            template_id, tags = key
+            sent += _send_template_group(template_id, tags, group, max_attempts)
+        else:
+            row = group[0]  # sin template: uno por uno
+            try:
+                _deliver(row)
+            except Exception as e:
+                _mark_failed(row, e, max_attempts)
+            else:
+                _mark_sent(row)
+                sent += 1
+        db.session.commit()
+    return sent
+
+
+def retry_dead(row_id: int) -> bool:
+    """Vuelve a poner en cola un correo en dead letter. Hace commit."""
+    n = EmailOutbox.query.filter_by(id=row_id, status="dead").update(
+        {"status": "pending", "attempts": 0, "next_attempt_at": datetime.utcnow()},
+        synchronize_session=False)
+    db.session.commit()
+    return n == 1
+
+
+def init_app(app):
+    start_periodic(app, "email-outbox", app.config.get("EMAIL_OUTBOX_INTERVAL_SECONDS"), process_batch)
+
+    @app.cli.command("email-outbox-run")
+    @click.option("--limit", type=int, default=100)
+    def email_outbox_run_command(limit):
+        """Envía los correos pendientes del outbox."""
+        click.echo(f"Enviados: {process_batch(limit)}")
@@ -0,0 +1,145 @@
+# backend/app/passwords.py
+"""
+Hashing de contraseñas (Argon2) fuera del hilo del request.
+
+- Costo configurable: ARGON2_TIME_COST, ARGON2_MEMORY_COST (KiB), ARGON2_PARALLELISM.
+- PASSWORD_HASH_WORKERS procesos (0 = en el mismo hilo). El pool se crea
+  perezosamente en cada proceso (seguro con gunicorn --preload), arranca sus
+  procesos por forkserver (spawn donde no existe) en vez de fork, porque a
+  esa altura ya corren los hilos de fondo (los scripts que crean la app a nivel
+  de módulo deben ir bajo `if __name__ == "__main__"`), y un semáforo
+  limita cuántos hashes pueden estar en vuelo, así una ráfaga de logins espera
+  en vez de encolar trabajo sin límite.
+- verify_password() devuelve un hash nuevo cuando los parámetros cambiaron
+  (check_needs_rehash), para actualizarlo en el login.
+
+`flask password-bench` mide logins/seg para varios juegos de parámetros.
+"""
+import atexit
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from . import argon2_worker
+
+EXT_KEY = "password_hasher"
+
+
+def _mp_context():
+    """forkserver (precargando solo el worker) o spawn; nunca fork con hilos vivos."""
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context("forkserver")
+        ctx.set_forkserver_preload([argon2_worker.__name__])
+        return ctx
+    return multiprocessing.get_context("spawn")
+
+
+# ==========================
+#  Servicio
+# ==========================
+class HashingService:
+    def __init__(self, time_cost=3, memory_cost=65536, parallelism=4, workers=0):
+        self.params = tuple(sorted({
+            "time_cost": int(time_cost),
+            "memory_cost": int(memory_cost),
+            "parallelism": int(parallelism),
+        }.items()))
+        self.workers = int(workers)
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max(1, self.workers) * 2)
+
+    def _executor(self):
+        pid = os.getpid()
+        with self._lock:
+            if self._pool is None or self._pool_pid != pid:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=_mp_context())
+                self._pool_pid = pid
+            return self._pool
+
+    def _run(self, fn, *args):
+        if self.workers <= 0:
+            return fn(self.params, *args)
+        with self._slots:
+            return self._executor().submit(fn, self.params, *args).result()
+
+    def hash_password(self, password: str) -> str:
+        return self._run(argon2_worker.hash_password, password)
+
+    def verify_password(self, hash_value: str, password: str):
+        """(ok, hash_nuevo | None). Nunca lanza por hash inválido."""
+        if not hash_value or password is None:
+            return False, None
+        return self._run(argon2_worker.verify_password, hash_value, password)
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+def _service() -> HashingService:
+    return current_app.extensions[EXT_KEY]
+
+
+def hash_password(password: str) -> str:
+    return _service().hash_password(password)
+
+
+def verify_password(hash_value: str, password: str):
+    return _service().verify_password(hash_value, password)
+
+
+def init_app(app):
+    service = HashingService(
+        time_cost=app.config.get("ARGON2_TIME_COST", 3),
+        memory_cost=app.config.get("ARGON2_MEMORY_COST", 65536),
+        parallelism=app.config.get("ARGON2_PARALLELISM", 4),
+        workers=app.config.get("PASSWORD_HASH_WORKERS", 0),
+    )
+    app.extensions[EXT_KEY] = service
+    atexit.register(service.shutdown)
+    app.cli.add_command(password_bench_command)
+
+
+# ==========================
+#  Benchmark
+# ==========================
+BENCH_PRESETS = {
+    "bajo": (2, 19456, 1),      # mínimo recomendado por OWASP
+    "default": (3, 65536, 4),   # argon2-cffi por defecto
+    "alto": (4, 131072, 4),
+}
+
+
+@click.command("password-bench")
+@click.option("-n", "count", type=int, default=40, help="Logins por corrida.")
+@click.option("--concurrency", type=int, default=8, help="Hilos simulando requests.")
+@click.option("--workers", type=int, default=None, help="Procesos del pool (por defecto PASSWORD_HASH_WORKERS y 0).")
+@with_appcontext
+def password_bench_command(count, concurrency, workers):
+    """Logins/seg (verify de Argon2) por juego de parámetros, en línea y con pool de procesos."""
+    presets = dict(BENCH_PRESETS)
+    cfg = current_app.config
+    presets["config"] = (cfg.get("ARGON2_TIME_COST", 3), cfg.get("ARGON2_MEMORY_COST", 65536),
+                         cfg.get("ARGON2_PARALLELISM", 4))
+    worker_counts = [0, workers if workers is not None else (cfg.get("PASSWORD_HASH_WORKERS") or os.cpu_count() or 2)]
+    for label, (t, m, p) in presets.items():
+        for w in dict.fromkeys(worker_counts):
+            service = HashingService(t, m, p, workers=w)
+            stored = service.hash_password("Bench-Password-1!")
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                list(pool.map(lambda _: service.verify_password(stored, "Bench-Password-1!"), range(count)))
+            elapsed = time.perf_counter() - start
+            service.shutdown()
+            mode = f"pool={w}" if w else "en línea"
+            click.echo(f"{label:8s} t={t} m={m:6d}KiB p={p}  {mode:10s} {count / elapsed:7.1f} logins/s")
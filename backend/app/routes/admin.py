@@ -1,8 +1,9 @@
 # backend/app/routes/admin.py
 import json
 from flask import Blueprint, jsonify, request
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.models import db, User
+from app.models import db, User, EmailOutbox
+from app import lawyer_cache, metrics, outbox
+from app.authz import authorize, bump_token_version, bump_token_versions
 from app.emailer import (
     notify_lawyer_status,
     send_raw,
@@ -13,25 +14,12 @@ from app.emailer import (
 admin_bp = Blueprint("admin", __name__)
 
 
-def _require_admin():
-    uid_str = get_jwt_identity()
-    try:
-        uid = int(uid_str)
-    except (TypeError, ValueError):
-        return False
-    admin = User.query.get(uid)
-    return bool(admin and admin.role == "admin")
-
-
 # ---------------------------------------------------------------------
 # Lista de abogados aprobados (activos/inactivos)
 # ---------------------------------------------------------------------
 @admin_bp.route("/api/admin/abogados", methods=["GET"])
-@jwt_required()
+@authorize("admin")
 def get_abogados():
-    if not _require_admin():
-        return jsonify({"message": "Acceso no autorizado"}), 403
-
     abogados = User.query.filter_by(role="abogado", is_approved=True).all()
     return jsonify(
         [
@@ -52,40 +40,32 @@ def get_abogados():
 # Desactivar / Reactivar usuario
 # ---------------------------------------------------------------------
 @admin_bp.route("/api/admin/users/<int:user_id>/deactivate", methods=["POST"])
-@jwt_required()
+@authorize("admin")
 def deactivate_user(user_id):
-    if not _require_admin():
-        return jsonify({"message": "Acceso no autorizado"}), 403
-
     user_to_deactivate = User.query.get_or_404(user_id)
     user_to_deactivate.is_active = False
+    bump_token_version(user_to_deactivate)  # sus tokens dejan de valer
     db.session.commit()
+    lawyer_cache.invalidate(user_id)
     return jsonify({"message": "Usuario desactivado exitosamente"}), 200
 
 
 @admin_bp.route("/api/admin/users/<int:user_id>/reactivate", methods=["POST"])
-@jwt_required()
+@authorize("admin")
 def reactivate_user(user_id):
-    if not _require_admin():
-        return jsonify({"message": "Acceso no autorizado"}), 403
-
     user_to_reactivate = User.query.get_or_404(user_id)
     user_to_reactivate.is_active = True
+    bump_token_version(user_to_reactivate)
     db.session.commit()
+    lawyer_cache.invalidate(user_id)
     return jsonify({"message": "Usuario reactivado exitosamente"}), 200
 
 
 # ---------------------------------------------------------------------
-# Aprobar usuario -> dispara correo "Cuenta aprobada"
+# Cambios de estado compartidos por aprobación individual y en bloque
 # ---------------------------------------------------------------------
-@admin_bp.route("/api/admin/users/approve/<int:user_id>", methods=["POST"])
-@jwt_required()
-def admin_approve_user(user_id):
-    if not _require_admin():
-        return jsonify({"message": "Acceso no autorizado"}), 403
-
-    u = User.query.get_or_404(user_id)
-
+def _apply_approval(u, bump=True):
+    """Marca al usuario como aprobado (sin commit). bump=False: el llamador sube token_version en bloque."""
     # asegura email verificado
     try:
         u.email_verified = True
@@ -104,11 +84,47 @@ def admin_approve_user(user_id):
         u.recompute_approval()
     except Exception:
         u.is_approved = True
+    if bump:
+        bump_token_version(u)  # el claim "approved" cambió
 
-    db.session.commit()
 
-    # Email de notificación (no debe romper el flujo si falla)
-    email_result = notify_lawyer_status(u, approved=True, reason=None)
+def _apply_rejection(u, reason, bump=True):
+    """Marca al usuario como rechazado con motivo (sin commit). bump: como en _apply_approval."""
+    if u.role == "abogado":
+        try:
+            u.kyc_status = "rejected"
+        except Exception:
+            pass
+        try:
+            u.kyc_notes = reason
+        except Exception:
+            pass
+
+    try:
+        u.recompute_approval()
+    except Exception:
+        u.is_approved = False
+    if bump:
+        bump_token_version(u)
+
+
+# ---------------------------------------------------------------------
+# Aprobar usuario -> dispara correo "Cuenta aprobada"
+# ---------------------------------------------------------------------
+@admin_bp.route("/api/admin/users/approve/<int:user_id>", methods=["POST"])
+@authorize("admin")
+def admin_approve_user(user_id):
+    u = User.query.get_or_404(user_id)
+    _apply_approval(u)
+
+    # Email de notificación por outbox (misma transacción; el envío no bloquea)
+    queued = outbox.enqueue_lawyer_status(u, approved=True, reason=None)
+    db.session.commit()
+    lawyer_cache.invalidate(user_id)
+    email_result = {"ok": queued is not None, "queued": queued is not None,
+                    "outbox_id": queued.id if queued is not None else None}
+    if queued is None:
+        email_result["error"] = "template_id_missing"
 
     return (
         jsonify(
@@ -126,34 +142,21 @@ def admin_approve_user(user_id):
 # Rechazar usuario -> dispara correo "Cuenta rechazada" con motivo
 # ---------------------------------------------------------------------
 @admin_bp.route("/api/admin/users/reject/<int:user_id>", methods=["POST"])
-@jwt_required()
+@authorize("admin")
 def admin_reject_user(user_id):
-    if not _require_admin():
-        return jsonify({"message": "Acceso no autorizado"}), 403
-
     u = User.query.get_or_404(user_id)
     data = request.get_json(silent=True) or {}
     reason = (data.get("reason") or "").strip()
+    _apply_rejection(u, reason)
 
-    if u.role == "abogado":
-        try:
-            u.kyc_status = "rejected"
-        except Exception:
-            pass
-        try:
-            u.kyc_notes = reason
-        except Exception:
-            pass
-
-    try:
-        u.recompute_approval()
-    except Exception:
-        u.is_approved = False
-
+    # Email de notificación por outbox (misma transacción; el envío no bloquea)
+    queued = outbox.enqueue_lawyer_status(u, approved=False, reason=reason)
     db.session.commit()
-
-    # Email de notificación (no debe romper el flujo si falla)
-    email_result = notify_lawyer_status(u, approved=False, reason=reason)
+    lawyer_cache.invalidate(user_id)
+    email_result = {"ok": queued is not None, "queued": queued is not None,
+                    "outbox_id": queued.id if queued is not None else None}
+    if queued is None:
+        email_result["error"] = "template_id_missing"
 
     return (
         jsonify(
@@ -167,15 +170,78 @@ def admin_reject_user(user_id):
     )
 
 
+# ---------------------------------------------------------------------
+# Aprobar / rechazar en bloque -> correos agrupados (messageVersions)
+# ---------------------------------------------------------------------
+BULK_MAX_USERS = 1000
+
+
+def _bulk_ids(data):
+    ids = data.get("ids")
+    if not isinstance(ids, list) or not ids:
+        return None
+    try:
+        return sorted({int(i) for i in ids})
+    except (TypeError, ValueError):
+        return None
+
+
+def _bulk_moderate(approved: bool):
+    data = request.get_json(silent=True) or {}
+    ids = _bulk_ids(data)
+    if ids is None:
+        return jsonify({"message": "ids debe ser una lista de enteros"}), 400
+    if len(ids) > BULK_MAX_USERS:
+        return jsonify({"message": f"Máximo {BULK_MAX_USERS} usuarios por llamada"}), 400
+    reason = (data.get("reason") or "").strip()
+
+    found = User.query.filter(User.id.in_(ids)).all()
+    # Solo abogados: clientes y admins no pasan por moderación ni reciben "lawyer_status"
+    users = [u for u in found if u.role == "abogado"]
+    queued = 0
+    for u in users:
+        if approved:
+            _apply_approval(u, bump=False)
+        else:
+            _apply_rejection(u, reason, bump=False)
+        if outbox.enqueue_lawyer_status(u, approved=approved, reason=None if approved else reason) is not None:
+            queued += 1
+    updated = [u.id for u in users]
+    bump_token_versions(updated)  # un solo UPDATE para todos los claims "approved"
+    # Un solo commit: estados + outbox. El worker envía los correos en bloque.
+    db.session.commit()
+
+    lawyer_cache.invalidate(*updated)
+    found_ids = {u.id for u in found}
+    return jsonify({
+        "ok": True,
+        "updated": len(updated),
+        "queued_emails": queued,
+        "skipped_not_lawyer": sorted(u.id for u in found if u.role != "abogado"),
+        "not_found": [i for i in ids if i not in found_ids],
+    }), 200
+
+
+@admin_bp.route("/api/admin/users/bulk-approve", methods=["POST"])
+@authorize("admin")
+def admin_bulk_approve():
+    """Body: { ids: [..] } (solo abogados; el resto se reporta en skipped_not_lawyer)"""
+    return _bulk_moderate(approved=True)
+
+
+@admin_bp.route("/api/admin/users/bulk-reject", methods=["POST"])
+@authorize("admin")
+def admin_bulk_reject():
+    """Body: { ids: [..], reason }"""
+    return _bulk_moderate(approved=False)
+
+
 # ---------------------------------------------------------------------
 # Endpoint de PRUEBA con template (sin tocar estados)
 # ---------------------------------------------------------------------
 @admin_bp.route("/api/admin/test-email", methods=["POST"])
-@jwt_required()
+@authorize("admin")
 def admin_test_email():
-    if not _require_admin():
-        return jsonify({"message": "Acceso no autorizado"}), 403
-
     data = request.get_json(silent=True) or {}
     email = (data.get("email") or "").strip()
     approved = bool(data.get("approved", True))
@@ -200,11 +266,8 @@ def admin_test_email():
 # Endpoint de PRUEBA RAW (sin template) para descartar problemas de plantilla
 # ---------------------------------------------------------------------
 @admin_bp.route("/api/admin/test-email-raw", methods=["POST"])
-@jwt_required()
+@authorize("admin")
 def admin_test_email_raw():
-    if not _require_admin():
-        return jsonify({"message": "Acceso no autorizado"}), 403
-
     data = request.get_json(silent=True) or {}
     email = (data.get("email") or "").strip()
     subject = (data.get("subject") or "Prueba RAW AbogApp").strip()
@@ -221,15 +284,65 @@ def admin_test_email_raw():
         return jsonify({"ok": False, "error": str(e)}), 500
 
 
+# ---------------------------------------------------------------------
+# Outbox de correos: dead letters y reintento manual
+# ---------------------------------------------------------------------
+@admin_bp.route("/api/admin/email-outbox", methods=["GET"])
+@authorize("admin")
+def admin_email_outbox():
+    status = request.args.get("status", "dead")
+    limit = max(1, min(200, request.args.get("limit", 50, type=int)))
+    rows = (EmailOutbox.query.filter_by(status=status)
+            .order_by(EmailOutbox.id.desc()).limit(limit).all())
+    counts = dict(db.session.query(EmailOutbox.status, db.func.count(EmailOutbox.id))
+                  .group_by(EmailOutbox.status).all())
+    return jsonify({
+        "counts": counts,
+        "items": [
+            {
+                "id": r.id,
+                "to_email": r.to_email,
+                "subject": r.subject,
+                "template_id": r.template_id,
+                "tags": r.tags,
+                "status": r.status,
+                "attempts": r.attempts,
+                "last_error": r.last_error,
+                "created_at": r.created_at.isoformat() if r.created_at else None,
+                "sent_at": r.sent_at.isoformat() if r.sent_at else None,
+            }
+            for r in rows
+        ],
+    }), 200
+
+
+@admin_bp.route("/api/admin/email-outbox/<int:outbox_id>/retry", methods=["POST"])
+@authorize("admin")
+def admin_email_outbox_retry(outbox_id):
+    if not outbox.retry_dead(outbox_id):
+        return jsonify({"message": "Correo no encontrado o no está en dead letter"}), 404
+    return jsonify({"ok": True}), 200
+
+
+# ---------------------------------------------------------------------
+# Métricas en memoria de este proceso (correo, etc.)
+# ---------------------------------------------------------------------
+@admin_bp.route("/api/admin/metrics", methods=["GET"])
+@authorize("admin")
+def admin_metrics():
+    """Query: prefix (ej. 'email_') para filtrar."""
+    snap = metrics.snapshot(request.args.get("prefix") or None)
+    snap["outbox"] = dict(db.session.query(EmailOutbox.status, db.func.count(EmailOutbox.id))
+                          .group_by(EmailOutbox.status).all())
+    return jsonify(snap), 200
+
+
 # ---------------------------------------------------------------------
 # Debug de configuración Brevo + ping a /v3/account
 # ---------------------------------------------------------------------
 @admin_bp.route("/api/admin/brevo/debug", methods=["GET"])
-@jwt_required()
+@authorize("admin")
 def admin_brevo_debug():
-    if not _require_admin():
-        return jsonify({"message": "Acceso no autorizado"}), 403
-
     summary = brevo_debug_summary()
     try:
         account = brevo_account()
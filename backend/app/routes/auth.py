@@ -1,44 +1,16 @@
 import os
 import re
 import secrets
-from datetime import datetime, timedelta
+from datetime import datetime
 
 from flask import Blueprint, request, jsonify, current_app
 from app.models import db, User
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
-from argon2 import PasswordHasher
-from argon2.exceptions import VerifyMismatchError
-from stream_chat import StreamChat
-
-# Brevo SDK directo para códigos al usuario
-import sib_api_v3_sdk
-from sib_api_v3_sdk.rest import ApiException
-
-# Reutilizamos tu emailer para notificar a abogados
-from app.emailer import send_raw  # usamos envío crudo reutilizable
+from app import emailer, otp, outbox, passwords, search, stream_client, stream_sync
+from app.specialties import sync_lawyer_specialties
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from app.authz import access_token_for, authorize
 
 auth_bp = Blueprint('auth', __name__)
-ph = PasswordHasher()
-
-def send_email_via_brevo(to_email: str, subject: str, html: str, sender_email=None, sender_name=None) -> bool:
-    api_key = os.getenv("BREVO_API_KEY")
-    if not api_key:
-        print("[Brevo] Falta BREVO_API_KEY")
-        return False
-    configuration = sib_api_v3_sdk.Configuration()
-    configuration.api_key['api-key'] = api_key
-    api = sib_api_v3_sdk.TransactionalEmailsApi(sib_api_v3_sdk.ApiClient(configuration))
-    sender = {
-        "email": sender_email or os.getenv("SENDER_EMAIL", "no-reply@abogapp.local"),
-        "name": sender_name or os.getenv("APP_NAME", "AbogApp"),
-    }
-    email = sib_api_v3_sdk.SendSmtpEmail(sender=sender, to=[{"email": to_email}], subject=subject, html_content=html)
-    try:
-        api.send_transac_email(email)
-        return True
-    except ApiException as e:
-        print("[Brevo] Error enviando email", getattr(e, "status", None), getattr(e, "reason", None))
-        return False
 
 def validar_password_fuerte(password):
     if len(password) < 8:
@@ -60,15 +32,6 @@ def validar_email(email):
 def gen_6_digit_code() -> str:
     return f"{secrets.randbelow(1_000_000):06d}"
 
-def hash_code(code: str) -> str:
-    return ph.hash(code)
-
-def verify_code_hash(code: str, hash_value: str) -> bool:
-    try:
-        return ph.verify(hash_value, code)
-    except VerifyMismatchError:
-        return False
-
 def _find_assigned_lawyer_for(user: User):
     """
     Intenta resolver el abogado asignado a un cliente.
@@ -122,7 +85,7 @@ def register():
     if User.query.filter_by(email=email).first():
         return jsonify({'message': 'Este correo electrónico ya está registrado.'}), 400
 
-    hashed_password = ph.hash(password)
+    hashed_password = passwords.hash_password(password)
 
     new_user = User(
         email=email,
@@ -137,15 +100,14 @@ def register():
     )
     new_user.recompute_approval()
     db.session.add(new_user)
+    db.session.flush()
+    search.index_lawyer(new_user)
+    sync_lawyer_specialties(new_user)
     db.session.commit()
 
     # GetStream (best-effort)
     try:
-        stream_client = StreamChat(
-            api_key=current_app.config['STREAM_API_KEY'],
-            api_secret=current_app.config['STREAM_API_SECRET']
-        )
-        stream_client.upsert_user({
+        stream_sync.upsert_user({
             "id": str(new_user.id),
             "name": f"{new_user.nombres} {new_user.apellidos}",
             "role": new_user.role
@@ -165,38 +127,17 @@ def register():
             'needsVerification': False
         }), 201
 
-    # Envío de código de verificación
-    try:
-        code = gen_6_digit_code()
-        new_user.email_verified = False
-        new_user.email_verif_code_hash = hash_code(code)
-        new_user.email_verif_expires = datetime.utcnow() + timedelta(minutes=10)
-        new_user.recompute_approval()
-        db.session.commit()
+    # Código de verificación: el correo sale por el outbox (no bloquea el registro)
+    code = gen_6_digit_code()
+    new_user.email_verified = False
+    new_user.email_verif_code_hash = None
+    new_user.email_verif_expires, _ = otp.issue(new_user, otp.VERIFY_EMAIL, code, enforce_cooldown=False)
+    new_user.recompute_approval()
 
-        html = f"""
-        <h2>Verificación de correo - AbogApp</h2>
-        <p>Hola {new_user.nombres} {new_user.apellidos},</p>
-        <p>Usa este código para verificar tu correo:</p>
-        <p style="font-size:24px;font-weight:bold;letter-spacing:3px">{code}</p>
-        <p>El código expira en 10 minutos.</p>
-        """
-        send_ok = send_email_via_brevo(
-            to_email=new_user.email,
-            subject="Verifica tu correo",
-            html=html
-        )
-        if not send_ok:
-            return jsonify({
-                'message': 'Usuario registrado. No pudimos enviar el código, intenta reenviarlo.',
-                'needsVerification': True
-            }), 202
-    except Exception as e:
-        print(f"[Verificación] Error enviando código: {e}")
-        return jsonify({
-            'message': 'Usuario registrado. Ocurrió un problema enviando el código.',
-            'needsVerification': True
-        }), 202
+    msg = emailer.render("verify_email", nombres=new_user.nombres, apellidos=new_user.apellidos, code=code,
+                          ttl_minutes=otp.ttl_minutes())
+    outbox.enqueue_raw(new_user.email, msg["subject"], html=msg["html"], tags=["verify_email"])
+    db.session.commit()
 
     msg_registro = 'Registro exitoso. Revisa tu correo para el código de verificación.'
     if role == 'abogado':
@@ -216,7 +157,7 @@ def verify_email():
 
     # Si ya está verificado, de todos modos emitimos token para que pueda ir a /abogado/kyc
     if user.email_verified:
-        access_token = create_access_token(identity=str(user.id))
+        access_token = access_token_for(user)
         return jsonify({
             "message": "Email ya verificado",
             "access_token": access_token,
@@ -229,10 +170,13 @@ def verify_email():
             }
         }), 200
 
-    # Validaciones
-    if not user.email_verif_expires or datetime.utcnow() > user.email_verif_expires:
+    # Validaciones (HMAC + contador de intentos)
+    result = otp.verify(user, otp.VERIFY_EMAIL, code)
+    if result == otp.LOCKED:
+        return jsonify({"message": "Demasiados intentos. Solicita un nuevo código más tarde."}), 429
+    if result == otp.EXPIRED:
         return jsonify({"message": "Código expirado"}), 400
-    if not user.email_verif_code_hash or not verify_code_hash(code, user.email_verif_code_hash):
+    if result != otp.OK:
         return jsonify({"message": "Código inválido"}), 400
 
     # Marca verificado y recalcula aprobación
@@ -243,42 +187,22 @@ def verify_email():
     user.recompute_approval()
     db.session.commit()
 
-    # === NUEVO: Notificar al abogado asignado si el usuario es CLIENTE ===
+    # === NUEVO: Notificar al abogado asignado si el usuario es CLIENTE (vía outbox) ===
     try:
         if user.role == "cliente":
             abogado = _find_assigned_lawyer_for(user)
             if abogado:
-                subject = "Tu cliente acaba de verificar su correo ✅"
-                text = (
-                    f"Hola {abogado.nombres or 'abogado'},\n\n"
-                    f"El cliente {user.nombres} {user.apellidos} ({user.email}) "
-                    f"acaba de verificar su correo en AbogApp.\n\n"
-                    "Ya puedes continuar con la coordinación de su caso o agendar la reunión.\n\n"
-                    "— AbogApp"
-                )
-                html = f"""
-                <p>Hola {abogado.nombres or 'abogado'},</p>
-                <p>El cliente <strong>{user.nombres} {user.apellidos}</strong> ({user.email})
-                acaba de verificar su correo en <strong>AbogApp</strong>.</p>
-                <p>Ya puedes continuar con la coordinación de su caso o agendar la reunión.</p>
-                <p>— AbogApp</p>
-                """
-                # Usamos el helper centralizado (app.emailer.send_raw)
-                try:
-                    send_raw(
-                        to_email=abogado.email,
-                        subject=subject,
-                        text=text,
-                        html=html,
-                        tags=["client_verified"]
-                    )
-                except Exception as e:
-                    current_app.logger.warning(f"[verify-email] fallo al enviar notificación al abogado: {e}")
+                msg = emailer.render("client_verified", abogado=abogado.nombres, nombres=user.nombres,
+                                     apellidos=user.apellidos, email=user.email)
+                outbox.enqueue_raw(abogado.email, msg["subject"], html=msg["html"], text=msg["text"],
+                                   tags=["client_verified"])
+                db.session.commit()
     except Exception as e:
+        db.session.rollback()
         current_app.logger.exception(f"[verify-email] error notificando al abogado: {e}")
 
     # Emite token para poder llamar /api/kyc/* inmediatamente
-    access_token = create_access_token(identity=str(user.id))
+    access_token = access_token_for(user)
 
     return jsonify({
         "message": "Email verificado",
@@ -304,21 +228,16 @@ def resend_verification():
         return jsonify({"message": "Email ya verificado"}), 200
 
     code = gen_6_digit_code()
-    user.email_verif_code_hash = hash_code(code)
-    user.email_verif_expires = datetime.utcnow() + timedelta(minutes=10)
-    db.session.commit()
+    expires_at, retry_after = otp.issue(user, otp.VERIFY_EMAIL, code)
+    if expires_at is None:
+        resp = jsonify({"message": "Espera antes de pedir otro código.", "retry_after": retry_after})
+        return resp, 429, {"Retry-After": str(retry_after)}
+    user.email_verif_code_hash = None
+    user.email_verif_expires = expires_at
 
-    html = f"""
-    <h2>Tu nuevo código</h2>
-    <p>Usa este código para verificar tu correo:</p>
-    <p style="font-size:24px;font-weight:bold;letter-spacing:3px">{code}</p>
-    <p>El código expira en 10 minutos.</p>
-    """
-    send_email_via_brevo(
-        to_email=user.email,
-        subject="Nuevo código de verificación",
-        html=html
-    )
+    msg = emailer.render("verify_email_resend", code=code, ttl_minutes=otp.ttl_minutes())
+    outbox.enqueue_raw(user.email, msg["subject"], html=msg["html"], tags=["verify_email"])
+    db.session.commit()
     return jsonify({"message": "Código reenviado"}), 200
 
 # ========== LOGIN ==========
@@ -339,9 +258,13 @@ def login():
         if user.role != 'admin' and not user.email_verified:
             return jsonify({'message': 'Debes verificar tu email.', 'code': 'EMAIL_NOT_VERIFIED'}), 403
 
-        try:
-            ph.verify(user.password, password)
-            access_token = create_access_token(identity=str(user.id))
+        ok, new_hash = passwords.verify_password(user.password, password)
+        if ok:
+            if new_hash:
+                # Cambiaron los parámetros de Argon2: se guarda el hash actualizado
+                user.password = new_hash
+                db.session.commit()
+            access_token = access_token_for(user)
             # Nota: no bloqueamos aquí por is_approved; el frontend redirige a /abogado/kyc si aplica
             return jsonify({
                 'message': 'Login exitoso',
@@ -355,19 +278,13 @@ def login():
                     'is_approved': user.is_approved
                 }
             }), 200
-        except VerifyMismatchError:
-            pass
 
     return jsonify({'message': 'Credenciales incorrectas.'}), 401
 
 # ========== PENDIENTES (para panel) ==========
 @auth_bp.route('/api/abogados/pendientes', methods=['GET'])
-@jwt_required()
+@authorize('admin', 'backoffice')
 def listar_abogados_pendientes():
-    user_id = int(get_jwt_identity())
-    current_user = User.query.get(user_id)
-    if not current_user or current_user.role not in ['admin', 'backoffice']:
-        return jsonify({'message': 'Acceso no autorizado'}), 403
     pendientes = User.query.filter_by(role='abogado').filter(User.is_approved == False).all()  # noqa: E712
     return jsonify([{
         'id': ab.id,
@@ -392,11 +309,7 @@ def get_stream_token():
     if not user_id:
         return jsonify({"message": "Identidad de usuario no encontrada en el token"}), 400
     try:
-        stream_client = StreamChat(
-            api_key=current_app.config['STREAM_API_KEY'],
-            api_secret=current_app.config['STREAM_API_SECRET']
-        )
-        token = stream_client.create_token(str(user_id))
+        token = stream_client.user_token(user_id)
         user = User.query.get(int(user_id)) if str(user_id).isdigit() else None
         name = f"{user.nombres} {user.apellidos}" if user else None
         image = None
@@ -422,13 +335,10 @@ def stream_upsert_user():
     target_id = str(target_id)
     name = data.get("name") or f"user_{target_id}"
     image = data.get("image")
-    api_key = current_app.config["STREAM_API_KEY"]
-    api_secret = current_app.config["STREAM_API_SECRET"]
-    if not api_key or not api_secret:
+    if stream_client.get_client() is None:
         return jsonify({"message": "Faltan STREAM_API_KEY/STREAM_API_SECRET"}), 500
-    client = StreamChat(api_key=api_key, api_secret=api_secret)
     user_payload = {"id": target_id, "name": name}
     if image:
         user_payload["image"] = image
-    client.upsert_user(user_payload)
+    stream_sync.upsert_user(user_payload, ensure_exists=True)
     return jsonify({"ok": True}), 200
\ No newline at end of file
@@ -1,10 +1,9 @@
 # backend/app/routes/chat.py
-import os
-from flask import Blueprint, jsonify, request, current_app
+from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from stream_chat import StreamChat
 from sqlalchemy.exc import IntegrityError
 from app.models import db, User
+from app import avatars, stream_client, stream_sync
 
 # ⚠️ Este blueprint YA incluye el prefijo '/api/chat'
 chat_bp = Blueprint('chat', __name__, url_prefix='/api/chat')
@@ -26,33 +25,18 @@ def _get_identity_user_id():
     return int(identity)
 
 def get_stream_client():
-    api_key = os.environ.get("STREAM_API_KEY") or current_app.config.get("STREAM_API_KEY")
-    api_secret = os.environ.get("STREAM_API_SECRET") or current_app.config.get("STREAM_API_SECRET")
-    if not api_key or not api_secret:
+    """Cliente compartido (ver app/stream_client.py)."""
+    client = stream_client.get_client()
+    if client is None:
         raise RuntimeError("STREAM_API_KEY/STREAM_API_SECRET no configurados")
-    return StreamChat(api_key=api_key, api_secret=api_secret)
-
-def _uploads_dir():
-    # .../backend/app/routes/chat.py -> .../backend/uploads
-    return os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'uploads'))
-
-def _find_avatar_filename(user_id: int):
-    """Busca un archivo user_<id>.(webp|jpg|jpeg|png) en /uploads."""
-    base = _uploads_dir()
-    for ext in ('webp', 'jpg', 'jpeg', 'png'):
-        fname = f"user_{user_id}.{ext}"
-        if os.path.exists(os.path.join(base, fname)):
-            return fname
-    return None
-
-def _build_avatar_url(user_id: int):
+    return client
+
+def _build_avatar_url(user_id: int, user=None):
     """
     Devuelve URL ABSOLUTA a la foto si existe. Ej: http://localhost:5001/uploads/user_7.webp
+    Sale de User.profile_picture_url (cacheado en app/avatars.py, sin tocar el disco).
     """
-    fname = _find_avatar_filename(user_id)
-    if not fname:
-        return None
-    return f"{request.host_url.rstrip('/')}/uploads/{fname}"
+    return avatars.absolute_url(user_id, request.host_url, user=user)
 
 # ---------- Health / debug ----------
 @chat_bp.route('/health', methods=['GET'])
@@ -72,23 +56,22 @@ def get_token():
     if not user:
         return jsonify({"message": "Usuario no encontrado"}), 404
 
-    client = get_stream_client()
+    get_stream_client()  # falla temprano si faltan credenciales
 
     # Construir name e image
     name = f"{(user.nombres or '').strip()} {(user.apellidos or '').strip()}".strip() or (user.email or f"user_{uid}")
-    image_url = _build_avatar_url(uid)
+    image_url = _build_avatar_url(uid, user)
 
     stream_user = {"id": str(uid), "name": name}
     if image_url:
         stream_user["image"] = image_url
 
-    # Upsert del usuario en Stream
-    client.upsert_user(stream_user)
+    # Upsert del usuario en Stream: en cola y solo si name/image cambiaron
+    stream_sync.upsert_user(stream_user)
 
-    # Crear token de conexión
-    token = client.create_token(str(uid))
-    api_key = os.environ.get("STREAM_API_KEY") or current_app.config.get("STREAM_API_KEY")
-    return jsonify({"apiKey": api_key, "token": token, "user": stream_user}), 200
+    # Token de conexión (cacheado mientras siga vigente)
+    token = stream_client.user_token(uid)
+    return jsonify({"apiKey": stream_client.api_key(), "token": token, "user": stream_user}), 200
 
 # ---------- Asegurar/Upsert de cualquier usuario (para DMs) ----------
 @chat_bp.route('/users/ensure/<int:user_id>', methods=['POST', 'GET'])
@@ -102,15 +85,15 @@ def ensure_stream_user(user_id):
     if not u:
         return jsonify({"message": "Usuario no encontrado"}), 404
 
-    client = get_stream_client()
+    get_stream_client()  # falla temprano si faltan credenciales
     name = f"{(u.nombres or '').strip()} {(u.apellidos or '').strip()}".strip() or (u.email or f"user_{user_id}")
-    image_url = _build_avatar_url(u.id)
+    image_url = _build_avatar_url(u.id, u)
 
     stream_user = {"id": str(u.id), "name": name}
     if image_url:
         stream_user["image"] = image_url
 
-    client.upsert_user(stream_user)
+    stream_sync.upsert_user(stream_user, ensure_exists=True)
     return jsonify({"ensured": True, "user": stream_user}), 200
 
 # ---------- Archivado: listar ----------
@@ -3,6 +3,8 @@ from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from sqlalchemy.exc import IntegrityError
 from app.models import db, User, Favorite
+from app import cursors
+from app.lawyer_cache import PROFILE_FIELDS
 
 favorites_bp = Blueprint('favorites', __name__)
 
@@ -10,18 +12,6 @@ def _uid():
     ident = get_jwt_identity()
     return int(ident.get("id") if isinstance(ident, dict) else ident)
 
-def _lawyer_dict(u: User):
-    return {
-        "id": u.id,
-        "nombres": u.nombres,
-        "apellidos": u.apellidos,
-        "especialidad": u.especialidad,
-        "about_me": u.about_me,
-        "titles": u.titles,
-        "profile_picture_url": u.profile_picture_url,
-        "consultation_price": u.consultation_price,
-    }
-
 # ---- Health (para verificar registro de rutas) ----
 @favorites_bp.route("/favorites/health", methods=["GET"])
 @favorites_bp.route("/favoritos/health", methods=["GET"])
@@ -37,9 +27,15 @@ def health():
 @favorites_bp.route("/api/favoritos/ids", methods=["GET"])
 @jwt_required()
 def get_favorite_ids():
+    """Con If-None-Match responde 304 si la lista no cambió (ETag fuerte sobre el cuerpo)."""
     uid = _uid()
-    rows = Favorite.query.filter_by(user_id=uid).all()
-    return jsonify({"ids": [r.lawyer_id for r in rows]}), 200
+    rows = (db.session.query(Favorite.lawyer_id)
+            .filter(Favorite.user_id == uid)
+            .order_by(Favorite.created_at, Favorite.id).all())
+    resp = jsonify({"ids": [lawyer_id for (lawyer_id,) in rows]})
+    resp.headers["Cache-Control"] = "private, no-cache"
+    resp.add_etag()
+    return resp.make_conditional(request)
 
 # ---- GET: listado de abogados favoritos ----
 @favorites_bp.route("/favorites", methods=["GET"])
@@ -48,14 +44,44 @@ def get_favorite_ids():
 @favorites_bp.route("/api/favoritos", methods=["GET"])
 @jwt_required()
 def get_favorites():
+    """
+    Abogados favoritos en orden de guardado, en una sola consulta (favorite JOIN user).
+    Query opcional:
+      - limit:  tamaño de página (máx. 200). Sin limit devuelve todo.
+      - cursor: valor de X-Next-Cursor de la página anterior.
+    """
     uid = _uid()
-    ids = [r.lawyer_id for r in Favorite.query.filter_by(user_id=uid).all()]
-    if not ids:
-        return jsonify([]), 200
-    lawyers = User.query.filter(User.id.in_(ids)).all()
-    # mantener el orden de guardado aproximado
-    lawyers_sorted = sorted(lawyers, key=lambda x: ids.index(x.id))
-    return jsonify([_lawyer_dict(l) for l in lawyers_sorted]), 200
+    q = (db.session.query(Favorite.id, Favorite.created_at, *(getattr(User, f) for f in PROFILE_FIELDS))
+         .join(User, User.id == Favorite.lawyer_id)
+         .filter(Favorite.user_id == uid))
+    try:
+        cursor = request.args.get("cursor")
+        if cursor:
+            c_created, c_id = cursors.decode_datetime(cursor)
+            q = q.filter(db.or_(
+                Favorite.created_at > c_created,
+                db.and_(Favorite.created_at == c_created, Favorite.id > c_id),
+            ))
+        limit = request.args.get("limit", type=int)
+    except ValueError:
+        return jsonify({"message": "Parámetros de paginación inválidos"}), 400
+
+    # Orden de guardado: (created_at, id) ascendente, servido por ix_favorite_user_created
+    q = q.order_by(Favorite.created_at, Favorite.id)
+    next_cursor = None
+    if limit:
+        limit = max(1, min(200, limit))
+        rows = q.limit(limit + 1).all()
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = cursors.encode(rows[-1][1], rows[-1][0])  # (favorite.created_at, favorite.id)
+    else:
+        rows = q.all()
+
+    resp = jsonify([{f: row[i + 2] for i, f in enumerate(PROFILE_FIELDS)} for row in rows])
+    if next_cursor:
+        resp.headers["X-Next-Cursor"] = next_cursor
+    return resp, 200
 
 # ---- POST: añadir favorito ----
 @favorites_bp.route("/favorites/<int:lawyer_id>", methods=["POST"])
@@ -5,6 +5,8 @@ from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from werkzeug.utils import secure_filename
 from ..models import db, User
+from ..authz import authorize, bump_token_version
+from .. import lawyer_cache
 
 kyc_bp = Blueprint("kyc", __name__, url_prefix="/api/kyc")
 
@@ -89,11 +91,8 @@ def kyc_submit():
 
 # Acciones admin unificadas: cuando admin aprueba KYC, se recalcula aprobación final
 @kyc_bp.route("/approve/<int:user_id>", methods=["POST"])
-@jwt_required()
+@authorize("admin", deny=({"error": "Solo admin"}, 403))
 def kyc_approve(user_id):
-    admin = User.query.get(int(get_jwt_identity()))
-    if not admin or admin.role != "admin":
-        return jsonify({"error": "Solo admin"}), 403
     u = User.query.get_or_404(user_id)
     if u.role != "abogado":
         return jsonify({"error": "Solo aplica a abogados"}), 400
@@ -108,15 +107,14 @@ def kyc_approve(user_id):
     u.kyc_doc_back_url = None
     u.kyc_selfie_url = None
     u.recompute_approval()
+    bump_token_version(u)  # el claim "approved" cambió
     db.session.commit()
+    lawyer_cache.invalidate(user_id)
     return jsonify({"ok": True, "is_approved": u.is_approved}), 200
 
 @kyc_bp.route("/reject/<int:user_id>", methods=["POST"])
-@jwt_required()
+@authorize("admin", deny=({"error": "Solo admin"}, 403))
 def kyc_reject(user_id):
-    admin = User.query.get(int(get_jwt_identity()))
-    if not admin or admin.role != "admin":
-        return jsonify({"error": "Solo admin"}), 403
     reason = (request.json or {}).get("reason", "")
     u = User.query.get_or_404(user_id)
     if u.role != "abogado":
@@ -132,5 +130,7 @@ def kyc_reject(user_id):
     u.kyc_doc_back_url = None
     u.kyc_selfie_url = None
     u.recompute_approval()
+    bump_token_version(u)  # el claim "approved" cambió
     db.session.commit()
+    lawyer_cache.invalidate(user_id)
     return jsonify({"ok": True, "is_approved": u.is_approved}), 200
\ No newline at end of file
@@ -1,10 +1,11 @@
 import os
-from flask import Blueprint, jsonify, request, send_from_directory
-from app.models import db, User, Availability, LawyerGalleryImage, LawyerIntroVideo
+from flask import Blueprint, current_app, jsonify, request, send_from_directory
+from app.models import db, User, LawyerGalleryImage, LawyerIntroVideo, Specialty, LawyerSpecialty
+from app import search
+from app.specialties import STATIC_SPECIALTIES, sync_lawyer_specialties
+from app import availability, avatars, cursors, lawyer_cache, uploads
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from werkzeug.utils import secure_filename
 from datetime import datetime
-import re
 
 lawyers_bp = Blueprint('lawyers', __name__)
 
@@ -16,115 +17,44 @@ def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
-# ==========================
-#  Normalización de horarios
-# ==========================
-_HHMM_AMPM_RE = re.compile(r'^\s*(\d{1,2})(?::(\d{2}))?\s*([ap]m)\s*$', re.IGNORECASE)
-_HHMM_24H_RE = re.compile(r'^\s*(\d{1,2}):(\d{2})(?::\d{2})?\s*$')
-
-
-def _parse_time_components(s):
-    if not s:
-        return (0, 0)
-    raw = str(s).strip().lower()
-    m = _HHMM_AMPM_RE.match(raw)
-    if m:
-        hh = int(m.group(1))
-        mi = int(m.group(2) or 0)
-        ap = m.group(3)
-        if ap == 'am':
-            if hh == 12:
-                hh = 0
-        else:
-            if hh < 12:
-                hh += 12
-        return (hh, mi)
-    m = _HHMM_24H_RE.match(raw)
-    if m:
-        return (int(m.group(1)), int(m.group(2)))
-    return (0, 0)
-
-
-def _canonical_slot_str(s):
-    h24, mi = _parse_time_components(s)
-    ampm = "AM" if h24 < 12 else "PM"
-    h12 = h24 % 12 or 12
-    return f"{h12}:{mi:02d} {ampm}"
-
-
-def _slot_minutes(s) -> int:
-    h, m = _parse_time_components(s)
-    return h * 60 + m
-
-
-def _normalize_slots_list(slots):
-    if not isinstance(slots, list):
-        return []
-    canon = {_canonical_slot_str(x) for x in slots if x}
-    return sorted(canon, key=_slot_minutes)
-
-
 # ==========================
 #  ESPECIALIDADES
 # ==========================
 # 1) Estático (igual a la web) – fuente estable para clientes
-STATIC_SPECIALTIES = [
-    "Laboral", "Familia", "Migratorio", "Penal", "Civil", "Mercantil", "Administrativo",
-]
-
-
 @lawyers_bp.route('/api/specialties', methods=['GET'])
 def specialties_static():
     """Lista fija para clientes (mobile/web)."""
     return jsonify(STATIC_SPECIALTIES), 200
 
 
-# 2) Dinámico (derivado de la DB, como venías usando)
-def _unique_case_preserving(names):
-    seen = set()
-    out = []
-    for n in names or []:
-        key = (n or "").strip()
-        if not key:
-            continue
-        low = key.lower()
-        if low in seen:
-            continue
-        seen.add(low)
-        out.append(key)
-    return sorted(out, key=lambda s: s.lower())
-
-
+# 2) Dinámico (especialidades con al menos un abogado, desde la taxonomía)
 @lawyers_bp.route('/api/lawyers/specialties', methods=['GET'])
 def specialties_from_db():
-    """Lista construida a partir de User.especialidad (abogados) en la DB."""
-    try:
-        rows = db.session.query(User.especialidad).filter(User.role == 'abogado').all()
-        tokens = []
-        for (raw,) in rows:
-            if not raw:
-                continue
-            for part in re.split(r'[,/;|]', str(raw)):
-                name = part.strip()
-                if name:
-                    tokens.append(name)
-        return jsonify(_unique_case_preserving(tokens)), 200
-    except Exception:
-        return jsonify([]), 200
+    """Lista construida a partir de la asociación abogado <-> especialidad."""
+    rows = (db.session.query(Specialty.name)
+            .join(LawyerSpecialty, LawyerSpecialty.specialty_id == Specialty.id)
+            .distinct().all())
+    return jsonify(sorted((name for (name,) in rows), key=lambda s: s.lower())), 200
+
+
+@lawyers_bp.route('/api/lawyers/specialties/counts', methods=['GET'])
+def specialties_counts():
+    """[{name, slug, count}] con el número de abogados aprobados y activos por especialidad."""
+    rows = (db.session.query(Specialty.name, Specialty.slug, db.func.count(LawyerSpecialty.lawyer_id))
+            .join(LawyerSpecialty, LawyerSpecialty.specialty_id == Specialty.id)
+            .join(User, User.id == LawyerSpecialty.lawyer_id)
+            .filter(User.is_approved.is_(True), User.is_active.is_(True))
+            .group_by(Specialty.id, Specialty.name, Specialty.slug)
+            .all())
+    out = [{'name': name, 'slug': slug, 'count': int(count)} for name, slug, count in rows]
+    return jsonify(sorted(out, key=lambda x: x['name'].lower())), 200
 
 
 # ==========================
 #  Resto de endpoints
 # ==========================
-@lawyers_bp.route('/api/abogados/<especialidad>', methods=['GET'])
-def get_abogados_por_especialidad(especialidad):
-    abogados = User.query.filter(
-        User.role == 'abogado',
-        User.is_approved.is_(True),
-        User.is_active.is_(True),
-        User.especialidad.ilike(f'%{especialidad}%')
-    ).all()
-    lista_abogados = [{
+def _lawyer_card(abogado):
+    return {
         'id': abogado.id,
         'nombres': abogado.nombres,
         'apellidos': abogado.apellidos,
@@ -132,8 +62,95 @@ def get_abogados_por_especialidad(especialidad):
         'about_me': abogado.about_me,
         'profile_picture_url': abogado.profile_picture_url,
         'consultation_price': abogado.consultation_price
-    } for abogado in abogados]
-    return jsonify(lista_abogados), 200
+    }
+
+
+@lawyers_bp.route('/api/abogados/buscar', methods=['GET'])
+def buscar_abogados():
+    """
+    Búsqueda full-text de abogados aprobados.
+    Query: q, especialidad, min_price, max_price, min_rating,
+           sort (relevance|rating|price_asc|price_desc), limit (máx. 50), cursor.
+    """
+    args = request.args
+    try:
+        min_price = args.get('min_price', type=float)
+        max_price = args.get('max_price', type=float)
+        min_rating = args.get('min_rating', type=float)
+        limit = max(1, min(50, args.get('limit', 20, type=int)))
+        cursor = args.get('cursor')
+        if cursor:
+            cursors.decode_float(cursor)
+    except ValueError:
+        return jsonify({'message': 'Parámetros de búsqueda inválidos'}), 400
+
+    rows, next_cursor = search.search_lawyers(
+        q=args.get('q'),
+        especialidad=args.get('especialidad'),
+        min_price=min_price,
+        max_price=max_price,
+        min_rating=min_rating,
+        sort=args.get('sort'),
+        limit=limit,
+        cursor=cursor,
+    )
+    items = []
+    for abogado, score, rating_avg, rating_count in rows:
+        card = _lawyer_card(abogado)
+        card['rating'] = {'avg': float(round(rating_avg or 0.0, 2)), 'count': int(rating_count or 0)}
+        card['score'] = float(score or 0.0)
+        items.append(card)
+    return jsonify({'items': items, 'next_cursor': next_cursor}), 200
+
+
+@lawyers_bp.route('/api/abogados/disponibles', methods=['GET'])
+def buscar_abogados_disponibles():
+    """
+    Abogados con horario libre, ordenados por el más próximo.
+    Query: especialidad, date (YYYY-MM-DD), from / to (ej. '8:00 AM', '12:00'),
+           min_price, max_price, limit (máx. 100).
+    Sin date (ni from/to) usa el próximo horario libre de cada abogado.
+    """
+    args = request.args
+    try:
+        day = args.get('date')
+        day = datetime.strptime(day, '%Y-%m-%d').date() if day else None
+        from_min = availability.slot_minutes(args['from']) if args.get('from') else None
+        to_min = availability.slot_minutes(args['to']) if args.get('to') else None
+        min_price = args.get('min_price', type=float)
+        max_price = args.get('max_price', type=float)
+        limit = max(1, min(100, args.get('limit', 20, type=int)))
+    except ValueError:
+        return jsonify({'message': 'Parámetros de búsqueda inválidos'}), 400
+
+    today, _ = availability.local_now()
+    if day is not None and day < today:
+        return jsonify({'message': 'La fecha no puede estar en el pasado'}), 400
+    if day is None and (from_min is not None or to_min is not None):
+        day = today
+
+    rows = availability.search_free_lawyers(
+        especialidad=args.get('especialidad'),
+        day=day,
+        from_min=from_min,
+        to_min=to_min,
+        min_price=min_price,
+        max_price=max_price,
+        limit=limit,
+    )
+    items = []
+    for abogado, slot_date, minute in rows:
+        card = _lawyer_card(abogado)
+        card['next_slot'] = {'date': slot_date.strftime('%Y-%m-%d'), 'time': availability.minute_label(minute)}
+        items.append(card)
+    return jsonify(items), 200
+
+
+@lawyers_bp.route('/api/abogados/<especialidad>', methods=['GET'])
+def get_abogados_por_especialidad(especialidad):
+    # Ids por índice; las tarjetas salen de la caché de perfiles
+    entries = lawyer_cache.profiles(search.lawyer_ids(especialidad=especialidad))
+    return jsonify([lawyer_cache.card(e['profile']) for e in entries.values() if e['public']]), 200
 
 
 @lawyers_bp.route('/api/lawyer/profile', methods=['GET'])
@@ -165,7 +182,13 @@ def update_lawyer_profile():
     lawyer.about_me = data.get('about_me', lawyer.about_me)
     lawyer.titles = data.get('titles', lawyer.titles)
     lawyer.consultation_price = data.get('consultation_price', lawyer.consultation_price)
+    especialidad = (data.get('especialidad') or '').strip()
+    if especialidad and especialidad != lawyer.especialidad:
+        lawyer.especialidad = especialidad
+        sync_lawyer_specialties(lawyer)
+    search.index_lawyer(lawyer)
     db.session.commit()
+    lawyer_cache.invalidate(user_id)
     return jsonify({'message': 'Perfil actualizado exitosamente'}), 200
 
 
@@ -182,13 +205,17 @@ def upload_profile_picture():
     if file.filename == '':
         return jsonify({'message': 'No se seleccionó ningún archivo'}), 400
     if file and allowed_file(file.filename):
-        file_ext = os.path.splitext(file.filename)[1]
-        filename = secure_filename(f"user_{user_id}{file_ext}")
-        filepath = os.path.join(UPLOAD_FOLDER, filename)
+        file_ext = os.path.splitext(file.filename)[1].lstrip('.')
         try:
-            file.save(filepath)
+            # Nombre por contenido (<sha256>.<ext>): URL nueva en cada cambio, caché inmutable
+            filename = uploads.store(file, file_ext)
+            previous = lawyer.profile_picture_url
             lawyer.profile_picture_url = filename
             db.session.commit()
+            avatars.invalidate(user_id)
+            lawyer_cache.invalidate(user_id)
+            if previous and previous != filename:
+                uploads.release(previous)
             return jsonify({'message': 'Foto de perfil actualizada', 'filepath': filename}), 200
         except Exception as e:
             db.session.rollback()
@@ -203,75 +230,125 @@ def uploaded_file(filename):
 
 @lawyers_bp.route('/api/abogado/perfil/<int:abogado_id>', methods=['GET'])
 def get_public_lawyer_profile(abogado_id):
-    abogado = User.query.get(abogado_id)
-    if not abogado or abogado.role != 'abogado' or not abogado.is_approved or not abogado.is_active:
+    profile = lawyer_cache.public_profile(abogado_id)
+    if profile is None:
         return jsonify({'message': 'Abogado no encontrado o no disponible'}), 404
-    return jsonify({
-        'id': abogado.id,
-        'nombres': abogado.nombres,
-        'apellidos': abogado.apellidos,
-        'especialidad': abogado.especialidad,
-        'about_me': abogado.about_me,
-        'titles': abogado.titles,
-        'profile_picture_url': abogado.profile_picture_url,
-        'consultation_price': abogado.consultation_price
-    }), 200
+    return jsonify(profile), 200
 
 
 @lawyers_bp.route('/api/lawyer/availability', methods=['GET'])
 @jwt_required()
 def get_availability():
+    """Query: from / to (YYYY-MM-DD). Por defecto, desde hoy hacia adelante."""
     user_id = int(get_jwt_identity())
-    availabilities = Availability.query.filter_by(lawyer_id=user_id).all()
-    availability_map = {
-        item.date.strftime('%Y-%m-%d'): _normalize_slots_list(item.time_slots)
-        for item in availabilities
-    }
-    return jsonify(availability_map), 200
+    try:
+        start, end = availability.parse_window(request.args.get('from'), request.args.get('to'))
+    except ValueError:
+        return jsonify({'message': f'Rango de fechas inválido (YYYY-MM-DD, máximo {availability.MAX_WINDOW_DAYS} días)'}), 400
+    return jsonify(availability.get_slots_map(user_id, start, end)), 200
 
 
 @lawyers_bp.route('/api/lawyer/availability', methods=['POST'])
 @jwt_required()
 def set_availability():
     user_id = int(get_jwt_identity())
-    print(f"--- Intentando guardar disponibilidad para user_id: {user_id} ---")
 
     lawyer = User.query.get(user_id)
     if not lawyer or lawyer.role != 'abogado':
-        print(f"ERROR: El usuario con id {user_id} no es un abogado válido.")
+        current_app.logger.warning("[availability] user %s no es un abogado válido", user_id)
         return jsonify({'message': 'Usuario no es un abogado válido'}), 403
 
     data = request.get_json()
     date_str = data.get('date')
     time_slots = data.get('time_slots')
-    print(f"Datos recibidos del frontend: date='{date_str}', slots={time_slots}")
 
     if not date_str or time_slots is None:
         return jsonify({'message': 'Faltan la fecha o los horarios'}), 400
 
     try:
         date_obj = datetime.strptime(date_str, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return jsonify({'message': 'Fecha inválida (YYYY-MM-DD)'}), 400
 
-        # Normalizar/ordenar/depurar antes de guardar
-        cleaned_slots = _normalize_slots_list(time_slots)
-
-        availability_entry = Availability.query.filter_by(lawyer_id=user_id, date=date_obj).first()
-        if availability_entry:
-            print(f"Actualizando entrada existente para la fecha {date_str}")
-            availability_entry.time_slots = cleaned_slots
-        else:
-            print(f"Creando NUEVA entrada para la fecha {date_str}")
-            availability_entry = Availability(lawyer_id=user_id, date=date_obj, time_slots=cleaned_slots)
-            db.session.add(availability_entry)
+    try:
+        # Normaliza a minutos del día y reemplaza los horarios de la fecha
+        minutes = availability.set_day_slots(user_id, date_obj, time_slots)
+        current_app.logger.info("[availability] abogado %s: %d horarios para %s", user_id, len(minutes), date_str)
+        availability.refresh_next_slot(user_id)
 
         db.session.commit()
-        print("--- ¡COMMIT EXITOSO! La disponibilidad fue guardada en la DB. ---")
         return jsonify({'message': 'Disponibilidad guardada exitosamente'}), 200
 
-    except Exception as e:
+    except Exception:
         db.session.rollback()
-        print(f"!!!!!! ERROR DURANTE EL PROCESO DE GUARDADO: {str(e)} !!!!!!")
-        return jsonify({'message': f"Error en la base de datos: {str(e)}"}), 500
+        current_app.logger.exception("[availability] error guardando disponibilidad de %s para %s",
+                                     user_id, date_str)
+        return jsonify({'message': 'Error al guardar la disponibilidad'}), 500
+
+
+def _rule_json(rule):
+    return {
+        'id': rule.id,
+        'weekday': rule.weekday,
+        'start': availability.minute_label(rule.start_minute),
+        'end': availability.minute_label(rule.end_minute),
+        'valid_from': rule.valid_from.isoformat() if rule.valid_from else None,
+        'valid_until': rule.valid_until.isoformat() if rule.valid_until else None,
+    }
+
+
+def _parse_rule(item):
+    weekday = int(item.get('weekday'))
+    start = availability.slot_minutes(item.get('start'))
+    # '12:00 AM' como fin = medianoche del día siguiente
+    end = availability.slot_minutes(item.get('end')) or availability.MINUTES_PER_DAY
+    if not (0 <= weekday <= 6) or start >= end:
+        raise ValueError('regla inválida')
+    valid_from = item.get('valid_from')
+    valid_until = item.get('valid_until')
+    valid_from = datetime.strptime(valid_from, '%Y-%m-%d').date() if valid_from else None
+    valid_until = datetime.strptime(valid_until, '%Y-%m-%d').date() if valid_until else None
+    if valid_from and valid_until and valid_from > valid_until:
+        raise ValueError('regla inválida')
+    return {
+        'weekday': weekday,
+        'start_minute': start,
+        'end_minute': end,
+        'valid_from': valid_from,
+        'valid_until': valid_until,
+    }
+
+
+@lawyers_bp.route('/api/lawyer/availability/rules', methods=['GET'])
+@jwt_required()
+def get_availability_rules():
+    user_id = int(get_jwt_identity())
+    return jsonify([_rule_json(r) for r in availability.get_rules(user_id)]), 200
+
+
+@lawyers_bp.route('/api/lawyer/availability/rules', methods=['PUT'])
+@jwt_required()
+def set_availability_rules():
+    """
+    Reemplaza la disponibilidad semanal recurrente.
+    Body: { rules: [{ weekday (0=lunes), start: '9:00 AM', end: '1:00 PM', valid_from?, valid_until? }] }
+    Los cambios puntuales por fecha se siguen haciendo con POST /api/lawyer/availability.
+    """
+    user_id = int(get_jwt_identity())
+    lawyer = User.query.get(user_id)
+    if not lawyer or lawyer.role != 'abogado':
+        return jsonify({'message': 'Usuario no es un abogado válido'}), 403
+
+    data = request.get_json() or {}
+    try:
+        rules = [_parse_rule(item) for item in (data.get('rules') or [])]
+    except (TypeError, ValueError, AttributeError):
+        return jsonify({'message': 'Reglas de disponibilidad inválidas'}), 400
+
+    availability.set_rules(user_id, rules)
+    availability.refresh_next_slot(user_id)
+    db.session.commit()
+    return jsonify([_rule_json(r) for r in availability.get_rules(user_id)]), 200
 
 
 @lawyers_bp.route('/api/abogado/availability/<int:abogado_id>', methods=['GET'])
@@ -279,12 +356,11 @@ def get_lawyer_public_availability(abogado_id):
     abogado = User.query.filter_by(id=abogado_id, role='abogado', is_approved=True, is_active=True).first()
     if not abogado:
         return jsonify({'message': 'Abogado no encontrado o no disponible'}), 404
-    availabilities = Availability.query.filter_by(lawyer_id=abogado_id).all()
-    availability_map = {
-        item.date.strftime('%Y-%m-%d'): _normalize_slots_list(item.time_slots)
-        for item in availabilities
-    }
-    return jsonify(availability_map), 200
+    try:
+        start, end = availability.parse_window(request.args.get('from'), request.args.get('to'))
+    except ValueError:
+        return jsonify({'message': f'Rango de fechas inválido (YYYY-MM-DD, máximo {availability.MAX_WINDOW_DAYS} días)'}), 400
+    return jsonify(availability.get_slots_map(abogado_id, start, end)), 200
 
 
 @lawyers_bp.route('/api/lawyer/gallery', methods=['GET'])
@@ -302,7 +378,6 @@ def my_gallery_upload():
     files = request.files.getlist('images')
     if not files:
         return jsonify({'message': 'No files'}), 400
-    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
     saved = 0
     for f in files:
         if not f or not f.filename:
@@ -310,11 +385,11 @@ def my_gallery_upload():
         ext = f.filename.rsplit('.', 1)[-1].lower()
         if ext not in {'png', 'jpg', 'jpeg', 'webp'}:
             continue
-        fname = secure_filename(f"{uid}_gal_{db.func.random()}_{f.filename}")
-        f.save(os.path.join(UPLOAD_FOLDER, fname))
+        fname = uploads.store(f, ext)
         db.session.add(LawyerGalleryImage(lawyer_id=uid, filename=fname))
         saved += 1
     db.session.commit()
+    lawyer_cache.invalidate(uid, parts=(lawyer_cache.GALLERY,))
     return jsonify({'uploaded': saved}), 201
 
 
@@ -325,22 +400,19 @@ def my_gallery_delete(image_id):
     img = LawyerGalleryImage.query.get(image_id)
     if not img or img.lawyer_id != uid:
         return jsonify({'message': 'Not found'}), 404
-    try:
-        path = os.path.join(UPLOAD_FOLDER, img.filename)
-        if os.path.exists(path):
-            os.remove(path)
-    except Exception:
-        pass
+    filename = img.filename
     db.session.delete(img)
     db.session.commit()
+    lawyer_cache.invalidate(uid, parts=(lawyer_cache.GALLERY,))
+    # El archivo puede estar compartido (deduplicado): solo se borra sin referencias
+    uploads.release(filename)
     return jsonify({'deleted': True}), 200
 
 
 # --- Galería (público) ---
 @lawyers_bp.route('/api/abogado/galeria/<int:abogado_id>', methods=['GET'])
 def public_gallery(abogado_id):
-    imgs = LawyerGalleryImage.query.filter_by(lawyer_id=abogado_id).order_by(LawyerGalleryImage.created_at.desc()).all()
-    return jsonify([{'id': i.id, 'filename': i.filename, 'url': f'/uploads/{i.filename}'} for i in imgs]), 200
+    return jsonify(lawyer_cache.gallery(abogado_id)), 200
 
 
 # --- Video (privado) ---
@@ -361,14 +433,11 @@ def my_video_delete():
     v = LawyerIntroVideo.query.filter_by(lawyer_id=uid).first()
     if not v:
         return jsonify({'message': 'Not found'}), 404
-    try:
-        path = os.path.join(UPLOAD_FOLDER, v.filename)
-        if os.path.exists(path):
-            os.remove(path)
-    except Exception:
-        pass
+    filename = v.filename
     db.session.delete(v)
     db.session.commit()
+    lawyer_cache.invalidate(uid, parts=(lawyer_cache.VIDEO,))
+    uploads.release(filename)
     return jsonify({'deleted': True}), 200
 
 
@@ -382,30 +451,22 @@ def my_video_upload():
     ext = f.filename.rsplit('.', 1)[-1].lower()
     if ext not in {'mp4', 'webm', 'mov', 'qt'}:
         return jsonify({'message': 'Bad format'}), 400
-    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-    # si ya existe, eliminar anterior
+    # guardar nuevo y reemplazar el anterior en una sola transacción
+    fname = uploads.store(f, ext)
     prev = LawyerIntroVideo.query.filter_by(lawyer_id=uid).first()
+    previous = prev.filename if prev else None
     if prev:
-        try:
-            old = os.path.join(UPLOAD_FOLDER, prev.filename)
-            if os.path.exists(old):
-                os.remove(old)
-        except Exception:
-            pass
         db.session.delete(prev)
-        db.session.commit()
-    # guardar nuevo
-    fname = secure_filename(f"{uid}_intro_{db.func.random()}_{f.filename}")
-    f.save(os.path.join(UPLOAD_FOLDER, fname))
+        db.session.flush()  # libera el unique de lawyer_id antes de insertar
     db.session.add(LawyerIntroVideo(lawyer_id=uid, filename=fname))
     db.session.commit()
+    lawyer_cache.invalidate(uid, parts=(lawyer_cache.VIDEO,))
+    if previous and previous != fname:
+        uploads.release(previous)
     return jsonify({'filename': fname, 'url': f'/uploads/{fname}'}), 201
 
 
 # --- Video (público) ---
 @lawyers_bp.route('/api/abogado/video/<int:abogado_id>', methods=['GET'])
 def public_video(abogado_id):
-    v = LawyerIntroVideo.query.filter_by(lawyer_id=abogado_id).first()
-    if not v:
-        return jsonify({}), 200
-    return jsonify({'filename': v.filename, 'url': f'/uploads/{v.filename}'}), 200
\ No newline at end of file
+    return jsonify(lawyer_cache.video(abogado_id)), 200
\ No newline at end of file
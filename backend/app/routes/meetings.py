@@ -1,10 +1,13 @@
 from flask import Blueprint, jsonify, request, current_app
-from app.models import db, User, Meeting, Availability, MeetingPresence
+from app.models import db, User, Meeting, MeetingPresence
+from app import availability, avatars, cursors, stream_client, stream_sync
+from app.availability import canonical_slot_str, parse_time_str
+from app.authz import current_identity, has_role
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from datetime import datetime, time as dtime, timedelta, timezone
-from stream_chat import StreamChat
+from datetime import datetime, timedelta, timezone
 from flask_cors import cross_origin
 from zoneinfo import ZoneInfo
+from sqlalchemy.exc import IntegrityError
 import re
 
 meetings_bp = Blueprint('meetings', __name__)
@@ -17,57 +20,8 @@ def _tz():
     except Exception:
         return ZoneInfo("UTC")
 
-# ==========================
-#  Normalización de horarios
-# ==========================
-_HHMM_AMPM_RE = re.compile(r'^\s*(\d{1,2})(?::(\d{2}))?\s*([ap]m)\s*$', re.IGNORECASE)
-_HHMM_24H_RE  = re.compile(r'^\s*(\d{1,2}):(\d{2})(?::\d{2})?\s*$')
-
-def _parse_time_components(s):
-    if not s:
-        return (0, 0)
-    raw = str(s).strip().lower()
-
-    m = _HHMM_AMPM_RE.match(raw)
-    if m:
-        hh = int(m.group(1))
-        mi = int(m.group(2) or 0)
-        ap = m.group(3)
-        if ap == 'am':
-            if hh == 12: hh = 0
-        else:
-            if hh < 12: hh += 12
-        return (hh, mi)
-
-    m = _HHMM_24H_RE.match(raw)
-    if m:
-        return (int(m.group(1)), int(m.group(2)))
-
-    return (0, 0)
-
-def _canonical_slot_str(s):
-    h24, mi = _parse_time_components(s)
-    ampm = "AM" if h24 < 12 else "PM"
-    h12 = h24 % 12
-    if h12 == 0: h12 = 12
-    return f"{h12}:{mi:02d} {ampm}"
-
-def _slot_minutes(s) -> int:
-    h, m = _parse_time_components(s)
-    return h * 60 + m
-
-def _normalize_slots_list(slots):
-    if not isinstance(slots, list):
-        return []
-    canon = {_canonical_slot_str(x) for x in slots if x}
-    return sorted(canon, key=_slot_minutes)
-
-def _parse_time_str(s: str) -> dtime:
-    h, m = _parse_time_components(s)
-    return dtime(h, m)
-
 def _start_datetime(meeting: Meeting) -> datetime:
-    mt = _parse_time_str(getattr(meeting, 'meeting_time', '00:00'))
+    mt = parse_time_str(getattr(meeting, 'meeting_time', '00:00'))
     md = getattr(meeting, 'meeting_date', None)
     if isinstance(md, datetime):
         md = md.date()
@@ -81,49 +35,20 @@ def _is_join_window(meeting: Meeting, now: datetime = None, duration_min: int =
     end_dt = start_dt + timedelta(minutes=duration)
     return (now >= start_dt - timedelta(minutes=10)) and (now < end_dt)
 
-def _all_canonical_slots():
-    out = []
-    for hour in range(24):
-        for minute in (0, 30):
-            ampm = "PM" if hour >= 12 else "AM"
-            display_hour = hour % 12 or 12
-            out.append(f"{display_hour}:{minute:02d} {ampm}")
-    return out
-
-def get_next_slot(time_slot_str: str):
-    try:
-        all_slots = _all_canonical_slots()
-        norm = _canonical_slot_str(time_slot_str)
-        idx = all_slots.index(norm)
-        if idx + 1 < len(all_slots):
-            return all_slots[idx + 1]
-    except (ValueError, IndexError):
-        pass
-    return None
-
 def _stream_user_id_from_user(user: User, fallback_id) -> str:
     raw = (getattr(user, 'email', None) or str(getattr(user, 'id', None) or fallback_id)).lower()
     return re.sub(r'[^a-z0-9_@-]', '_', raw)
 
 def _get_stream_client():
-    api_key = current_app.config.get("STREAM_API_KEY")
-    api_secret = current_app.config.get("STREAM_API_SECRET")
-    if not api_key or not api_secret:
+    sc = stream_client.get_client()
+    if sc is None:
         return None, None, None
-    sc = StreamChat(api_key=api_key, api_secret=api_secret)
-    return sc, api_key, api_secret
+    return sc, sc.api_key, sc.api_secret
 
 def _normalize_avatar_path(user: User):
-    val = getattr(user, 'profile_picture_url', None) or getattr(user, 'avatar', None)
-    if not val:
+    if user is None:
         return None
-    val = str(val)
-    if val.startswith("http://") or val.startswith("https://"):
-        return val
-    val = val.lstrip("/")
-    if val.startswith("uploads/"):
-        return "/" + val
-    return f"/uploads/{val}"
+    return avatars.resolve(user.id, user=user)
 
 def _as_int(x):
     try:
@@ -135,10 +60,10 @@ def _authorized_to_modify(meeting: Meeting, uid):
     uid_int = _as_int(uid)
     if isinstance(uid_int, int) and uid_int in (meeting.client_id, meeting.lawyer_id):
         return True
-    user = User.query.get(uid_int) if isinstance(uid_int, int) else None
-    if user and user.role in ('admin', 'backoffice'):
-        return True
-    return False
+    return has_role('admin', 'backoffice')
+
+def _slot_taken():
+    return jsonify({'message': 'El horario seleccionado ya no está disponible. Por favor, elige otro.'}), 409
 
 # ---------- NUEVO: parser “relajado” de fecha ----------
 def parse_date_loose(value):
@@ -182,22 +107,27 @@ def create_meeting():
     except ValueError:
         return jsonify({'message': 'Formato de fecha inválido, usa YYYY-MM-DD'}), 400
 
-    availability_entry = Availability.query.filter_by(lawyer_id=lawyer_id, date=date_obj).first()
-    if not availability_entry:
-        return jsonify({'message': 'El horario seleccionado ya no está disponible. Por favor, elige otro.'}), 409
+    try:
+        lawyer_id = int(lawyer_id)
+    except (TypeError, ValueError):
+        return jsonify({'message': 'Faltan datos para crear la reunión'}), 400
 
-    slot_norm = _canonical_slot_str(time_slot)
-    avail_norm = _normalize_slots_list(availability_entry.time_slots or [])
+    minute = availability.slot_minutes(time_slot)
 
-    if slot_norm not in avail_norm:
-        return jsonify({'message': 'El horario seleccionado ya no está disponible. Por favor, elige otro.'}), 409
+    # 1) Reclamo único de cada casilla que ocupa la reunión: solo un worker puede ganarlo.
+    #    Si el cliente tenía un hold vigente sobre el horario, se confirma.
+    reservations = availability.claim_slot(lawyer_id, date_obj, minute, client_id)
+    if reservations is None:
+        db.session.rollback()
+        return _slot_taken()
 
-    slot2 = get_next_slot(slot_norm)
-    to_remove = {slot_norm}
-    if slot2:
-        to_remove.add(slot2)
+    # 2) El horario debe estar en la disponibilidad (reglas + fechas explícitas), leída de la BD
+    if not availability.is_offered(lawyer_id, date_obj, minute):
+        db.session.rollback()
+        return _slot_taken()
 
-    availability_entry.time_slots = [s for s in availability_entry.time_slots if _canonical_slot_str(s) not in to_remove]
+    availability.refresh_next_slot(lawyer_id)
+    slot_norm = availability.minute_label(minute)
 
     lawyer = User.query.get(lawyer_id)
     consulta_price = 0.0
@@ -218,29 +148,39 @@ def create_meeting():
         currency='USD',
     )
     db.session.add(meeting)
-    db.session.commit()
-
-    return jsonify({'message': 'Reunión creada y horario bloqueado exitosamente'}), 201
-
-@meetings_bp.route('/api/meetings', methods=['GET'])
-@jwt_required()
-def get_meetings():
-    user_id = int(get_jwt_identity())
-    current_user = User.query.get(user_id)
-    if not current_user:
-        return jsonify([]), 200
-
-    if current_user.role == 'cliente':
-        meetings_query = Meeting.query.filter_by(client_id=user_id).order_by(Meeting.meeting_date.desc()).all()
-    elif current_user.role == 'abogado':
-        meetings_query = Meeting.query.filter_by(lawyer_id=user_id).order_by(Meeting.meeting_date.desc()).all()
-    else:
-        return jsonify([]), 200
+    db.session.flush()
+    for reservation in reservations:
+        reservation.meeting_id = meeting.id
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return _slot_taken()
+
+    return jsonify({'message': 'Reunión creada y horario bloqueado exitosamente', 'id': meeting.id}), 201
+
+def _parse_since(value):
+    """ISO 8601 -> datetime naive en UTC (como created_at/updated_at)."""
+    v = str(value).strip().replace('Z', '+00:00')
+    dt = datetime.fromisoformat(v)
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+def _serialize_meetings(meetings, viewer_role):
+    """Serializa reuniones cargando las contrapartes en una sola consulta (IN)."""
+    other_ids = {
+        (m.lawyer_id if viewer_role == 'cliente' else m.client_id)
+        for m in meetings
+    }
+    others = {}
+    if other_ids:
+        others = {u.id: u for u in User.query.filter(User.id.in_(other_ids)).all()}
 
     meetings_list = []
-    for m in meetings_query:
-        other_id = m.lawyer_id if current_user.role == 'cliente' else m.client_id
-        other_user = User.query.get(other_id)
+    for m in meetings:
+        other_id = m.lawyer_id if viewer_role == 'cliente' else m.client_id
+        other_user = others.get(other_id)
         duration = getattr(m, 'duration', None) or DEFAULT_DURATION_MIN
 
         if other_user:
@@ -260,7 +200,7 @@ def get_meetings():
         meetings_list.append({
             'id': m.id,
             'date': m.meeting_date.strftime('%Y-%m-%d'),
-            'time': _canonical_slot_str(m.meeting_time),
+            'time': canonical_slot_str(m.meeting_time),
             'duration': duration,
             'status': getattr(m, 'status', 'confirmada'),
             'price_cents': price_cents,
@@ -274,8 +214,106 @@ def get_meetings():
                 'avatar': other_avatar,
             }
         })
+    return meetings_list
+
+@meetings_bp.route('/api/meetings/holds', methods=['POST'])
+@jwt_required()
+def create_hold():
+    """
+    Retiene un horario durante SLOT_HOLD_MINUTES mientras el cliente paga.
+    Body: { lawyer_id, date, time }. Luego POST /api/meetings con los mismos datos lo confirma.
+    """
+    client_id = int(get_jwt_identity())
+    data = request.get_json() or {}
+    try:
+        lawyer_id = int(data.get('lawyer_id'))
+        date_obj = parse_date_loose(data.get('date'))
+    except (TypeError, ValueError):
+        return jsonify({'message': 'Datos inválidos'}), 400
+    if not data.get('time'):
+        return jsonify({'message': 'Datos inválidos'}), 400
+
+    minute = availability.slot_minutes(data.get('time'))
+    # Primero el reclamo: decide si el horario está tomado (un hold propio se extiende)
+    rows = availability.claim_slot(
+        lawyer_id, date_obj, minute, client_id,
+        hold_minutes=current_app.config.get('SLOT_HOLD_MINUTES', 5),
+    )
+    if rows is None or not availability.is_offered(lawyer_id, date_obj, minute):
+        db.session.rollback()
+        return _slot_taken()
+    hold = rows[0]
+    db.session.commit()
+    return jsonify({
+        'hold_id': hold.id,
+        'lawyer_id': lawyer_id,
+        'date': date_obj.isoformat(),
+        'time': availability.minute_label(minute),
+        'expires_at': hold.expires_at.isoformat() + 'Z',
+    }), 201
+
+@meetings_bp.route('/api/meetings/holds/<int:hold_id>', methods=['DELETE'])
+@jwt_required()
+def release_hold(hold_id):
+    client_id = int(get_jwt_identity())
+    deleted = availability.release_hold(hold_id, client_id)
+    db.session.commit()
+    if not deleted:
+        return jsonify({'message': 'Hold no encontrado'}), 404
+    return jsonify({'ok': True}), 200
+
+@meetings_bp.route('/api/meetings', methods=['GET'])
+@jwt_required()
+def get_meetings():
+    """
+    Lista de reuniones del usuario (más recientes primero).
+    Query opcional:
+      - limit:  tamaño de página (máx. 200). Sin limit devuelve todo.
+      - cursor: valor de X-Next-Cursor de la página anterior.
+      - since:  ISO 8601; solo reuniones creadas/modificadas desde entonces.
+    """
+    user_id = int(get_jwt_identity())
+    current_user = current_identity()
+    if not current_user:
+        return jsonify([]), 200
+
+    if current_user.role == 'cliente':
+        q = Meeting.query.filter(Meeting.client_id == user_id)
+    elif current_user.role == 'abogado':
+        q = Meeting.query.filter(Meeting.lawyer_id == user_id)
+    else:
+        return jsonify([]), 200
+
+    try:
+        since = request.args.get('since')
+        if since:
+            q = q.filter(db.func.coalesce(Meeting.updated_at, Meeting.created_at) >= _parse_since(since))
+        cursor = request.args.get('cursor')
+        if cursor:
+            c_date, c_id = cursors.decode_date(cursor)
+            q = q.filter(db.or_(
+                Meeting.meeting_date < c_date,
+                db.and_(Meeting.meeting_date == c_date, Meeting.id < c_id),
+            ))
+        limit = request.args.get('limit', type=int)
+    except ValueError:
+        return jsonify({'message': 'Parámetros de paginación inválidos'}), 400
+
+    q = q.order_by(Meeting.meeting_date.desc(), Meeting.id.desc())
+    next_cursor = None
+    if limit:
+        limit = max(1, min(200, limit))
+        meetings = q.limit(limit + 1).all()
+        if len(meetings) > limit:
+            meetings = meetings[:limit]
+            next_cursor = cursors.encode(meetings[-1].meeting_date, meetings[-1].id)
+    else:
+        meetings = q.all()
 
-    return jsonify(meetings_list), 200
+    resp = jsonify(_serialize_meetings(meetings, current_user.role))
+    if next_cursor:
+        resp.headers['X-Next-Cursor'] = next_cursor
+    return resp, 200
 
 @meetings_bp.route('/api/chat/users/ensure/<int:other_user_id>', methods=['POST'])
 @jwt_required()
@@ -302,7 +340,7 @@ def ensure_stream_user(other_user_id):
     payload = {"id": stream_id, "name": (name or f"user_{stream_id}") }
     if image_path:
         payload["image"] = image_path
-    sc.upsert_user(payload)
+    stream_sync.upsert_user(payload, ensure_exists=True)
     return jsonify({'ok': True, 'stream_id': stream_id}), 200
 
 @meetings_bp.route('/api/meetings/<int:meeting_id>/can-join', methods=['GET'])
@@ -368,7 +406,7 @@ def meeting_video_join_info(meeting_id):
 
     user = User.query.get(uid_int) if isinstance(uid_int, int) else None
     stream_user_id = _stream_user_id_from_user(user, uid_int)
-    token = sc.create_token(stream_user_id)
+    token = stream_client.user_token(stream_user_id)
     call_id = f"meeting_{meeting.id}"
 
     return jsonify({
@@ -393,7 +431,7 @@ def get_meeting(meeting_id):
     return jsonify({
         'id': m.id,
         'meeting_date': m.meeting_date.isoformat(),
-        'meeting_time': _canonical_slot_str(m.meeting_time),
+        'meeting_time': canonical_slot_str(m.meeting_time),
         'status': getattr(m, 'status', 'confirmada'),
         'client_id': m.client_id,
         'lawyer_id': m.lawyer_id,
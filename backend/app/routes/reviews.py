@@ -1,17 +1,76 @@
 # backend/app/routes/reviews.py
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required
 from sqlalchemy import func
-from app.models import db, User, Meeting, Review
+from sqlalchemy.exc import IntegrityError
+from app.models import db, User, Meeting, Review, LawyerRating
+from app import cursors
+from app.authz import current_identity
 
 reviews_bp = Blueprint('reviews', __name__)
 
 def _current_user():
-    try:
-        uid = int(get_jwt_identity())
-    except Exception:
-        uid = None
-    return User.query.get(uid) if uid else None
+    """Identity (id, role, ...) desde los claims del JWT; sin consulta a user."""
+    return current_identity()
+
+def _rating(value) -> int:
+    n = int(value)
+    if not 1 <= n <= 5:
+        raise ValueError(value)
+    return n
+
+def _parse_rating_filters(args):
+    """rating=5 | rating=4,5 ; min_rating / max_rating. ValueError si no son 1..5."""
+    ratings = [_rating(x) for x in (args.get('rating') or '').split(',') if x.strip()]
+    lo = _rating(args['min_rating']) if args.get('min_rating') else None
+    hi = _rating(args['max_rating']) if args.get('max_rating') else None
+    return ratings, lo, hi
+
+def _review_item(r: Review):
+    return {
+        'rating': r.rating,
+        'comment': r.comment or "",
+        'created_at': r.created_at.isoformat(),
+        'client': r.client_name or Review.display_name(None)
+    }
+
+def _rebuild_rating(lawyer_id: int) -> LawyerRating:
+    """Recalcula el agregado desde la tabla review (backfill / agregado ausente)."""
+    agg = db.session.get(LawyerRating, lawyer_id) or LawyerRating(lawyer_id=lawyer_id)
+    hist = dict(
+        db.session.query(Review.rating, func.count(Review.id))
+        .filter(Review.lawyer_id == lawyer_id)
+        .group_by(Review.rating)
+        .all()
+    )
+    for i in range(1, 6):
+        setattr(agg, f"r{i}", int(hist.get(i, 0)))
+    agg.count = sum(int(v) for v in hist.values())
+    agg.total = sum(int(k) * int(v) for k, v in hist.items())
+    agg.avg = (agg.total / agg.count) if agg.count else 0.0
+
+    last = (Review.query.filter_by(lawyer_id=lawyer_id)
+            .order_by(Review.created_at.desc(), Review.id.desc())
+            .limit(LawyerRating.RECENT_N).all())
+    agg.recent = [_review_item(r) for r in last]
+    db.session.add(agg)
+    return agg
+
+def _apply_review_to_rating(rv: Review):
+    """Suma la reseña al agregado dentro de la transacción en curso."""
+    col = getattr(LawyerRating, f"r{rv.rating}")
+    updated = LawyerRating.query.filter_by(lawyer_id=rv.lawyer_id).update({
+        LawyerRating.count: LawyerRating.count + 1,
+        LawyerRating.total: LawyerRating.total + rv.rating,
+        LawyerRating.avg: (LawyerRating.total + rv.rating) * 1.0 / (LawyerRating.count + 1),
+        col: col + 1,
+    }, synchronize_session=False)
+    if not updated:
+        # Primer agregado del abogado: se construye desde review (ya incluye rv)
+        _rebuild_rating(rv.lawyer_id)
+        return
+    agg = LawyerRating.query.filter_by(lawyer_id=rv.lawyer_id).with_for_update().populate_existing().first()
+    agg.push_recent(_review_item(rv))
 
 @reviews_bp.route('/reviews', methods=['POST'])
 @jwt_required()
@@ -34,7 +93,7 @@ def create_review():
         return jsonify({'message': 'Datos inválidos'}), 400
 
     user = _current_user()
-    if not user or getattr(user, 'role', None) != 'cliente':
+    if not user or not user.is_active or user.role != 'cliente':
         return jsonify({'message': 'No autorizado'}), 403
 
     meeting = Meeting.query.get(int(meeting_id))
@@ -45,77 +104,109 @@ def create_review():
     if exists:
         return jsonify({'message': 'Ya reseñaste esta reunión'}), 409
 
-    rv = Review(
-        lawyer_id=int(lawyer_id),
-        client_id=user.id,
-        meeting_id=meeting.id,
-        rating=rating,
-        comment=comment
-    )
-    db.session.add(rv)
-    db.session.commit()
-    return jsonify({'id': rv.id}), 201
+    client = db.session.query(User.nombres, User.apellidos).filter(User.id == user.id).first()
+    client_name = Review.display_name(client)
+    # Dos intentos: si otra primera reseña del abogado crea el agregado en paralelo,
+    # el INSERT de lawyer_rating choca al confirmar y el reintento lo actualiza.
+    for _ in range(2):
+        rv = Review(
+            lawyer_id=int(lawyer_id),
+            client_id=user.id,
+            meeting_id=meeting.id,
+            rating=rating,
+            comment=comment,
+            client_name=client_name
+        )
+        db.session.add(rv)
+        try:
+            db.session.flush()
+        except IntegrityError:
+            db.session.rollback()
+            return jsonify({'message': 'Ya reseñaste esta reunión'}), 409
+        try:
+            _apply_review_to_rating(rv)
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            continue
+        return jsonify({'id': rv.id}), 201
+    return jsonify({'message': 'No se pudo guardar la reseña, intenta de nuevo'}), 409
 
 # ---- SUMMARY: alias EN/ES ----
 @reviews_bp.route('/lawyers/<int:lawyer_id>/reviews/summary', methods=['GET'])
 @reviews_bp.route('/abogado/<int:lawyer_id>/reviews/summary', methods=['GET'])
 def lawyer_reviews_summary(lawyer_id):
-    q_all = Review.query.filter_by(lawyer_id=lawyer_id)
-    lifetime_count = q_all.count()
-    lifetime_avg = db.session.query(func.avg(Review.rating)).filter_by(lawyer_id=lawyer_id).scalar()
-    lifetime_avg = float(round(lifetime_avg or 0.0, 2))
-
-    last5 = q_all.order_by(Review.created_at.desc()).limit(5).all()
-    last5_avg = float(round((sum(r.rating for r in last5) / len(last5)) if last5 else 0.0, 2))
-
-    items = []
-    for r in last5:
-        client = User.query.get(r.client_id)
-        display_name = "Cliente"
-        try:
-            if client and client.nombres and client.apellidos:
-                display_name = f"{client.nombres.split()[0]} {client.apellidos[0]}."
-        except Exception:
-            pass
-        items.append({
-            'rating': r.rating,
-            'comment': r.comment or "",
-            'created_at': r.created_at.isoformat(),
-            'client': display_name
-        })
-
+    agg = db.session.get(LawyerRating, lawyer_id)
+    if agg is None:
+        agg = _rebuild_rating(lawyer_id)
+        if not agg.count:
+            # Sin reseñas: no persistimos filas vacías
+            db.session.expunge(agg)
+        else:
+            try:
+                db.session.commit()
+            except IntegrityError:
+                # Otro worker lo creó en paralelo
+                db.session.rollback()
+                agg = db.session.get(LawyerRating, lawyer_id)
+
+    items = list(agg.recent or [])
     return jsonify({
-        'lifetime': {'avg': lifetime_avg, 'count': lifetime_count},
-        'last5': {'avg': last5_avg, 'count': len(last5), 'items': items}
+        'lifetime': {'avg': float(round(agg.avg or 0.0, 2)), 'count': int(agg.count or 0)},
+        'last5': {'avg': float(round(agg.recent_avg, 2)), 'count': len(items), 'items': items},
+        'histogram': agg.histogram,
     }), 200
 
 # ---- LISTA PAGINADA: alias EN/ES ----
 @reviews_bp.route('/lawyers/<int:lawyer_id>/reviews', methods=['GET'])
 @reviews_bp.route('/abogado/<int:lawyer_id>/reviews', methods=['GET'])
 def lawyer_reviews_paginated(lawyer_id):
-    page = int(request.args.get('page', 1))
-    per_page = min(50, int(request.args.get('per_page', 10)))
+    """
+    Reseñas del abogado, más recientes primero.
+    Filtros: rating (ej. 5 o 4,5), min_rating, max_rating.
+    - Keyset (recomendado): limit (máx. 50) y cursor = next_cursor de la página anterior.
+    - Compatibilidad: page / per_page con total (OFFSET + COUNT).
+    """
+    args = request.args
+    try:
+        ratings, lo, hi = _parse_rating_filters(args)
+        cursor = args.get('cursor')
+        c_created, c_id = cursors.decode_datetime(cursor) if cursor else (None, None)
+        keyset = bool(cursor) or 'limit' in args
+        page = int(args.get('page', 1))
+        per_page = min(50, int(args.get('limit' if keyset else 'per_page', 10)))
+        if page < 1 or per_page < 1:
+            raise ValueError('page')
+    except ValueError:
+        return jsonify({'message': 'Parámetros inválidos'}), 400
+
+    q = Review.query.filter(Review.lawyer_id == lawyer_id)
+    if ratings:
+        q = q.filter(Review.rating.in_(ratings))
+    if lo is not None:
+        q = q.filter(Review.rating >= lo)
+    if hi is not None:
+        q = q.filter(Review.rating <= hi)
+    q = q.order_by(Review.created_at.desc(), Review.id.desc())
+
+    if keyset:
+        if cursor:
+            q = q.filter(db.or_(
+                Review.created_at < c_created,
+                db.and_(Review.created_at == c_created, Review.id < c_id),
+            ))
+        rows = q.limit(per_page + 1).all()
+        next_cursor = None
+        if len(rows) > per_page:
+            rows = rows[:per_page]
+            next_cursor = cursors.encode(rows[-1].created_at, rows[-1].id)
+        return jsonify({
+            'limit': per_page, 'next_cursor': next_cursor,
+            'items': [_review_item(r) for r in rows]
+        }), 200
 
-    q = Review.query.filter_by(lawyer_id=lawyer_id).order_by(Review.created_at.desc())
     pag = q.paginate(page=page, per_page=per_page, error_out=False)
-
-    items = []
-    for r in pag.items:
-        client = User.query.get(r.client_id)
-        display_name = "Cliente"
-        try:
-            if client and client.nombres and client.apellidos:
-                display_name = f"{client.nombres.split()[0]} {client.apellidos[0]}."
-        except Exception:
-            pass
-        items.append({
-            'rating': r.rating,
-            'comment': r.comment or "",
-            'created_at': r.created_at.isoformat(),
-            'client': display_name
-        })
-
     return jsonify({
         'page': page, 'per_page': per_page, 'total': pag.total,
-        'items': items
+        'items': [_review_item(r) for r in pag.items]
     }), 200
\ No newline at end of file
@@ -1,10 +1,8 @@
 # backend/app/routes/user.py
-import os
-from datetime import datetime
-from flask import Blueprint, jsonify, request, current_app as app
+from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from werkzeug.utils import secure_filename
 from ..models import db, User
+from .. import avatars, lawyer_cache, uploads
 
 user_bp = Blueprint("user", __name__, url_prefix="/api/user")
 
@@ -47,18 +45,18 @@ def upload_profile_picture():
     if not _allowed(file.filename):
         return jsonify({"error": "invalid file type"}), 400
 
-    # ruta y nombre
-    uploads_dir = os.path.join(app.root_path, "..", "uploads")
-    os.makedirs(uploads_dir, exist_ok=True)
+    # nombre por contenido (<sha256>.<ext>), deduplicado
     ext = file.filename.rsplit(".", 1)[1].lower()
-    filename = secure_filename(f"user_{uid}_{int(datetime.utcnow().timestamp())}.{ext}")
-    path = os.path.join(uploads_dir, filename)
-
-    file.save(path)
+    filename = uploads.store(file, ext)
 
     # guarda sólo el nombre; ya sirves /uploads/<file>
+    previous = user.profile_picture_url
     user.profile_picture_url = filename
     db.session.commit()
+    avatars.invalidate(user.id)
+    lawyer_cache.invalidate(user.id)
+    if previous and previous != filename:
+        uploads.release(previous)
 
     return jsonify({
         "ok": True,
@@ -0,0 +1,88 @@
+# backend/app/schema.py
+"""
+Ajustes de esquema sobre tablas que ya existían.
+
+db.create_all() crea las tablas nuevas pero nunca altera las existentes, así
+que las columnas e índices que se agregan a tablas previas se listan aquí y se
+crean al arrancar (ALTER TABLE ... ADD COLUMN / CREATE INDEX) solo si faltan.
+Los índices que se dejan de usar se borran (DROP INDEX IF EXISTS).
+Corre justo después de create_all y antes de cualquier consulta a los modelos.
+"""
+from sqlalchemy import inspect, select, update
+
+from .models import db, User, Meeting, Review, SlotReservation, EmailOutbox
+
+# (modelo, columna) agregadas a tablas existentes
+COLUMNS = [
+    (Meeting, "updated_at"),
+    (User, "token_version"),
+    (Review, "client_name"),
+    (SlotReservation, "start_minute"),
+    (EmailOutbox, "claim_token"),
+]
+
+# Nombres de índices (declarados en __table_args__) sobre tablas existentes
+INDEXES = [
+    "ix_meeting_client_date",
+    "ix_meeting_lawyer_date",
+    "ix_review_lawyer_created",
+    "ix_favorite_user_created",
+]
+
+# Índices que ya no se declaran (la tabla legada availability solo se lee al migrar)
+DROPPED_INDEXES = [
+    "ix_availability_lawyer_date",
+]
+
+
+def _add_column(conn, table, column):
+    quote = conn.dialect.identifier_preparer.quote
+    ddl = (f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} "
+           f"{column.type.compile(dialect=conn.dialect)}")
+    if column.server_default is not None:
+        ddl += f" DEFAULT {column.server_default.arg}"
+    if not column.nullable:
+        ddl += " NOT NULL"
+    conn.exec_driver_sql(ddl)
+
+
+def _backfill_review_client_names(conn) -> int:
+    """Rellena review.client_name de las reseñas creadas antes de guardarlo."""
+    pending = select(Review.client_id).where(Review.client_name.is_(None)).distinct()
+    clients = conn.execute(select(User.id, User.nombres, User.apellidos)
+                           .where(User.id.in_(pending))).all()
+    n = 0
+    for client in clients:
+        n += conn.execute(update(Review)
+                          .where(Review.client_id == client.id, Review.client_name.is_(None))
+                          .values(client_name=Review.display_name(client))).rowcount
+    # Clientes ya borrados
+    n += conn.execute(update(Review).where(Review.client_name.is_(None))
+                      .values(client_name=Review.display_name(None))).rowcount
+    return n
+
+
+def upgrade(app):
+    """Agrega las columnas e índices que falten y rellena sus datos. Idempotente."""
+    with app.app_context():
+        added = []
+        with db.engine.begin() as conn:
+            insp = inspect(conn)
+            for model, name in COLUMNS:
+                table = model.__table__
+                existing = {c["name"] for c in insp.get_columns(table.name)}
+                if name not in existing:
+                    _add_column(conn, table, table.c[name])
+                    added.append(f"{table.name}.{name}")
+            for table in db.metadata.sorted_tables:
+                for index in table.indexes:
+                    if index.name in INDEXES:
+                        index.create(conn, checkfirst=True)
+            quote = conn.dialect.identifier_preparer.quote
+            for name in DROPPED_INDEXES:
+                conn.exec_driver_sql(f"DROP INDEX IF EXISTS {quote(name)}")
+            filled = _backfill_review_client_names(conn)
+        if added:
+            app.logger.info("[schema] columnas agregadas: %s", ", ".join(added))
+        if filled:
+            app.logger.info("[schema] review.client_name rellenado en %d reseñas", filled)
@@ -0,0 +1,242 @@
+# backend/app/search.py
+"""
+Índice de búsqueda de abogados.
+
+- SQLite: tabla virtual FTS5 (tokenizer unicode61 sin diacríticos).
+- Postgres: tabla con tsvector ('spanish') + índice GIN.
+- Otros motores / FTS5 no disponible: ILIKE sobre User (sin índice).
+
+El texto se pliega (minúsculas, sin tildes) antes de indexar y de consultar,
+así "familia" encuentra "Fámilia" y "pénal" encuentra "Penal".
+"""
+import re
+import unicodedata
+
+from flask import current_app
+from sqlalchemy import text, Integer, Float
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+from . import cursors
+from .models import db, User, LawyerRating
+
+EXT_KEY = "lawyer_search"
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_COLUMNS = ("nombres", "apellidos", "especialidad", "about_me", "titles")
+
+SORTS = ("relevance", "rating", "price_asc", "price_desc")
+
+
+# ==========================
+#  Normalización
+# ==========================
+def fold(value) -> str:
+    """Minúsculas y sin diacríticos."""
+    if not value:
+        return ""
+    s = unicodedata.normalize("NFKD", str(value))
+    s = "".join(ch for ch in s if not unicodedata.combining(ch))
+    return s.lower()
+
+
+def tokenize(value):
+    return _TOKEN_RE.findall(fold(value))
+
+
+# ==========================
+#  Inicialización
+# ==========================
+def _backend():
+    return current_app.extensions.get(EXT_KEY)
+
+
+def init_app(app):
+    """Crea la estructura del índice (si no existe) y la rellena si está vacía."""
+    with app.app_context():
+        dialect = db.engine.dialect.name
+        backend = None
+        try:
+            if dialect == "sqlite":
+                db.session.execute(text(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS lawyer_search USING fts5("
+                    "nombres, apellidos, especialidad, about_me, titles, "
+                    "tokenize='unicode61 remove_diacritics 2')"
+                ))
+                backend = "fts5"
+            elif dialect == "postgresql":
+                db.session.execute(text(
+                    "CREATE TABLE IF NOT EXISTS lawyer_search ("
+                    "lawyer_id INTEGER PRIMARY KEY REFERENCES \"user\"(id) ON DELETE CASCADE, "
+                    "document tsvector NOT NULL)"
+                ))
+                db.session.execute(text(
+                    "CREATE INDEX IF NOT EXISTS ix_lawyer_search_document "
+                    "ON lawyer_search USING GIN (document)"
+                ))
+                backend = "tsvector"
+            db.session.commit()
+        except (OperationalError, ProgrammingError) as e:
+            db.session.rollback()
+            app.logger.warning("[search] índice full-text no disponible (%s); usando ILIKE", e)
+            backend = None
+
+        app.extensions[EXT_KEY] = backend
+        if backend:
+            _backfill_if_empty()
+
+
+def _backfill_if_empty():
+    indexed = db.session.execute(text("SELECT COUNT(*) FROM lawyer_search")).scalar() or 0
+    if indexed:
+        return
+    lawyers = User.query.filter(User.role == "abogado").all()
+    for u in lawyers:
+        index_lawyer(u)
+    db.session.commit()
+
+
+# ==========================
+#  Sincronización
+# ==========================
+def index_lawyer(user: User):
+    """Upsert del documento del abogado. No hace commit (va en la transacción del caller)."""
+    backend = _backend()
+    if not backend or user is None or user.id is None:
+        return
+    if user.role != "abogado":
+        remove_lawyer(user.id)
+        return
+    values = {c: fold(getattr(user, c, None)) for c in _COLUMNS}
+    if backend == "fts5":
+        db.session.execute(text("DELETE FROM lawyer_search WHERE rowid = :id"), {"id": user.id})
+        db.session.execute(text(
+            "INSERT INTO lawyer_search (rowid, nombres, apellidos, especialidad, about_me, titles) "
+            "VALUES (:id, :nombres, :apellidos, :especialidad, :about_me, :titles)"
+        ), {"id": user.id, **values})
+    elif backend == "tsvector":
+        db.session.execute(text(
+            "INSERT INTO lawyer_search (lawyer_id, document) VALUES (:id, "
+            "setweight(to_tsvector('spanish', :nombres || ' ' || :apellidos), 'A') || "
+            "setweight(to_tsvector('spanish', :especialidad), 'B') || "
+            "setweight(to_tsvector('spanish', :titles || ' ' || :about_me), 'C')) "
+            "ON CONFLICT (lawyer_id) DO UPDATE SET document = EXCLUDED.document"
+        ), {"id": user.id, **values})
+
+
+def remove_lawyer(user_id: int):
+    backend = _backend()
+    if backend == "fts5":
+        db.session.execute(text("DELETE FROM lawyer_search WHERE rowid = :id"), {"id": user_id})
+    elif backend == "tsvector":
+        db.session.execute(text("DELETE FROM lawyer_search WHERE lawyer_id = :id"), {"id": user_id})
+
+
+# ==========================
+#  Consulta
+# ==========================
+def _match_subquery(backend, q):
+    """Subconsulta (id, score) con los documentos que cumplen; score mayor = mejor."""
+    q_tokens = tokenize(q)
+    if backend == "fts5":
+        parts = [f'"{t}"*' for t in q_tokens]
+        sql = (
+            "SELECT rowid AS id, -bm25(lawyer_search, 5.0, 5.0, 3.0, 1.0, 1.0) AS score "
+            "FROM lawyer_search WHERE lawyer_search MATCH :match"
+        )
+        params = {"match": " AND ".join(parts)}
+    else:
+        tsq = " & ".join(f"{t}:*" for t in q_tokens)
+        sql = (
+            "SELECT lawyer_id AS id, ts_rank(document, to_tsquery('spanish', :match)) AS score "
+            "FROM lawyer_search WHERE document @@ to_tsquery('spanish', :match)"
+        )
+        params = {"match": tsq}
+    return text(sql).bindparams(**params).columns(id=Integer, score=Float).subquery("fts")
+
+
+def lawyer_ids(especialidad=None):
+    """Ids de abogados aprobados y activos, en el mismo orden que search_lawyers(sort='rating')."""
+    rating_avg = db.func.coalesce(LawyerRating.avg, 0.0)
+    query = db.session.query(User.id)
+    if especialidad:
+        from .specialties import filter_by_specialty
+        query = filter_by_specialty(query, especialidad)
+    query = (query.outerjoin(LawyerRating, LawyerRating.lawyer_id == User.id)
+             .filter(User.role == "abogado", User.is_approved.is_(True), User.is_active.is_(True))
+             .order_by(rating_avg.desc(), User.id.asc()))
+    return [i for (i,) in query.all()]
+
+
+def search_lawyers(q=None, especialidad=None, min_price=None, max_price=None,
+                   min_rating=None, sort=None, limit=None, cursor=None):
+    """
+    Devuelve (rows, next_cursor). Cada row es (User, score, rating_avg, rating_count).
+    Solo abogados aprobados y activos. Paginación keyset sobre (clave de orden, id).
+    """
+    backend = _backend()
+    rating_avg = db.func.coalesce(LawyerRating.avg, 0.0)
+    rating_count = db.func.coalesce(LawyerRating.count, 0)
+    has_text = bool(tokenize(q))
+
+    if backend and has_text:
+        fts = _match_subquery(backend, q)
+        score = fts.c.score
+        query = db.session.query(User, score, rating_avg, rating_count).join(fts, fts.c.id == User.id)
+    else:
+        score = db.literal(0.0)
+        query = db.session.query(User, score, rating_avg, rating_count)
+        for tok in tokenize(q):
+            like = f"%{tok}%"
+            query = query.filter(db.or_(
+                User.nombres.ilike(like), User.apellidos.ilike(like), User.especialidad.ilike(like),
+                User.about_me.ilike(like), User.titles.ilike(like),
+            ))
+
+    if especialidad:
+        # Filtro por taxonomía normalizada (lookup indexado por slug)
+        from .specialties import filter_by_specialty
+        query = filter_by_specialty(query, especialidad)
+
+    query = query.outerjoin(LawyerRating, LawyerRating.lawyer_id == User.id).filter(
+        User.role == "abogado",
+        User.is_approved.is_(True),
+        User.is_active.is_(True),
+    )
+    if min_price is not None:
+        query = query.filter(User.consultation_price >= min_price)
+    if max_price is not None:
+        query = query.filter(User.consultation_price <= max_price)
+    if min_rating is not None:
+        query = query.filter(rating_avg >= min_rating)
+
+    sort = sort if sort in SORTS else ("relevance" if has_text else "rating")
+    if sort == "relevance":
+        key, descending = score, True
+    elif sort == "rating":
+        key, descending = rating_avg, True
+    elif sort == "price_asc":
+        key, descending = db.func.coalesce(User.consultation_price, 0.0), False
+    else:
+        key, descending = db.func.coalesce(User.consultation_price, 0.0), True
+
+    if cursor:
+        c_key, c_id = cursors.decode_float(cursor)
+        beyond = key < c_key if descending else key > c_key
+        query = query.filter(db.or_(beyond, db.and_(key == c_key, User.id > c_id)))
+
+    query = query.order_by(key.desc() if descending else key.asc(), User.id.asc())
+
+    if not limit:
+        return query.all(), None
+    rows = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last_user, last_score, last_avg, _ = rows[-1]
+        if sort == "relevance":
+            last_key = last_score
+        elif sort == "rating":
+            last_key = last_avg
+        else:
+            last_key = last_user.consultation_price or 0.0
+        next_cursor = cursors.encode(float(last_key), last_user.id)
+    return rows, next_cursor
@@ -0,0 +1,85 @@
+# backend/app/specialties.py
+"""
+Taxonomía de especialidades.
+
+User.especialidad sigue guardando el texto libre que escribió el abogado
+("Familia, Penal"); aquí se normaliza a filas de Specialty + LawyerSpecialty
+para que listar y filtrar por especialidad sean búsquedas indexadas.
+"""
+import re
+
+from sqlalchemy.exc import IntegrityError
+
+from .models import db, User, Specialty, LawyerSpecialty
+from .search import fold
+
+# Lista fija (igual a la web) – fuente estable para clientes
+STATIC_SPECIALTIES = [
+    "Laboral", "Familia", "Migratorio", "Penal", "Civil", "Mercantil", "Administrativo",
+]
+
+_SPLIT_RE = re.compile(r'[,/;|]')
+_SLUG_RE = re.compile(r'[^a-z0-9]+')
+
+
+def slugify(name) -> str:
+    return _SLUG_RE.sub('-', fold(name)).strip('-')
+
+
+def split_specialties(raw):
+    """'Familia, Penal / Civil' -> ['Familia', 'Penal', 'Civil'] (sin duplicados)."""
+    out, seen = [], set()
+    for part in _SPLIT_RE.split(str(raw or '')):
+        name = part.strip()
+        slug = slugify(name)
+        if slug and slug not in seen:
+            seen.add(slug)
+            out.append(name)
+    return out
+
+
+def filter_by_specialty(query, especialidad):
+    """Restringe una consulta sobre User a los abogados de la especialidad (por slug)."""
+    return (query.join(LawyerSpecialty, LawyerSpecialty.lawyer_id == User.id)
+            .join(Specialty, Specialty.id == LawyerSpecialty.specialty_id)
+            .filter(Specialty.slug == slugify(especialidad)))
+
+
+def get_or_create(name: str) -> Specialty:
+    slug = slugify(name)
+    sp = Specialty.query.filter_by(slug=slug).first()
+    if sp:
+        return sp
+    try:
+        with db.session.begin_nested():
+            sp = Specialty(name=name.strip(), slug=slug)
+            db.session.add(sp)
+    except IntegrityError:
+        # Otro worker la creó en paralelo
+        sp = Specialty.query.filter_by(slug=slug).first()
+    return sp
+
+
+def sync_lawyer_specialties(user: User):
+    """Reemplaza las especialidades del abogado según user.especialidad. No hace commit."""
+    if user is None or user.id is None:
+        return
+    LawyerSpecialty.query.filter_by(lawyer_id=user.id).delete(synchronize_session=False)
+    if user.role != 'abogado':
+        return
+    for name in split_specialties(user.especialidad):
+        sp = get_or_create(name)
+        db.session.add(LawyerSpecialty(lawyer_id=user.id, specialty_id=sp.id))
+
+
+def init_app(app):
+    """Siembra la lista fija y rellena la asociación si está vacía."""
+    with app.app_context():
+        for name in STATIC_SPECIALTIES:
+            get_or_create(name)
+        db.session.commit()
+
+        if LawyerSpecialty.query.first() is None:
+            for u in User.query.filter(User.role == 'abogado', User.especialidad.isnot(None)).all():
+                sync_lawyer_specialties(u)
+            db.session.commit()
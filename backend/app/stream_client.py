@@ -0,0 +1,150 @@
+# backend/app/stream_client.py
+"""
+Cliente de Stream compartido por proceso.
+
+StreamChat abre su propia requests.Session; construir uno por request implica
+una conexión (y handshake TLS) nueva cada vez. Aquí se crea uno solo en
+create_app con un pool keep-alive y timeouts configurables. La sesión de
+requests/urllib3 es segura entre threads, y create_token no hace I/O.
+
+También cachea (por proceso) los tokens firmados, para que las reconexiones
+no vuelvan a firmar. Los upserts de usuarios van por app/stream_sync.py.
+
+Config:
+    STREAM_TIMEOUT              segundos por request a Stream (6.0)
+    STREAM_POOL_SIZE            conexiones keep-alive por host (10)
+    STREAM_TOKEN_TTL_SECONDS    expiración de los tokens de usuario (0 = sin exp, como antes).
+                                Si se activa, el cliente debe pedir otro token a
+                                /api/chat/token (tokenProvider del SDK) al expirar.
+    STREAM_TOKEN_REFRESH_SECONDS margen antes de la expiración en que se emite otro; sin
+                                exp, cada cuánto se vuelve a firmar (3600)
+    STREAM_FAKE                 usa FakeStreamClient en memoria (desarrollo / pruebas sin red)
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import jwt
+import requests
+from flask import current_app
+from stream_chat import StreamChat
+
+EXT_KEY = "stream_client"
+_CACHE_MAX_ENTRIES = 10000
+
+
+def _build(api_key, api_secret, timeout, pool_size):
+    client = StreamChat(api_key=api_key, api_secret=api_secret, timeout=timeout)
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=pool_size, pool_maxsize=pool_size, max_retries=1
+    )
+    client.session.mount("https://", adapter)
+    client.session.mount("http://", adapter)
+    return client
+
+
+class FakeStreamClient:
+    """
+    Stream en memoria con la misma interfaz que usamos de StreamChat.
+    Guarda los usuarios recibidos y cuenta las llamadas; `fail_next` simula caídas.
+    """
+
+    def __init__(self, api_key, api_secret):
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.users = {}
+        self.requests = 0
+        self.fail_next = 0
+        self._lock = threading.Lock()
+
+    def create_token(self, user_id, exp=None, iat=None, **claims):
+        payload = {**claims, "user_id": user_id}
+        if exp:
+            payload["exp"] = exp
+        if iat:
+            payload["iat"] = iat
+        return jwt.encode(payload, self.api_secret, algorithm="HS256")
+
+    def upsert_users(self, users):
+        with self._lock:
+            self.requests += 1
+            if self.fail_next:
+                self.fail_next -= 1
+                raise RuntimeError("FakeStreamClient: fallo simulado")
+            for u in users:
+                self.users[u["id"]] = {**self.users.get(u["id"], {}), **u}
+            return {"users": {u["id"]: u for u in users}}
+
+    def upsert_user(self, user):
+        return self.upsert_users([user])
+
+
+def init_app(app):
+    """Crea el cliente si hay credenciales (si no, get_client() devuelve None)."""
+    api_key = app.config.get("STREAM_API_KEY")
+    api_secret = app.config.get("STREAM_API_SECRET")
+    client = None
+    if app.config.get("STREAM_FAKE"):
+        client = FakeStreamClient(api_key or "fake-key", api_secret or "fake-secret")
+    elif api_key and api_secret:
+        client = _build(
+            api_key,
+            api_secret,
+            float(app.config.get("STREAM_TIMEOUT", 6.0)),
+            int(app.config.get("STREAM_POOL_SIZE", 10)),
+        )
+    app.extensions[EXT_KEY] = client
+
+
+def get_client():
+    """StreamChat compartido de la app actual, o None si faltan credenciales."""
+    return current_app.extensions.get(EXT_KEY)
+
+
+def api_key():
+    client = get_client()
+    return client.api_key if client is not None else current_app.config.get("STREAM_API_KEY")
+
+
+# ==========================
+#  Caché de tokens
+# ==========================
+_lock = threading.Lock()
+_tokens = OrderedDict()  # user_id -> (token, reemitir_en_monotonic)
+
+
+def remember(cache, key, value):
+    """Inserta en un OrderedDict acotado a _CACHE_MAX_ENTRIES (descarta el más viejo)."""
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > _CACHE_MAX_ENTRIES:
+        cache.popitem(last=False)
+
+
+def user_token(user_id) -> str:
+    """
+    Token firmado para `user_id`. Se reutiliza mientras le quede más de
+    STREAM_TOKEN_REFRESH_SECONDS de vida (o STREAM_TOKEN_REFRESH_SECONDS si no expira).
+    """
+    key = str(user_id)
+    now = time.monotonic()
+    with _lock:
+        hit = _tokens.get(key)
+        if hit and hit[1] > now:
+            return hit[0]
+
+    client = get_client()
+    if client is None:
+        raise RuntimeError("STREAM_API_KEY/STREAM_API_SECRET no configurados")
+    ttl = int(current_app.config.get("STREAM_TOKEN_TTL_SECONDS", 0))
+    margin = int(current_app.config.get("STREAM_TOKEN_REFRESH_SECONDS", 3600))
+    if ttl > 0:
+        token = client.create_token(key, exp=int(time.time()) + ttl)
+        reuse_for = max(0, ttl - margin)
+    else:
+        token = client.create_token(key)
+        reuse_for = margin
+    with _lock:
+        remember(_tokens, key, (token, now + reuse_for))
+    return token
+
@@ -0,0 +1,138 @@
+# backend/app/stream_sync.py
+"""
+Sincronización de perfiles de usuario hacia Stream, fuera del request.
+
+upsert_user() solo encola: los cambios del mismo usuario se fusionan (gana el
+último) y una tarea periódica los envía con upsert_users en lotes de hasta
+BATCH_SIZE. Si Stream falla, cada usuario se reintenta con backoff exponencial
+hasta STREAM_SYNC_MAX_ATTEMPTS; luego se descarta y se registra en el log.
+
+Se guarda la huella del último perfil enviado, así una reconexión con el mismo
+nombre/imagen no genera tráfico.
+
+Config:
+    STREAM_SYNC_INTERVAL_SECONDS  cada cuánto se vacía la cola (1; 0 = envío síncrono)
+    STREAM_SYNC_MAX_ATTEMPTS      intentos por usuario antes de descartarlo (8)
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+from . import stream_client
+from .background import EXT_KEY as BACKGROUND_KEY, start_periodic
+
+TASK_NAME = "stream-user-sync"
+BATCH_SIZE = 100  # máximo de Stream por llamada
+BACKOFF_BASE_SECONDS = 2
+BACKOFF_MAX_SECONDS = 300
+
+_lock = threading.Lock()
+_pending = OrderedDict()  # user_id -> payload (el último gana)
+_retry = {}               # user_id -> (intentos, no_antes_de_monotonic)
+_synced = OrderedDict()   # user_id -> huella del último payload enviado
+
+
+def _fingerprint(payload) -> str:
+    raw = json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha1(raw).hexdigest()
+
+
+def _worker_running() -> bool:
+    return TASK_NAME in current_app.extensions.get(BACKGROUND_KEY, {})
+
+
+def pending_count() -> int:
+    with _lock:
+        return len(_pending)
+
+
+def upsert_user(payload, ensure_exists=False) -> bool:
+    """
+    Encola el perfil si cambió desde el último envío. Devuelve True si quedó encolado.
+    - ensure_exists=True: si este proceso nunca lo envió, se envía en el mismo
+      request (el caller va a crear un canal con ese usuario). Si ya existe en
+      Stream, el cambio de perfil sigue yendo por la cola.
+    - Sin tarea periódica (BACKGROUND_TASKS=False o intervalo 0) se envía en el acto.
+    """
+    key = str(payload["id"])
+    fp = _fingerprint(payload)
+    with _lock:
+        known = key in _synced
+        if key not in _pending and _synced.get(key) == fp:
+            return False
+        _pending[key] = payload
+        _pending.move_to_end(key)
+        _retry.pop(key, None)
+    if (ensure_exists and not known) or not _worker_running():
+        flush(only=[key])
+    return True
+
+
+def _backoff(attempts) -> float:
+    return min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (attempts - 1))
+
+
+def flush(only=None) -> int:
+    """
+    Envía lo pendiente (o solo los ids de `only`) en lotes de BATCH_SIZE.
+    Con `only` los errores se propagan al caller; en la tarea periódica se reprograman.
+    Devuelve cuántos usuarios se enviaron.
+    """
+    client = stream_client.get_client()
+    if client is None:
+        if only:
+            raise RuntimeError("STREAM_API_KEY/STREAM_API_SECRET no configurados")
+        with _lock:
+            dropped = len(_pending)
+            _pending.clear()
+            _retry.clear()
+        if dropped:
+            current_app.logger.warning("[stream-sync] sin credenciales; %d perfiles descartados", dropped)
+        return 0
+
+    now = time.monotonic()
+    with _lock:
+        keys = [str(k) for k in only] if only else list(_pending)
+        due = [(k, _pending[k]) for k in keys
+               if k in _pending and (only or _retry.get(k, (0, 0))[1] <= now)]
+
+    sent = 0
+    max_attempts = int(current_app.config.get("STREAM_SYNC_MAX_ATTEMPTS", 8))
+    for i in range(0, len(due), BATCH_SIZE):
+        batch = due[i:i + BATCH_SIZE]
+        try:
+            client.upsert_users([p for _, p in batch])
+        except Exception as e:
+            with _lock:
+                for k, p in batch:
+                    if _pending.get(k) is not p:
+                        continue  # llegó un cambio más nuevo; ese se envía aparte
+                    attempts = _retry.get(k, (0, 0))[0] + 1
+                    if attempts >= max_attempts:
+                        _pending.pop(k, None)
+                        _retry.pop(k, None)
+                        current_app.logger.error("[stream-sync] usuario %s descartado tras %d intentos: %s",
+                                                 k, attempts, e)
+                    else:
+                        _retry[k] = (attempts, now + _backoff(attempts))
+            if only:
+                raise
+            current_app.logger.warning("[stream-sync] lote de %d falló: %s", len(batch), e)
+            continue
+
+        with _lock:
+            for k, p in batch:
+                if _pending.get(k) is p:
+                    _pending.pop(k, None)
+                    _retry.pop(k, None)
+                stream_client.remember(_synced, k, _fingerprint(p))
+        sent += len(batch)
+    return sent
+
+
+def init_app(app):
+    start_periodic(app, TASK_NAME, app.config.get("STREAM_SYNC_INTERVAL_SECONDS"), flush)
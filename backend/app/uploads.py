@@ -0,0 +1,150 @@
+# backend/app/uploads.py
+"""
+Archivos públicos subidos (avatares, galería, video) direccionados por contenido.
+
+- store() guarda el archivo como '<sha256>.<ext>': la URL cambia si cambia el
+  contenido, así que /uploads la sirve con 'immutable, max-age=31536000' y un
+  ETag fuerte igual al hash.
+- Dos subidas idénticas (del mismo u otro usuario) comparten archivo.
+- release() borra el archivo solo si ya nadie lo referencia (avatar, galería
+  o video); llamarlo después del commit que quita la referencia.
+- Reutilizar y liberar a la vez es seguro: store() guarda una copia hasta el
+  commit y repone el archivo si faltara; release() recuenta tras apartarlo.
+
+Los documentos KYC no pasan por aquí (privados, se borran al revisarlos).
+"""
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import uuid
+
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+
+from . import metrics
+from .models import db, User, LawyerGalleryImage, LawyerIntroVideo
+
+UPLOAD_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'uploads'))
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+LEGACY_CACHE_CONTROL = 'public, max-age=3600'
+
+_CHUNK = 1 << 20
+_PENDING_KEY = 'uploads_pending'  # session.info: [(copia temporal, destino)] hasta el commit
+_HASHED = re.compile(r'^([0-9a-f]{64})\.[a-z0-9]{1,8}$')
+
+
+def content_hash(filename):
+    """sha256 si el nombre es direccionado por contenido; None para nombres antiguos."""
+    m = _HASHED.match(os.path.basename(filename or ''))
+    return m.group(1) if m else None
+
+
+def store(file, ext: str) -> str:
+    """
+    Guarda un FileStorage como '<sha256>.<ext>' y devuelve el nombre (deduplicado).
+    Conserva una copia hasta el próximo commit de la sesión: si para entonces el
+    archivo ya no está (un release() concurrente lo borró), se repone.
+    """
+    ext = re.sub(r'[^a-z0-9]', '', (ext or '').lower())[:8] or 'bin'
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    digest = hashlib.sha256()
+    tmp = tempfile.NamedTemporaryFile(dir=UPLOAD_DIR, prefix='.upload-', delete=False)
+    try:
+        with tmp:
+            for chunk in iter(lambda: file.stream.read(_CHUNK), b''):
+                digest.update(chunk)
+                tmp.write(chunk)
+        filename = f"{digest.hexdigest()}.{ext}"
+        final = os.path.join(UPLOAD_DIR, filename)
+        if os.path.exists(final):
+            metrics.incr('uploads_stored_total', {'dedup': 'yes'})
+        else:
+            _put(tmp.name, final)  # atómico: nunca se sirve un archivo a medias
+            metrics.incr('uploads_stored_total', {'dedup': 'no'})
+        db.session.connection()  # abre la transacción: su commit / rollback resuelve la copia
+        db.session.info.setdefault(_PENDING_KEY, []).append((tmp.name, final))
+        return filename
+    except BaseException:
+        _discard(tmp.name)
+        raise
+
+
+def _put(src, final):
+    """Publica `src` en `final` sin consumirlo (hard link; copia si no se puede)."""
+    try:
+        os.link(src, final)
+    except FileExistsError:
+        pass
+    except OSError:
+        staging = f"{src}.copy"
+        shutil.copyfile(src, staging)
+        os.replace(staging, final)
+
+
+def _discard(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+@event.listens_for(Session, 'after_commit')
+def _restore_after_commit(session):
+    """La referencia ya es visible: repone los archivos que un release() borró entretanto."""
+    for tmp, final in session.info.pop(_PENDING_KEY, ()):
+        if not os.path.exists(final):
+            _put(tmp, final)
+            metrics.incr('uploads_restored_total')
+        _discard(tmp)
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def _discard_after_rollback(session, transaction):
+    if transaction.parent is None:
+        for tmp, _ in session.info.pop(_PENDING_KEY, ()):
+            _discard(tmp)
+
+
+def references(filename, conn=None) -> int:
+    """Cuántas filas apuntan al archivo (avatares, galería, video)."""
+    if not filename:
+        return 0
+    execute = conn.execute if conn is not None else db.session.execute
+    return sum(
+        execute(select(func.count()).select_from(model).where(column == filename)).scalar()
+        for model, column in (
+            (User, User.profile_picture_url),
+            (LawyerGalleryImage, LawyerGalleryImage.filename),
+            (LawyerIntroVideo, LawyerIntroVideo.filename),
+        )
+    )
+
+
+def release(filename) -> bool:
+    """
+    Borra el archivo si ya no tiene referencias. Devuelve True si lo borró.
+    Primero lo aparta y vuelve a contar en una conexión nueva: si un store()
+    concurrente lo reutilizó y ya confirmó, se devuelve a su lugar.
+    """
+    if not filename or filename.startswith(('http://', 'https://')):
+        return False
+    name = os.path.basename(filename)
+    if references(name):
+        return False
+    path = os.path.join(UPLOAD_DIR, name)
+    trash = os.path.join(UPLOAD_DIR, f".trash-{uuid.uuid4().hex}")
+    try:
+        os.replace(path, trash)
+    except OSError:
+        return False
+    with db.engine.connect() as conn:
+        reused = references(name, conn)
+    if reused:
+        if not os.path.exists(path):
+            os.replace(trash, path)
+        _discard(trash)
+        return False
+    _discard(trash)
+    return True